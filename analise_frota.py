@@ -0,0 +1,399 @@
+# analise_frota.py
+# ------------------------------------------------------------
+# Indicadores da frota calculados em memória (NumPy) a partir de um retrato
+# colunar do histórico, carregado UMA vez e depois só acrescido:
+# - status de cada coletor do cadastro (todos os valores de STATUS_BY_IDREG)
+# - conserto: tempo entre ENVIO e o RETORNO seguinte; consertos em aberto
+# - utilização: tempo EM OPERACAO por colaborador e da frota
+# - defeitos: mais frequentes e taxa por coletor (defeitos / movimentos)
+# Retrato:
+# - colunas: data (datetime64[ms]), coletor e colaborador (códigos int32 em
+#   listas de texto), IDRegistro (int8); defeitos: data, coletor, defeito
+# - atualizar() traz só as linhas com DataRegistro >= marca d'água
+#   (índice IX_LG_ControleColetores_Data), descontando as já lidas na marca
+# - salvo em analise_frota.npz; ao reabrir, carrega o arquivo, aplica o
+#   delta e confere COUNT_BIG com o banco (diferença => carga completa)
+# NumPy é opcional para o resto do aplicativo; sem ele, só este módulo falha.
+# ------------------------------------------------------------
+from __future__ import annotations
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # relatório indisponível; o resto do aplicativo segue
+    np = None
+
+import db as _db
+from diario_offline import _pasta_app
+from mov_validacoes import ID_REGISTRO, STATUS_BY_IDREG
+
+TAMANHO_BLOCO = 50_000
+TOP = 10
+
+_ENTREGA, _ENVIO, _RETORNO = ID_REGISTRO["ENTREGA"], ID_REGISTRO["ENVIO"], ID_REGISTRO["RETORNO"]
+_MS_POR_HORA = 3_600_000
+_EPOCA, _UM_MS = datetime(1970, 1, 1), timedelta(milliseconds=1)
+
+_SQL_MOVIMENTOS = """
+    SELECT DataRegistro, IDColetorNorm, IDRegistro, IDColaborador
+    FROM LG_ControleColetores WITH (NOLOCK)
+    WHERE IDColetorNorm IS NOT NULL
+"""
+
+_SQL_MOVIMENTOS_DELTA = _SQL_MOVIMENTOS + """
+      AND DataRegistro >= ?
+    ORDER BY DataRegistro, IDColetorNorm, IDRegistro
+"""
+
+_SQL_DEFEITOS = """
+    SELECT DataRegistro, IDColetorNorm, IDDefeito
+    FROM LG_ControleColetoresDefeito WITH (NOLOCK)
+    WHERE IDColetorNorm IS NOT NULL
+"""
+
+_SQL_DEFEITOS_DELTA = _SQL_DEFEITOS + """
+      AND DataRegistro >= ?
+    ORDER BY DataRegistro, IDColetorNorm, IDDefeito
+"""
+
+_SQL_CONTAGEM = """
+    SELECT
+      (SELECT COUNT_BIG(*) FROM LG_ControleColetores WITH (NOLOCK) WHERE IDColetorNorm IS NOT NULL),
+      (SELECT COUNT_BIG(*) FROM LG_ControleColetoresDefeito WITH (NOLOCK) WHERE IDColetorNorm IS NOT NULL)
+"""
+
+_SQL_CADASTRO = """
+    SELECT DISTINCT IDColetorNorm FROM COLETORES_CADASTRO WITH (NOLOCK)
+    WHERE IDColetorNorm IS NOT NULL
+"""
+
+_SQL_DESCRICAO_DEFEITOS = "SELECT IdDefeito, DescricaoDefeito FROM LG_ColetoresDefeito WITH (NOLOCK)"
+
+
+def _chave_defeito(id_defeito) -> str:
+    """'07', 7 e ' 7' são o mesmo defeito (histórico grava com zero à esquerda)."""
+    return str(id_defeito).strip().lstrip("0") or "0"
+
+
+def caminho_padrao() -> str:
+    return os.getenv("COLETORES_ANALISE", os.path.join(_pasta_app(), "analise_frota.npz"))
+
+
+def _exigir_numpy() -> None:
+    if np is None:
+        raise RuntimeError("Relatório da frota requer NumPy (pip install numpy).")
+
+
+class _Codigos:
+    """Texto -> código int32 (posição na lista); None -> -1."""
+
+    def __init__(self, valores: Optional[List[str]] = None):
+        self.valores: List[str] = list(valores or [])
+        self._indice: Dict[Optional[str], int] = {v: i for i, v in enumerate(self.valores)}
+        self._indice[None] = self._indice[""] = -1
+
+    def codigo(self, valor: Optional[str]) -> int:
+        c = self._indice.get(valor)   # caminho quente: valor bruto já visto
+        return self._novo(valor) if c is None else c
+
+    def _novo(self, valor: str) -> int:
+        limpo = valor.strip()
+        c = self._indice.get(limpo)
+        if c is None:
+            c = self._indice[limpo] = len(self.valores)
+            self.valores.append(limpo)
+        self._indice[valor] = c
+        return c
+
+
+def _datas(linhas) -> "np.ndarray":
+    # aritmética de datetime é ~4x mais rápida que np.array(..., "datetime64[ms]")
+    return np.fromiter(((r[0] - _EPOCA) // _UM_MS for r in linhas), np.int64, len(linhas)).view("datetime64[ms]")
+
+
+class _Colunas:
+    """Colunas de uma tabela do retrato + marca d'água (maior data, linhas nela)."""
+
+    def __init__(self, nomes: Tuple[str, ...], tipos: Tuple[str, ...]):
+        self.nomes, self.tipos = nomes, tipos
+        self.arrays = {n: np.empty(0, dtype=t) for n, t in zip(nomes, tipos)}
+        self.marca = None          # numpy.datetime64 ou None
+        self.na_marca = 0
+
+    def __len__(self) -> int:
+        return len(self.arrays["data"])
+
+    def acrescentar(self, blocos: Dict[str, list]) -> int:
+        if not blocos["data"]:
+            return 0
+        novos = {n: np.concatenate(blocos[n]).astype(t, copy=False) for n, t in zip(self.nomes, self.tipos)}
+        for n in self.nomes:
+            self.arrays[n] = np.concatenate([self.arrays[n], novos[n]])
+        data = self.arrays["data"]
+        self.marca = data.max()
+        self.na_marca = int(np.count_nonzero(data == self.marca))
+        return len(novos["data"])
+
+
+class RetratoHistorico:
+    def __init__(self, caminho: Optional[str] = None):
+        _exigir_numpy()
+        self.caminho = caminho or caminho_padrao()
+        self._lock = threading.Lock()
+        self.cadastro: List[str] = []
+        self.descricao_defeitos: Dict[str, str] = {}
+        self.stats = {"cargas": 0, "atualizacoes": 0, "linhas_delta": 0, "do_arquivo": 0, "segundos_carga": 0.0}
+        self._zerar()
+
+    def _zerar(self) -> None:
+        self.coletores = _Codigos()
+        self.colaboradores = _Codigos()
+        self.defeitos = _Codigos()
+        self.mov = _Colunas(("data", "coletor", "idreg", "colab"), ("datetime64[ms]", "int32", "int8", "int32"))
+        self.dfs = _Colunas(("data", "coletor", "defeito"), ("datetime64[ms]", "int32", "int32"))
+        self.carregado = False
+
+    # --- leitura em blocos ---
+    def _ler_movimentos(self, cur, pular: int) -> Dict[str, list]:
+        blocos = {"data": [], "coletor": [], "idreg": [], "colab": []}
+        cod_col, cod_colab = self.coletores.codigo, self.colaboradores.codigo
+        while True:
+            linhas = cur.fetchmany(TAMANHO_BLOCO)
+            if not linhas:
+                return blocos
+            if pular:
+                descartar = min(pular, len(linhas))
+                linhas, pular = linhas[descartar:], pular - descartar
+            blocos["data"].append(_datas(linhas))
+            blocos["coletor"].append(np.fromiter((cod_col(r[1]) for r in linhas), np.int32, len(linhas)))
+            blocos["idreg"].append(np.fromiter((r[2] for r in linhas), np.int8, len(linhas)))
+            blocos["colab"].append(np.fromiter((cod_colab(r[3]) for r in linhas), np.int32, len(linhas)))
+
+    def _ler_defeitos(self, cur, pular: int) -> Dict[str, list]:
+        blocos = {"data": [], "coletor": [], "defeito": []}
+        cod_col, cod_def = self.coletores.codigo, self.defeitos.codigo
+        while True:
+            linhas = cur.fetchmany(TAMANHO_BLOCO)
+            if not linhas:
+                return blocos
+            if pular:
+                descartar = min(pular, len(linhas))
+                linhas, pular = linhas[descartar:], pular - descartar
+            blocos["data"].append(_datas(linhas))
+            blocos["coletor"].append(np.fromiter((cod_col(r[1]) for r in linhas), np.int32, len(linhas)))
+            blocos["defeito"].append(np.fromiter((cod_def(r[2]) for r in linhas), np.int32, len(linhas)))
+
+    def _ler_auxiliares(self, cur) -> None:
+        cur.execute(_SQL_CADASTRO)
+        self.cadastro = [r[0] for r in cur.fetchall()]
+        cur.execute(_SQL_DESCRICAO_DEFEITOS)
+        self.descricao_defeitos = {_chave_defeito(i): d for i, d in cur.fetchall()}
+
+    # --- API ---
+    @_db.operacao("analise_carga")
+    def carregar(self) -> "RetratoHistorico":
+        """Carga completa do histórico (primeira vez ou retrato divergente)."""
+        t0 = time.perf_counter()
+        with self._lock:
+            self._zerar()
+            with _db.conectar(leitura=True) as cn, cn.cursor() as cur:
+                cur.execute(_SQL_MOVIMENTOS)
+                self.mov.acrescentar(self._ler_movimentos(cur, 0))
+                cur.execute(_SQL_DEFEITOS)
+                self.dfs.acrescentar(self._ler_defeitos(cur, 0))
+                self._ler_auxiliares(cur)
+            self.carregado = True
+            self.stats["cargas"] += 1
+            self.stats["segundos_carga"] = round(time.perf_counter() - t0, 2)
+            self._salvar()
+        return self
+
+    @_db.operacao("analise_delta")
+    def atualizar(self) -> "RetratoHistorico":
+        """Acrescenta o que entrou desde a marca d'água (carrega tudo na primeira vez)."""
+        if not self.carregado and not self._abrir_arquivo():
+            return self.carregar()
+        with self._lock:
+            with _db.conectar(leitura=True) as cn, cn.cursor() as cur:
+                novas = 0
+                for colunas, sql, sql_delta, ler in ((self.mov, _SQL_MOVIMENTOS, _SQL_MOVIMENTOS_DELTA, self._ler_movimentos),
+                                                     (self.dfs, _SQL_DEFEITOS, _SQL_DEFEITOS_DELTA, self._ler_defeitos)):
+                    if colunas.marca is None:
+                        cur.execute(sql)
+                        novas += colunas.acrescentar(ler(cur, 0))
+                    else:
+                        cur.execute(sql_delta, (colunas.marca.astype(datetime),))
+                        novas += colunas.acrescentar(ler(cur, colunas.na_marca))
+                self._ler_auxiliares(cur)
+                conferir = self.stats["do_arquivo"] and not self.stats["atualizacoes"]
+                if conferir:
+                    cur.execute(_SQL_CONTAGEM)
+                    total_mov, total_dfs = cur.fetchone()
+            self.stats["atualizacoes"] += 1
+            self.stats["linhas_delta"] += novas
+        if conferir and (total_mov, total_dfs) != (len(self.mov), len(self.dfs)):
+            return self.carregar()  # histórico regravado/apagado desde o arquivo
+        if novas:
+            with self._lock:
+                self._salvar()
+        return self
+
+    # --- arquivo ---
+    def _salvar(self) -> None:
+        try:
+            tmp = self.caminho + ".tmp.npz"
+            np.savez(
+                tmp,
+                **{f"mov_{n}": a for n, a in self.mov.arrays.items()},
+                **{f"dfs_{n}": a for n, a in self.dfs.arrays.items()},
+                coletores=np.array(self.coletores.valores, dtype=str),
+                colaboradores=np.array(self.colaboradores.valores, dtype=str),
+                defeitos=np.array(self.defeitos.valores, dtype=str),
+            )
+            os.replace(tmp, self.caminho)
+        except OSError as e:
+            print(f"Retrato da frota não salvo em {self.caminho}: {e}")
+
+    def _abrir_arquivo(self) -> bool:
+        try:
+            arq = np.load(self.caminho)
+        except (OSError, ValueError):
+            return False
+        with arq, self._lock:
+            self._zerar()
+            self.coletores = _Codigos(arq["coletores"].tolist())
+            self.colaboradores = _Codigos(arq["colaboradores"].tolist())
+            self.defeitos = _Codigos(arq["defeitos"].tolist())
+            for prefixo, colunas in (("mov", self.mov), ("dfs", self.dfs)):
+                colunas.acrescentar({n: [arq[f"{prefixo}_{n}"]] for n in colunas.nomes})
+            self.carregado = True
+            self.stats["do_arquivo"] += 1
+        return True
+
+    # --- indicadores ---
+    def relatorio(self, agora: Optional[datetime] = None) -> Dict:
+        """Indicadores da frota (tipos simples: vai direto para JSON/tela)."""
+        with self._lock:
+            mov = dict(self.mov.arrays)
+            dfs = dict(self.dfs.arrays)
+            coletores = list(self.coletores.valores)
+            colaboradores = list(self.colaboradores.valores)
+            defeitos = list(self.defeitos.valores)
+            cadastro = list(self.cadastro)
+            descricoes = dict(self.descricao_defeitos)
+        agora64 = np.datetime64(agora or datetime.now(), "ms")
+        n_col = len(coletores)
+
+        # ordena por coletor e data: intervalos = próximo evento do mesmo coletor
+        ordem = np.lexsort((mov["idreg"], mov["data"], mov["coletor"]))
+        col, data = mov["coletor"][ordem], mov["data"][ordem]
+        idreg, colab = mov["idreg"][ordem], mov["colab"][ordem]
+        ultimo = np.ones(len(col), dtype=bool)
+        ultimo[:-1] = col[1:] != col[:-1]
+        proxima = np.empty_like(data)
+        proxima[:-1] = data[1:]
+        proxima[ultimo] = agora64                         # último evento: até agora
+        duracao_ms = (proxima - data).astype(np.int64)
+        prox_idreg = np.full(len(col), -1, dtype=np.int8)
+        prox_idreg[:-1] = idreg[1:]
+        prox_idreg[ultimo] = -1
+
+        # status: último evento de cada coletor do cadastro (sem evento = DISPONIVEL)
+        ultimo_idreg = np.full(n_col, -1, dtype=np.int8)
+        ultimo_idreg[col[ultimo]] = idreg[ultimo]
+        status = {st: 0 for st in dict.fromkeys(STATUS_BY_IDREG.values())}
+        indice = {c: i for i, c in enumerate(coletores)}
+        for norm in cadastro:
+            i = indice.get(norm)
+            st = STATUS_BY_IDREG.get(int(ultimo_idreg[i]) if i is not None and ultimo_idreg[i] >= 0 else None)
+            status[st] += 1
+
+        # conserto: ENVIO seguido de RETORNO; ENVIO como último evento = em aberto
+        envio = idreg == _ENVIO
+        concluidos = duracao_ms[envio & (prox_idreg == _RETORNO)] / _MS_POR_HORA
+        abertos = duracao_ms[envio & ultimo] / _MS_POR_HORA
+
+        # utilização: ENTREGA até o próximo evento do coletor
+        entrega = idreg == _ENTREGA
+        com_colab = entrega & (colab >= 0)
+        horas_colab = np.bincount(colab[com_colab], weights=duracao_ms[com_colab],
+                                  minlength=len(colaboradores)) / _MS_POR_HORA
+        entregas_colab = np.bincount(colab[com_colab], minlength=len(colaboradores))
+        primeiro = np.ones(len(col), dtype=bool)
+        primeiro[1:] = ultimo[:-1]
+        observado_ms = (agora64 - data[primeiro]).astype(np.int64).sum()
+        em_operacao_ms = duracao_ms[entrega].sum()
+        top_colab = np.argsort(horas_colab)[::-1][:TOP]
+
+        # defeitos
+        por_defeito = np.bincount(dfs["defeito"][dfs["defeito"] >= 0], minlength=len(defeitos))
+        top_def = np.argsort(por_defeito)[::-1][:TOP]
+        defeitos_col = np.bincount(dfs["coletor"], minlength=n_col)
+        movs_col = np.bincount(col, minlength=n_col)
+        top_def_col = np.argsort(defeitos_col)[::-1][:TOP]
+
+        def _h(a, fn) -> Optional[float]:
+            return round(float(fn(a)), 1) if len(a) else None
+
+        return {
+            "gerado_em": agora64.astype(datetime).isoformat(sep=" ", timespec="seconds"),
+            "movimentos": int(len(col)),
+            "coletores": len(cadastro),
+            "status": status,
+            "conserto": {
+                "concluidos": int(len(concluidos)),
+                "media_h": _h(concluidos, np.mean),
+                "mediana_h": _h(concluidos, np.median),
+                "p90_h": _h(concluidos, lambda a: np.percentile(a, 90)),
+                "em_aberto": int(len(abertos)),
+                "em_aberto_media_h": _h(abertos, np.mean),
+            },
+            "utilizacao": {
+                "frota_pct": round(100.0 * em_operacao_ms / observado_ms, 1) if observado_ms else None,
+                "colaboradores": [
+                    {"colaborador": colaboradores[i], "horas": round(float(horas_colab[i]), 1),
+                     "entregas": int(entregas_colab[i])}
+                    for i in top_colab if horas_colab[i] > 0
+                ],
+            },
+            "defeitos": {
+                "total": int(len(dfs["data"])),
+                "mais_frequentes": [
+                    {"defeito": defeitos[i], "descricao": descricoes.get(_chave_defeito(defeitos[i]), ""),
+                     "quantidade": int(por_defeito[i])}
+                    for i in top_def if por_defeito[i] > 0
+                ],
+                "coletores": [
+                    {"coletor": coletores[i], "defeitos": int(defeitos_col[i]), "movimentos": int(movs_col[i]),
+                     "taxa_pct": round(100.0 * defeitos_col[i] / movs_col[i], 1) if movs_col[i] else None}
+                    for i in top_def_col if defeitos_col[i] > 0
+                ],
+            },
+        }
+
+
+_retrato_lock = threading.Lock()
+_retrato: Optional[RetratoHistorico] = None
+
+def obter_retrato() -> RetratoHistorico:
+    global _retrato
+    if _retrato is None:
+        with _retrato_lock:
+            if _retrato is None:
+                _retrato = RetratoHistorico()
+    return _retrato
+
+
+def relatorio_frota(atualizar: bool = False) -> Dict:
+    """
+    Indicadores do retrato compartilhado. Sem `atualizar`, só lê a memória
+    (vai ao banco apenas na primeira vez); com `atualizar`, aplica o delta antes.
+    """
+    retrato = obter_retrato()
+    if atualizar or not retrato.carregado:
+        retrato.atualizar()
+    return retrato.relatorio()
@@ -0,0 +1,252 @@
+# auditoria_historico.py
+# ------------------------------------------------------------
+# Reprodução do histórico LG_ControleColetores com as regras de
+# regras_status.py, apontando toda transição que a validação de hoje
+# recusaria (linhas antigas, anteriores a alguma regra, ou gravadas sem
+# validação).
+# - fase 1: UMA leitura em fluxo, particionada por coletor (IDColetorNorm
+#   DESC, DataRegistro, IDRegistro = IX_LG_ControleColetores_Norm lido de
+#   trás para frente, sem sort): o status de origem de cada evento é o do
+#   evento anterior do mesmo coletor
+# - fase 2 (NumPy): a regra que cruza coletores (colaborador que já está
+#   com outro coletor EM OPERACAO) sai dos intervalos ENTREGA -> próximo
+#   evento do coletor, ordenados por colaborador; os casos encontrados
+#   passam pelo mesmo avaliar() da validação ao vivo
+# - o histórico é o que aconteceu: evento recusado também muda o estado
+#
+# Uso:
+#   python auditoria_historico.py --saida invalidas.csv
+# ------------------------------------------------------------
+from __future__ import annotations
+import argparse
+import csv
+import time
+from array import array
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # só a auditoria depende dele
+    np = None
+
+import db as _db
+import regras_status as _regras
+from mov_validacoes import ACAO_BY_IDREG, ID_REGISTRO, STATUS_BY_IDREG
+
+TAMANHO_BLOCO = 50_000
+ACAO_DESCONHECIDA = "acao_desconhecida"
+
+_ENTREGA = ID_REGISTRO["ENTREGA"]
+_EPOCA, _UM_MS = datetime(1970, 1, 1), timedelta(milliseconds=1)
+_ABERTO = 2**62          # fim de intervalo ainda em operação
+
+_SQL_HISTORICO = """
+    SELECT IDColetorNorm, DataRegistro, IDRegistro, IDColetor, IDColaborador
+    FROM LG_ControleColetores WITH (NOLOCK)
+    WHERE IDColetorNorm IS NOT NULL
+    ORDER BY IDColetorNorm DESC, DataRegistro, IDRegistro
+"""
+
+
+@dataclass
+class Invalida:
+    data: datetime
+    coletor: str
+    acao: str
+    colaborador: Optional[str]
+    status_origem: str
+    regra: str
+    mensagem: str
+
+
+@dataclass
+class ResultadoAuditoria:
+    eventos: int = 0
+    coletores: int = 0
+    por_regra: Counter = field(default_factory=Counter)
+    segundos: float = 0.0
+
+    @property
+    def invalidas(self) -> int:
+        return sum(self.por_regra.values())
+
+    @property
+    def eventos_por_s(self) -> float:
+        return self.eventos / self.segundos if self.segundos else 0.0
+
+
+class _Entregas:
+    """Intervalos ENTREGA -> próximo evento do coletor, em arrays compactos."""
+
+    def __init__(self):
+        self.colab = array("i")
+        self.inicio = array("q")
+        self.fim = array("q")
+        self.coletor = array("i")
+        self.status = array("b")      # índice em regras_status.STATUS
+        self.candidata = array("b")   # passou na fase 1: ainda pode ser recusada na 2
+        self.colabs: Dict[str, int] = {}
+        self.nomes_colab: List[str] = []
+
+    def codigo_colab(self, colab: str) -> int:
+        c = self.colabs.get(colab)
+        if c is None:
+            c = self.colabs[colab] = len(self.nomes_colab)
+            self.nomes_colab.append(colab)
+        return c
+
+
+@_db.operacao("auditoria_historico")
+def auditar(
+    ao_invalida: Optional[Callable[[Invalida], None]] = None,
+    ao_progredir: Optional[Callable[[int, float], None]] = None,
+    tamanho_bloco: int = TAMANHO_BLOCO,
+) -> ResultadoAuditoria:
+    """
+    Reproduz todo o histórico. `ao_invalida(Invalida)` recebe cada transição
+    recusada (fase 1 em ordem de coletor/data; fase 2 no fim);
+    `ao_progredir(eventos, segundos)` é chamado a cada bloco lido.
+    """
+    if np is None:
+        raise RuntimeError("Auditoria do histórico requer NumPy (pip install numpy).")
+    res = ResultadoAuditoria()
+    ent = _Entregas()
+    coletores: List[str] = []          # IDColetor (texto) por código de coletor
+    indice_status = {st: i for i, st in enumerate(_regras.STATUS)}
+    regra_violada = _regras.regra_violada
+    t0 = time.perf_counter()
+
+    def recusar(data, coletor, acao, colab, status, nome, mensagem):
+        res.por_regra[nome] += 1
+        if ao_invalida is not None:
+            ao_invalida(Invalida(data, coletor, acao, colab, status, nome, mensagem))
+
+    atual = None
+    status, ultimo_colab, aberta = "DISPONIVEL", None, -1
+    with _db.conectar(leitura=True) as cn, cn.cursor() as cur:
+        cur.execute(_SQL_HISTORICO)
+        while True:
+            bloco = cur.fetchmany(tamanho_bloco)
+            if not bloco:
+                break
+            for norm, data, idreg, id_coletor, colab in bloco:
+                if norm != atual:
+                    atual = norm
+                    coletores.append(id_coletor)
+                    status, ultimo_colab, aberta = "DISPONIVEL", None, -1
+                elif aberta >= 0:
+                    ent.fim[aberta] = (data - _EPOCA) // _UM_MS   # o coletor saiu de operação aqui
+                    aberta = -1
+                colab = (colab or "").strip() or None
+                acao = ACAO_BY_IDREG.get(idreg)
+                if acao is None:
+                    recusar(data, id_coletor, str(idreg), colab, status, ACAO_DESCONHECIDA,
+                            f"IDRegistro {idreg} sem ação correspondente.")
+                else:
+                    regra = regra_violada(acao, status, colab, ultimo_colab, None)
+                    if regra is not None:
+                        _, msg = _regras.avaliar(acao, id_coletor, colab, status, ultimo_colab, None)
+                        recusar(data, id_coletor, acao, colab, status, regra.nome, msg)
+                    if idreg == _ENTREGA and colab:
+                        aberta = len(ent.inicio)
+                        ent.colab.append(ent.codigo_colab(colab))
+                        ent.inicio.append((data - _EPOCA) // _UM_MS)
+                        ent.fim.append(_ABERTO)
+                        ent.coletor.append(len(coletores) - 1)
+                        ent.status.append(indice_status[status])
+                        ent.candidata.append(regra is None)
+                status = STATUS_BY_IDREG.get(idreg, "DISPONIVEL")
+                ultimo_colab = colab
+            res.eventos += len(bloco)
+            if ao_progredir:
+                ao_progredir(res.eventos, time.perf_counter() - t0)
+
+    res.coletores = len(coletores)
+    _cruzar_colaboradores(ent, coletores, recusar)
+    res.segundos = time.perf_counter() - t0
+    return res
+
+
+def _cruzar_colaboradores(ent: _Entregas, coletores: List[str], recusar) -> None:
+    """
+    Fase 2: ENTREGA de um colaborador enquanto outro intervalo dele ainda
+    está aberto (início < fim de algum intervalo anterior do mesmo colaborador).
+    """
+    n = len(ent.inicio)
+    if n < 2:
+        return
+    colab = np.frombuffer(ent.colab, dtype=np.int32)
+    inicio = np.frombuffer(ent.inicio, dtype=np.int64)
+    fim = np.frombuffer(ent.fim, dtype=np.int64)
+    ordem = np.lexsort((inicio, colab))
+    c, ini, f = colab[ordem], inicio[ordem], fim[ordem]
+
+    # maior fim acumulado dentro de cada colaborador: chave = colab | posto do fim
+    valores_fim, posto = np.unique(f, return_inverse=True)
+    chave = (c.astype(np.int64) << 32) | posto.astype(np.int64)
+    maior = np.maximum.accumulate(chave)
+    pos = np.maximum.accumulate(np.where(chave == maior, np.arange(n), 0))  # intervalo dono do maior fim
+    mesmo = np.zeros(n, dtype=bool)
+    mesmo[1:] = c[1:] == c[:-1]
+    fim_anterior = np.zeros(n, dtype=np.int64)
+    fim_anterior[1:] = valores_fim[maior[:-1] & 0xFFFFFFFF]
+    candidata = np.frombuffer(ent.candidata, dtype=np.int8)[ordem].astype(bool)
+    conflito = np.flatnonzero(mesmo & candidata & (ini < fim_anterior))
+
+    coletor = np.frombuffer(ent.coletor, dtype=np.int32)[ordem]
+    status = np.frombuffer(ent.status, dtype=np.int8)[ordem]
+    for i in conflito:
+        resp = ent.nomes_colab[c[i]]
+        outro = coletores[coletor[pos[i - 1]]]
+        st = _regras.STATUS[status[i]]
+        regra = _regras.regra_violada("ENTREGA", st, resp, None, outro)
+        if regra is None:
+            continue
+        _, msg = _regras.avaliar("ENTREGA", coletores[coletor[i]], resp, st, None, outro)
+        recusar(_EPOCA + timedelta(milliseconds=int(ini[i])), coletores[coletor[i]], "ENTREGA",
+                resp, st, regra.nome, msg)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Reproduz o histórico e aponta transições inválidas.")
+    parser.add_argument("--saida", help="CSV com todas as transições inválidas")
+    parser.add_argument("--exemplos", type=int, default=5, help="exemplos por regra no resumo")
+    args = parser.parse_args(argv)
+
+    exemplos: Dict[str, List[Invalida]] = {}
+    arquivo = open(args.saida, "w", encoding="utf-8-sig", newline="") if args.saida else None
+    escritor = csv.writer(arquivo) if arquivo else None
+    if escritor:
+        escritor.writerow(["DataRegistro", "IDColetor", "Acao", "IDColaborador", "StatusOrigem", "Regra", "Mensagem"])
+
+    def ao_invalida(inv: Invalida) -> None:
+        lista = exemplos.setdefault(inv.regra, [])
+        if len(lista) < args.exemplos:
+            lista.append(inv)
+        if escritor:
+            escritor.writerow([inv.data, inv.coletor, inv.acao, inv.colaborador, inv.status_origem,
+                               inv.regra, inv.mensagem])
+
+    def progresso(eventos: int, segundos: float) -> None:
+        print(f"\r{eventos:>12,} eventos  {eventos / segundos if segundos else 0:>10,.0f} eventos/s",
+              end="", flush=True)
+
+    try:
+        r = auditar(ao_invalida, progresso)
+    finally:
+        if arquivo:
+            arquivo.close()
+    print(f"\n{r.eventos:,} eventos de {r.coletores:,} coletores em {r.segundos:.1f}s "
+          f"({r.eventos_por_s:,.0f} eventos/s); {r.invalidas:,} transições inválidas")
+    for regra, n in r.por_regra.most_common():
+        print(f"  {regra:<32} {n:>10,}")
+        for inv in exemplos.get(regra, []):
+            print(f"      {inv.data:%d/%m/%Y %H:%M:%S}  {inv.coletor:<10} {inv.mensagem}")
+    _db.fechar_pool()
+
+
+if __name__ == "__main__":
+    main()
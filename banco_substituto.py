@@ -0,0 +1,454 @@
+# banco_substituto.py
+# ------------------------------------------------------------
+# Banco substituto local (SQLite) com interface no estilo pyodbc, para
+# benchmarks e testes sem rede. Ativado em db.py com DB_BACKEND=sqlite.
+# - traduz o subconjunto de T-SQL usado por db.py / mov_validacoes.py:
+#   dicas WITH (NOLOCK/UPDLOCK/...), SELECT TOP n, COUNT_BIG, nomes
+#   [DB].[dbo].[Tabela], CONVERT(VARCHAR, x), TRY_CONVERT(BIGINT, x),
+#   GETDATE(), LEN, BINARY_CHECKSUM/CHECKSUM_AGG, MIN_ACTIVE_ROWVERSION()
+#   (próximo valor do contador _rowversion: com um escritor por vez, toda
+#   transação aberta grava RV a partir dele)
+# - lotes com vários comandos separados por ';' (resultados via nextset);
+#   um SELECT sozinho é lido sob demanda (fetchmany não carrega tudo)
+# - transação implícita a partir do primeiro comando de escrita; comandos
+#   com UPDLOCK/XLOCK abrem BEGIN IMMEDIATE (trava de escrita do arquivo)
+# - exceções com SQLSTATE em args[0], como no pyodbc
+# Não cobre DDL de SQL Server (migracoes.py): o esquema vem de criar_esquema().
+# ------------------------------------------------------------
+from __future__ import annotations
+import re
+import sqlite3
+import threading
+import zlib
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+
+class Error(Exception):
+    pass
+
+class OperationalError(Error):
+    pass
+
+class IntegrityError(Error):
+    pass
+
+class ProgrammingError(Error):
+    pass
+
+
+def _converter_erro(ex: sqlite3.Error) -> Error:
+    msg = str(ex)
+    if isinstance(ex, sqlite3.IntegrityError):
+        return IntegrityError("23000", msg)
+    if isinstance(ex, sqlite3.OperationalError) and ("locked" in msg or "busy" in msg):
+        # equivalente a bloqueio/deadlock no SQL Server: pode repetir
+        return OperationalError("40001", msg)
+    if isinstance(ex, sqlite3.OperationalError) and "unable to open" in msg:
+        return OperationalError("08001", msg)
+    return ProgrammingError("42000", msg)
+
+
+# ---------------------------
+# Datas: mesmo formato textual nos dois sentidos
+# ---------------------------
+
+def _fmt_data(dt: datetime) -> str:
+    return dt.isoformat(sep=" ", timespec="milliseconds")
+
+sqlite3.register_adapter(datetime, _fmt_data)
+sqlite3.register_converter("DATETIME", lambda b: datetime.fromisoformat(b.decode()))
+
+
+# ---------------------------
+# Funções T-SQL
+# ---------------------------
+
+def _getdate() -> str:
+    return _fmt_data(datetime.now())
+
+def _try_bigint(v):
+    try:
+        s = str(v).strip()
+        if s.lstrip("+-").isdigit():
+            n = int(s)
+            if -2**63 <= n < 2**63:
+                return n
+    except Exception:
+        pass
+    return None
+
+def _binary_checksum(*args) -> int:
+    return zlib.crc32(repr(args).encode()) - 2**31
+
+class _ChecksumAgg:
+    def __init__(self):
+        self.v = 0
+    def step(self, x):
+        if x is not None:
+            self.v ^= int(x)
+    def finalize(self):
+        return self.v
+
+
+# ---------------------------
+# Tradução de T-SQL
+# ---------------------------
+
+_HINT = r"(?:NOLOCK|UPDLOCK|HOLDLOCK|ROWLOCK|READPAST|TABLOCKX?|XLOCK|READCOMMITTEDLOCK|SERIALIZABLE)"
+_RE_HINTS = re.compile(rf"\bWITH\s*\(\s*{_HINT}(?:\s*,\s*{_HINT})*\s*\)", re.I)
+_RE_TRAVA = re.compile(r"\b(?:UPDLOCK|XLOCK)\b", re.I)
+_RE_TOP = re.compile(r"^(\s*SELECT\s+(?:DISTINCT\s+)?)TOP\s*\(?\s*(\d+)\s*\)?\s*", re.I)
+_RE_NOME_3 = re.compile(r"(?:\[\w+\]|\w+)\.(?:\[dbo\]|dbo)\.(\[\w+\]|\w+)", re.I)
+_RE_DBO = re.compile(r"\bdbo\.", re.I)
+_RE_CONVERT_TXT = re.compile(r"\bCONVERT\s*\(\s*N?VARCHAR\s*(?:\(\s*(?:\d+|MAX)\s*\))?\s*,", re.I)
+_RE_TRY_BIGINT = re.compile(r"\bTRY_CONVERT\s*\(\s*BIGINT\s*,", re.I)
+_RE_COUNT_BIG = re.compile(r"\bCOUNT_BIG\s*\(", re.I)
+_RE_MIN_ACTIVE_RV = re.compile(r"\bMIN_ACTIVE_ROWVERSION\s*\(\s*\)", re.I)
+_RE_SET_SESSAO = re.compile(r"^\s*SET\s+(?:NOCOUNT\s+(?:ON|OFF)|LOCK_TIMEOUT\s+-?\d+)\s*$", re.I)
+
+
+def _dividir(sql: str) -> List[str]:
+    """Divide um lote em comandos por ';' fora de aspas."""
+    partes, atual, aspas = [], [], False
+    for ch in sql:
+        if ch == "'":
+            aspas = not aspas
+        if ch == ";" and not aspas:
+            partes.append("".join(atual))
+            atual = []
+        else:
+            atual.append(ch)
+    partes.append("".join(atual))
+    return [p for p in partes if p.strip() and not _RE_SET_SESSAO.match(p)]
+
+def _contar_params(sql: str) -> int:
+    n, aspas = 0, False
+    for ch in sql:
+        if ch == "'":
+            aspas = not aspas
+        elif ch == "?" and not aspas:
+            n += 1
+    return n
+
+@lru_cache(maxsize=512)
+def traduzir(sql: str) -> Tuple[Tuple[str, int, bool], ...]:
+    """Lote T-SQL -> ((comando_sqlite, n_parametros, pede_trava), ...)."""
+    saida = []
+    for cmd in _dividir(sql):
+        trava = bool(_RE_TRAVA.search(cmd))
+        cmd = _RE_HINTS.sub("", cmd)
+        cmd = _RE_NOME_3.sub(r"\1", cmd)
+        cmd = _RE_DBO.sub("", cmd)
+        cmd = _RE_CONVERT_TXT.sub("CAST_TXT(", cmd)
+        cmd = _RE_TRY_BIGINT.sub("TRY_BIGINT(", cmd)
+        cmd = _RE_COUNT_BIG.sub("COUNT(", cmd)
+        cmd = _RE_MIN_ACTIVE_RV.sub("(SELECT v + 1 FROM _rowversion)", cmd)
+        m = _RE_TOP.match(cmd)
+        if m:
+            cmd = m.group(1) + cmd[m.end():].rstrip() + f" LIMIT {m.group(2)}"
+        saida.append((cmd, _contar_params(cmd), trava))
+    return tuple(saida)
+
+
+# ---------------------------
+# Conexão / cursor no estilo pyodbc
+# ---------------------------
+
+class Cursor:
+    def __init__(self, conn: "Connection"):
+        self._conn = conn
+        self._resultados: List[Tuple[Optional[tuple], List[tuple]]] = []
+        self._linhas: List[tuple] = []
+        self._pos = 0
+        self.description = None
+        self.rowcount = -1
+        self.fast_executemany = False
+        self._fluxo: Optional[sqlite3.Cursor] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def close(self) -> None:
+        self._fechar_fluxo()
+        self._resultados = []
+        self._linhas = []
+
+    def _fechar_fluxo(self) -> None:
+        if self._fluxo is not None:
+            self._fluxo.close()
+            self._fluxo = None
+
+    def _proximo(self) -> bool:
+        self._fechar_fluxo()
+        if not self._resultados:
+            self.description, self._linhas, self._pos = None, [], 0
+            return False
+        self.description, self._linhas = self._resultados.pop(0)
+        self._pos = 0
+        return True
+
+    def execute(self, sql: str, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = tuple(params[0])
+        comandos = traduzir(sql)
+        self._fechar_fluxo()
+        self._resultados = []
+        self.rowcount = -1
+        raw = self._conn._raw
+        i = 0
+        fluxo = None
+        with self._conn._lock:
+            try:
+                for cmd, n, trava in comandos:
+                    p = params[i:i + n]
+                    i += n
+                    self._conn._preparar_transacao(cmd, trava)
+                    cur = raw.execute(cmd, p)
+                    if cur.description is None:
+                        self.rowcount = cur.rowcount
+                    elif len(comandos) == 1:
+                        fluxo = cur  # SELECT único: linhas lidas sob demanda (fetchmany em fluxo)
+                    else:
+                        self._resultados.append((cur.description, cur.fetchall()))
+            except sqlite3.Error as ex:
+                raise _converter_erro(ex) from ex
+        self._proximo()
+        if fluxo is not None:
+            self._fluxo, self.description = fluxo, fluxo.description
+        return self
+
+    def executemany(self, sql: str, seq_params: Sequence[Sequence]):
+        comandos = traduzir(sql)
+        if len(comandos) != 1:
+            raise ProgrammingError("42000", "executemany aceita um único comando")
+        cmd, _, trava = comandos[0]
+        with self._conn._lock:
+            try:
+                self._conn._preparar_transacao(cmd, trava)
+                cur = self._conn._raw.executemany(cmd, [tuple(p) for p in seq_params])
+                self.rowcount = cur.rowcount
+            except sqlite3.Error as ex:
+                raise _converter_erro(ex) from ex
+        self._resultados = []
+        self._proximo()
+        return self
+
+    def _ler_fluxo(self, metodo, *args):
+        with self._conn._lock:
+            try:
+                return metodo(*args)
+            except sqlite3.Error as ex:
+                raise _converter_erro(ex) from ex
+
+    def fetchone(self):
+        if self._fluxo is not None:
+            return self._ler_fluxo(self._fluxo.fetchone)
+        if self._pos >= len(self._linhas):
+            return None
+        row = self._linhas[self._pos]
+        self._pos += 1
+        return row
+
+    def fetchmany(self, size: int = 1):
+        if self._fluxo is not None:
+            return self._ler_fluxo(self._fluxo.fetchmany, size)
+        rows = self._linhas[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchall(self):
+        if self._fluxo is not None:
+            return self._ler_fluxo(self._fluxo.fetchall)
+        rows = self._linhas[self._pos:]
+        self._pos = len(self._linhas)
+        return rows
+
+    def nextset(self) -> bool:
+        return self._proximo()
+
+
+class Connection:
+    def __init__(self, caminho: str, timeout: float = 30.0):
+        try:
+            self._raw = sqlite3.connect(
+                caminho, timeout=timeout, isolation_level=None,
+                detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False,
+            )
+        except sqlite3.Error as ex:
+            raise _converter_erro(ex) from ex
+        self._raw.execute("PRAGMA journal_mode=WAL")
+        self._raw.execute("PRAGMA synchronous=NORMAL")
+        self._raw.create_function("GETDATE", 0, _getdate)
+        self._raw.create_function("CAST_TXT", 1, lambda v: None if v is None else str(v), deterministic=True)
+        self._raw.create_function("TRY_BIGINT", 1, _try_bigint, deterministic=True)
+        self._raw.create_function("LEN", 1, lambda v: None if v is None else len(str(v).rstrip()), deterministic=True)
+        self._raw.create_function("BINARY_CHECKSUM", -1, _binary_checksum, deterministic=True)
+        self._raw.create_aggregate("CHECKSUM_AGG", 1, _ChecksumAgg)
+        self._lock = threading.RLock()
+        self.autocommit = False
+
+    def _preparar_transacao(self, cmd: str, trava: bool) -> None:
+        # leituras simples ficam fora de transação (veem sempre o último commit);
+        # escrita ou leitura com UPDLOCK abrem a transação implícita
+        if self.autocommit or self._raw.in_transaction:
+            return
+        if trava:
+            self._raw.execute("BEGIN IMMEDIATE")
+        elif not cmd.lstrip().upper().startswith(("SELECT", "WITH")):
+            self._raw.execute("BEGIN")
+
+    def cursor(self) -> Cursor:
+        return Cursor(self)
+
+    def execute(self, sql: str, *params) -> Cursor:
+        return self.cursor().execute(sql, *params)
+
+    def commit(self) -> None:
+        with self._lock:
+            if self._raw.in_transaction:
+                self._raw.execute("COMMIT")
+
+    def rollback(self) -> None:
+        with self._lock:
+            if self._raw.in_transaction:
+                self._raw.execute("ROLLBACK")
+
+    def close(self) -> None:
+        self.rollback()
+        self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+
+def connect(caminho: str, timeout: float = 30.0) -> Connection:
+    return Connection(caminho, timeout)
+
+
+# ---------------------------
+# Esquema equivalente (SQLite)
+# ---------------------------
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS Usuario (
+    IDUsuario TEXT PRIMARY KEY, NomeUsuario TEXT, Email TEXT, Senha TEXT, Ativo INTEGER
+);
+CREATE TABLE IF NOT EXISTS COLETORES_CADASTRO (
+    IDColetores TEXT NOT NULL, NumSerie TEXT, IDColetorNorm TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_COLETORES_CADASTRO_Norm ON COLETORES_CADASTRO (IDColetorNorm);
+CREATE TABLE IF NOT EXISTS SS_USUARIOS_COLETOR (
+    ID_USUARIO TEXT NOT NULL, NOME_COMPLETO TEXT, INATIVO INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS IX_SS_USUARIOS_COLETOR_ID ON SS_USUARIOS_COLETOR (ID_USUARIO);
+CREATE TABLE IF NOT EXISTS LG_ColetoresDefeito (
+    IdDefeito INTEGER PRIMARY KEY, DescricaoDefeito TEXT
+);
+CREATE TABLE IF NOT EXISTS LG_ControleColetores (
+    DataRegistro DATETIME NOT NULL, IDRegistro INTEGER NOT NULL, IDColetor TEXT NOT NULL,
+    IDColetorNorm TEXT, IDColaborador TEXT, RealizadoTeste INTEGER, DetectadoDefeito INTEGER,
+    SinalizaConserto INTEGER, Observacao TEXT, RespProcesso TEXT, DataEnvioConserto TEXT,
+    Chamado TEXT, DataRetornoConserto TEXT, ChaveIdempotencia TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_LG_ControleColetores_Norm
+    ON LG_ControleColetores (IDColetorNorm, DataRegistro DESC, IDRegistro DESC);
+CREATE INDEX IF NOT EXISTS IX_LG_ControleColetores_Data
+    ON LG_ControleColetores (DataRegistro, IDColetorNorm, IDRegistro);
+CREATE TABLE IF NOT EXISTS LG_ControleColetoresDefeito (
+    DataRegistro DATETIME NOT NULL, IDRegistro INTEGER, IDColetor TEXT, IDColetorNorm TEXT,
+    IDDefeito TEXT, RespProcesso TEXT
+);
+CREATE INDEX IF NOT EXISTS IX_LG_ControleColetoresDefeito_Norm
+    ON LG_ControleColetoresDefeito (IDColetorNorm, DataRegistro);
+CREATE TABLE IF NOT EXISTS LG_ColetoresEstadoAtual (
+    IDColetorNorm TEXT NOT NULL PRIMARY KEY, IDColetor TEXT NOT NULL, IDRegistro INTEGER NOT NULL,
+    IDColaborador TEXT, DataRegistro DATETIME NOT NULL, RV INTEGER
+);
+CREATE INDEX IF NOT EXISTS IX_LG_ColetoresEstadoAtual_Colaborador
+    ON LG_ColetoresEstadoAtual (IDColaborador, IDRegistro);
+CREATE INDEX IF NOT EXISTS IX_LG_ColetoresEstadoAtual_RV ON LG_ColetoresEstadoAtual (RV);
+CREATE UNIQUE INDEX IF NOT EXISTS UX_LG_ColetoresEstadoAtual_ColabEmOperacao
+    ON LG_ColetoresEstadoAtual (IDColaborador) WHERE IDRegistro = 1 AND IDColaborador IS NOT NULL;
+CREATE TABLE IF NOT EXISTS LG_ColetoresCheckpoint (
+    DataCheckpoint DATETIME NOT NULL PRIMARY KEY, Coletores INTEGER NOT NULL, CriadoEm DATETIME NOT NULL
+);
+CREATE TABLE IF NOT EXISTS LG_ColetoresCheckpointEstado (
+    DataCheckpoint DATETIME NOT NULL, IDColetorNorm TEXT NOT NULL, IDColetor TEXT NOT NULL,
+    IDRegistro INTEGER NOT NULL, IDColaborador TEXT, DataRegistro DATETIME NOT NULL,
+    PRIMARY KEY (DataCheckpoint, IDColetorNorm)
+);
+
+-- rowversion: contador global incrementado a cada INSERT/UPDATE da projeção
+CREATE TABLE IF NOT EXISTS _rowversion (v INTEGER NOT NULL);
+INSERT INTO _rowversion SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM _rowversion);
+CREATE TRIGGER IF NOT EXISTS trg_estado_rv_ins AFTER INSERT ON LG_ColetoresEstadoAtual
+BEGIN
+    UPDATE _rowversion SET v = v + 1;
+    UPDATE LG_ColetoresEstadoAtual SET RV = (SELECT v FROM _rowversion)
+     WHERE IDColetorNorm = NEW.IDColetorNorm;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_estado_rv_upd
+AFTER UPDATE OF IDColetor, IDRegistro, IDColaborador, DataRegistro ON LG_ColetoresEstadoAtual
+BEGIN
+    UPDATE _rowversion SET v = v + 1;
+    UPDATE LG_ColetoresEstadoAtual SET RV = (SELECT v FROM _rowversion)
+     WHERE IDColetorNorm = NEW.IDColetorNorm;
+END;
+"""
+
+
+# Colunas acrescentadas depois: arquivos criados antes ganham a coluna
+# (CREATE TABLE IF NOT EXISTS não altera tabela existente).
+_COLUNAS_POSTERIORES = (
+    ("LG_ControleColetores", "ChaveIdempotencia", "TEXT"),
+    ("COLETORES_CADASTRO", "RV", "INTEGER"),
+)
+
+_DDL_POSTERIOR = """
+CREATE UNIQUE INDEX IF NOT EXISTS UX_LG_ControleColetores_Chave
+    ON LG_ControleColetores (ChaveIdempotencia) WHERE ChaveIdempotencia IS NOT NULL;
+
+-- rowversion do cadastro (mesmo contador da projeção)
+CREATE TRIGGER IF NOT EXISTS trg_cadastro_rv_ins AFTER INSERT ON COLETORES_CADASTRO
+BEGIN
+    UPDATE _rowversion SET v = v + 1;
+    UPDATE COLETORES_CADASTRO SET RV = (SELECT v FROM _rowversion) WHERE rowid = NEW.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS trg_cadastro_rv_upd
+AFTER UPDATE OF IDColetores, NumSerie, IDColetorNorm ON COLETORES_CADASTRO
+BEGIN
+    UPDATE _rowversion SET v = v + 1;
+    UPDATE COLETORES_CADASTRO SET RV = (SELECT v FROM _rowversion) WHERE rowid = NEW.rowid;
+END;
+"""
+
+
+def criar_esquema(caminho: str) -> None:
+    """Cria (se faltar) as tabelas usadas pelo aplicativo no arquivo SQLite."""
+    cn = sqlite3.connect(caminho)
+    try:
+        cn.executescript(_DDL)
+        for tabela, coluna, tipo in _COLUNAS_POSTERIORES:
+            if coluna not in {r[1] for r in cn.execute(f"PRAGMA table_info({tabela})")}:
+                cn.execute(f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}")
+        cn.executescript(_DDL_POSTERIOR)
+    finally:
+        cn.close()
@@ -0,0 +1,175 @@
+# bench_caminhos_quentes.py
+# ------------------------------------------------------------
+# Benchmark offline dos caminhos quentes contra o banco substituto (SQLite)
+# com histórico sintético de 10k / 1M / 10M movimentações:
+#   get_totais_coletores, _get_ultimo_mov_do_coletor,
+#   _colaborador_tem_coletor_em_operacao, processar_movimentacao,
+#   inserir_defeitos
+# Grava p50/p95/p99 (ms) e vazão (ops/s) em JSON para comparar execuções.
+#
+# Uso:
+#   python benchmarks/bench_caminhos_quentes.py --escala 10k
+#   python benchmarks/bench_caminhos_quentes.py --escala 1m --comparar resultados/anterior.json
+# ------------------------------------------------------------
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+_AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_AQUI))
+
+import db  # noqa: E402
+import mov_validacoes as mv  # noqa: E402
+from gerar_historico import escala_para_linhas, gerar  # noqa: E402
+
+_TABELAS_BENCH = ("LG_ControleColetores", "LG_ControleColetoresDefeito", "LG_ColetoresEstadoAtual")
+
+
+def _percentil(ordenados: List[float], p: float) -> float:
+    if not ordenados:
+        return 0.0
+    k = (len(ordenados) - 1) * p
+    i = int(k)
+    j = min(i + 1, len(ordenados) - 1)
+    return ordenados[i] + (ordenados[j] - ordenados[i]) * (k - i)
+
+
+def medir(fn: Callable[[int], object], iteracoes: int, aquecimento: int = 5) -> Dict[str, float]:
+    for k in range(aquecimento):
+        fn(-1 - k)
+    tempos = []
+    t_total = time.perf_counter()
+    for k in range(iteracoes):
+        t0 = time.perf_counter_ns()
+        fn(k)
+        tempos.append((time.perf_counter_ns() - t0) / 1e6)
+    total = time.perf_counter() - t_total
+    tempos.sort()
+    return {
+        "iteracoes": iteracoes,
+        "p50_ms": round(_percentil(tempos, 0.50), 4),
+        "p95_ms": round(_percentil(tempos, 0.95), 4),
+        "p99_ms": round(_percentil(tempos, 0.99), 4),
+        "media_ms": round(sum(tempos) / len(tempos), 4),
+        "max_ms": round(tempos[-1], 4),
+        "ops_por_s": round(iteracoes / total, 1) if total else 0.0,
+    }
+
+
+def executar(caminho: str, iteracoes: int, semente: int = 7) -> Dict[str, Dict[str, float]]:
+    db.CONFIG["BACKEND"] = "sqlite"
+    db.CONFIG["SQLITE_PATH"] = caminho
+    db.fechar_pool()
+    rnd = random.Random(semente)
+
+    with db.conectar() as cn, cn.cursor() as cur:
+        cur.execute("SELECT IDColetores FROM COLETORES_CADASTRO")
+        coletores = [r[0] for r in cur.fetchall()]
+        cur.execute("SELECT ID_USUARIO FROM SS_USUARIOS_COLETOR")
+        usuarios = [r[0] for r in cur.fetchall()]
+        # execuções anteriores: os pares do benchmark voltam ao zero
+        for tabela in _TABELAS_BENCH:
+            cur.execute(f"DELETE FROM {tabela} WHERE IDColetor LIKE 'BENCH%'")
+
+    falhas = {"processar_movimentacao": 0}
+    seq = iter(range(10 ** 9))
+
+    def processar(k: int):
+        # pares exclusivos do benchmark: ENTREGA e DEVOLUÇÃO alternadas (sempre válidas)
+        n = next(seq)
+        par = (n // 2) % 50
+        acao = "Entrega Início operação" if n % 2 == 0 else "Devolução término operação"
+        ok, msg = mv.processar_movimentacao(
+            acao, f"BENCH{par:04d}", f"bench.{par:04d}", True, False, False, None,
+            "benchmark", None, None, None,
+        )
+        if not ok:
+            falhas["processar_movimentacao"] += 1
+
+    def defeitos(k: int):
+        c = rnd.choice(coletores)
+        mv.inserir_defeitos([mv.DefeitoItem(2, c, f"{d:02d}", "benchmark") for d in (1, 4, 7)])
+
+    casos = {
+        "get_totais_coletores": lambda k: db.get_totais_coletores(),
+        "_get_ultimo_mov_do_coletor": lambda k: mv._get_ultimo_mov_do_coletor(rnd.choice(coletores)),
+        "_colaborador_tem_coletor_em_operacao": lambda k: mv._colaborador_tem_coletor_em_operacao(rnd.choice(usuarios)),
+        "processar_movimentacao": processar,
+        "inserir_defeitos": defeitos,
+    }
+    resultados = {}
+    for nome, fn in casos.items():
+        resultados[nome] = medir(fn, iteracoes)
+        print(f"{nome:<40} p50={resultados[nome]['p50_ms']:>9.3f}ms "
+              f"p95={resultados[nome]['p95_ms']:>9.3f}ms p99={resultados[nome]['p99_ms']:>9.3f}ms "
+              f"{resultados[nome]['ops_por_s']:>10.1f} ops/s")
+    resultados["processar_movimentacao"]["falhas"] = falhas["processar_movimentacao"]
+    resultados["_pool"] = db.estatisticas_pool()
+    db.fechar_pool()
+    return resultados
+
+
+def comparar(atual: Dict, base: Dict) -> None:
+    print(f"\n{'operação':<40} {'p50 base':>10} {'p50 atual':>10} {'variação':>9}")
+    for nome, r in atual["resultados"].items():
+        b = base.get("resultados", {}).get(nome)
+        if not b or "p50_ms" not in r:
+            continue
+        var = (r["p50_ms"] / b["p50_ms"] - 1) * 100 if b["p50_ms"] else 0.0
+        print(f"{nome:<40} {b['p50_ms']:>10.3f} {r['p50_ms']:>10.3f} {var:>+8.1f}%")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark offline dos caminhos quentes.")
+    parser.add_argument("--escala", default="10k", help="10k, 1m, 10m ou um número de movimentos")
+    parser.add_argument("--banco", help="arquivo SQLite (padrão: benchmarks/dados/historico_<escala>.sqlite3)")
+    parser.add_argument("--regerar", action="store_true", help="recria o histórico mesmo se o arquivo existir")
+    parser.add_argument("--iteracoes", type=int, default=200)
+    parser.add_argument("--saida", help="JSON de saída (padrão: benchmarks/resultados/<escala>-<data>.json)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args(argv)
+
+    escala = args.escala.lower()
+    caminho = args.banco or os.path.join(_AQUI, "dados", f"historico_{escala}.sqlite3")
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    resumo = None
+    if args.regerar or not os.path.exists(caminho):
+        t0 = time.perf_counter()
+        resumo = gerar(caminho, escala_para_linhas(escala))
+        print(f"Histórico gerado em {time.perf_counter() - t0:.1f}s: {resumo}")
+
+    resultados = executar(caminho, args.iteracoes)
+    saida = {
+        "meta": {
+            "quando": datetime.now().isoformat(timespec="seconds"),
+            "escala": escala,
+            "movimentos": escala_para_linhas(escala),
+            "banco": os.path.abspath(caminho),
+            "backend": "sqlite",
+            "python": platform.python_version(),
+            "maquina": platform.node(),
+            "gerado": resumo,
+        },
+        "resultados": resultados,
+    }
+    destino = args.saida or os.path.join(
+        _AQUI, "resultados", f"{escala}-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    with open(destino, "w", encoding="utf-8") as f:
+        json.dump(saida, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados: {destino}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(saida, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
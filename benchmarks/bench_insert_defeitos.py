@@ -0,0 +1,101 @@
+# bench_insert_defeitos.py
+# ------------------------------------------------------------
+# Linhas/s ao gravar defeitos: laço de cur.execute (como era) x INSERT
+# multi-linha x fast_executemany em blocos (db.executar_em_massa).
+# Grava numa tabela temporária (#BenchDefeito) com a mesma estrutura de
+# LG_ControleColetoresDefeito: nada fica no banco.
+# No banco substituto (DB_BACKEND=sqlite ou --banco) a temporária é uma
+# TEMP TABLE da conexão; fast_executemany vira executemany do sqlite3, então
+# os números só comparam as estratégias entre si, não com o SQL Server.
+#
+# Uso (na raiz do projeto, com o banco configurado em db.CONFIG):
+#   python benchmarks/bench_insert_defeitos.py --linhas 5000
+#   python benchmarks/bench_insert_defeitos.py --banco benchmarks/dados/historico_10k.sqlite3
+# ------------------------------------------------------------
+from __future__ import annotations
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import banco_substituto  # noqa: E402
+import db  # noqa: E402
+
+_COLUNAS = "(DataRegistro, IDRegistro, IDColetor, IDColetorNorm, IDDefeito, RespProcesso)"
+# tabela temporária por backend: #Tabela no SQL Server, TEMP TABLE no substituto
+_TEMPORARIA = {
+    "odbc": ("#BenchDefeito", "SELECT TOP 0 * INTO #BenchDefeito FROM LG_ControleColetoresDefeito"),
+    "sqlite": ("BenchDefeito", "CREATE TEMP TABLE BenchDefeito AS SELECT * FROM LG_ControleColetoresDefeito WHERE 1 = 0"),
+}
+_TABELA, _SQL_CRIAR = _TEMPORARIA["odbc"]
+
+
+def _linhas(n: int):
+    return [(3, f"{i % 900:06d}", str(i % 900), f"{i % 12:02d}", "bench") for i in range(n)]
+
+
+def _sql_uma() -> str:
+    return f"INSERT INTO {_TABELA} {_COLUNAS} VALUES (GETDATE(), ?, ?, ?, ?, ?)"
+
+
+def _laco(cur, linhas):
+    sql = _sql_uma()
+    for p in linhas:
+        cur.execute(sql, p)
+
+
+def _multilinha(cur, linhas, por_comando: int = 300):
+    # 300 linhas x 5 parâmetros = 1500 (< 2100)
+    for i in range(0, len(linhas), por_comando):
+        bloco = linhas[i:i + por_comando]
+        valores = ", ".join(["(GETDATE(), ?, ?, ?, ?, ?)"] * len(bloco))
+        cur.execute(f"INSERT INTO {_TABELA} {_COLUNAS} VALUES {valores}",
+                    [v for p in bloco for v in p])
+
+
+def _em_massa(cur, linhas):
+    db.executar_em_massa(cur, _sql_uma(), linhas)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de INSERT de defeitos.")
+    parser.add_argument("--linhas", type=int, default=5000)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--banco", help="arquivo SQLite do banco substituto (em vez de db.CONFIG)")
+    args = parser.parse_args(argv)
+
+    global _TABELA, _SQL_CRIAR
+    if args.banco:
+        banco_substituto.criar_esquema(args.banco)
+        db.CONFIG["BACKEND"] = "sqlite"
+        db.CONFIG["SQLITE_PATH"] = args.banco
+    if db.CONFIG["BACKEND"] not in _TEMPORARIA:
+        print(f"backend {db.CONFIG['BACKEND']!r} não suportado (use odbc ou sqlite).")
+        return
+    _TABELA, _SQL_CRIAR = _TEMPORARIA[db.CONFIG["BACKEND"]]
+
+    linhas = _linhas(args.linhas)
+    estrategias = [("laco_execute", _laco), ("multilinha", _multilinha), ("fast_executemany", _em_massa)]
+    with db.conectar() as cn, cn.cursor() as cur:
+        cur.execute(_SQL_CRIAR)
+        print(f"{'estratégia':<18} {'melhor (s)':>10} {'linhas/s':>12}")
+        base = None
+        for nome, fn in estrategias:
+            tempos = []
+            for _ in range(args.repeticoes):
+                cur.execute(f"DELETE FROM {_TABELA}")
+                cn.commit()
+                t0 = time.perf_counter()
+                fn(cur, linhas)
+                cn.commit()
+                tempos.append(time.perf_counter() - t0)
+            melhor = min(tempos)
+            taxa = len(linhas) / melhor
+            base = base or taxa
+            print(f"{nome:<18} {melhor:>10.3f} {taxa:>12,.0f}  ({taxa / base:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# bench_servico.py
+# ------------------------------------------------------------
+# Serviço local + banco substituto numa máquina só: sobe servico.py numa
+# thread sobre o histórico sintético e simula N estações (threads) usando
+# cliente_servico como a UI usaria: nome do coletor, status, nome do
+# colaborador, movimentação (ENTREGA/DEVOLUÇÃO alternadas) e totais.
+# Mostra latência por chamada, vazão e quantas conexões o serviço abriu.
+#
+# Uso:
+#   python benchmarks/bench_servico.py --estacoes 40 --ciclos 50
+# ------------------------------------------------------------
+from __future__ import annotations
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+_AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_AQUI))
+
+import db  # noqa: E402
+import cliente_servico  # noqa: E402
+from bench_caminhos_quentes import _percentil  # noqa: E402
+from gerar_historico import escala_para_linhas, gerar  # noqa: E402
+
+
+def _estacao(n: int, ciclos: int, tempos, falhas, lock) -> None:
+    locais = defaultdict(list)
+    coletor, colab = f"EST{n:03d}", f"estacao.{n:03d}"
+    for k in range(ciclos):
+        acao = "Entrega Início operação" if k % 2 == 0 else "Devolução término operação"
+        passos = (
+            ("nome", lambda: cliente_servico.nome_coletor_ou_usuario(f"{(k * 7 + n) % 200 + 1}", "COLETOR")),
+            ("status", lambda: cliente_servico.status_do_coletor(coletor)),
+            ("colaborador", lambda: cliente_servico.nome_coletor_ou_usuario(f"u{n % 200 + 1:06d}", "USUARIO")),
+            ("movimentacao", lambda: cliente_servico.processar_movimentacao(
+                acao, coletor, colab, True, False, False, None, "bench", None, None, None)),
+            ("totais", lambda: cliente_servico.TotaisRemotos().atualizar()),
+        )
+        for nome, fn in passos:
+            t0 = time.perf_counter()
+            r = fn()
+            locais[nome].append((time.perf_counter() - t0) * 1000)
+            if nome == "movimentacao" and not r[0]:
+                with lock:
+                    falhas.append(r[1])
+    with lock:
+        for nome, v in locais.items():
+            tempos[nome].extend(v)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serviço local + banco substituto, N estações.")
+    parser.add_argument("--escala", default="10k")
+    parser.add_argument("--banco", help="arquivo SQLite (padrão: benchmarks/dados/historico_<escala>.sqlite3)")
+    parser.add_argument("--estacoes", type=int, default=40)
+    parser.add_argument("--ciclos", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    caminho = args.banco or os.path.join(_AQUI, "dados", f"historico_{args.escala.lower()}.sqlite3")
+    if not os.path.exists(caminho):
+        os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        gerar(caminho, escala_para_linhas(args.escala))
+    db.CONFIG["BACKEND"] = "sqlite"
+    db.CONFIG["SQLITE_PATH"] = caminho
+    db.fechar_pool()
+    with db.conectar() as cn, cn.cursor() as cur:  # estações de execuções anteriores voltam ao zero
+        for tabela in ("LG_ControleColetores", "LG_ColetoresEstadoAtual"):
+            cur.execute(f"DELETE FROM {tabela} WHERE IDColetor LIKE 'EST%'")
+
+    import servico
+    servidor, url = servico.iniciar_em_thread()
+    cliente_servico.configurar(url)
+    print(f"Serviço em {url}; {args.estacoes} estações x {args.ciclos} ciclos")
+
+    tempos, falhas, lock = defaultdict(list), [], threading.Lock()
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=_estacao, args=(n, args.ciclos, tempos, falhas, lock))
+               for n in range(args.estacoes)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - t0
+
+    chamadas = sum(len(v) for v in tempos.values())
+    print(f"{'chamada':<14} {'n':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for nome, v in tempos.items():
+        v.sort()
+        print(f"{nome:<14} {len(v):>6} {_percentil(v, .5):>8.2f} {_percentil(v, .95):>8.2f} {_percentil(v, .99):>8.2f}")
+    print(f"{chamadas} chamadas em {total:.1f}s ({chamadas / total:.0f}/s); movimentações recusadas: {len(falhas)}")
+    saude = cliente_servico.saude()
+    print(f"Pool do serviço: {saude['pool']}")
+    print(f"Caches: {saude['lookups']}")
+    servidor.encerrar()
+
+
+if __name__ == "__main__":
+    main()
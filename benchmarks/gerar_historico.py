@@ -0,0 +1,140 @@
+# gerar_historico.py
+# ------------------------------------------------------------
+# Gera um banco substituto (SQLite, banco_substituto.py) com histórico
+# sintético de movimentações válidas segundo as regras de status:
+#   COLETORES_CADASTRO, SS_USUARIOS_COLETOR, LG_ColetoresDefeito,
+#   LG_ControleColetores, LG_ControleColetoresDefeito e a projeção
+#   LG_ColetoresEstadoAtual (via migracoes.rebuild_estado_atual).
+# Metade dos coletores aparece com zeros à esquerda ('000073'), para
+# exercitar a normalização.
+#
+# Uso:
+#   python benchmarks/gerar_historico.py --escala 10k --banco /tmp/hist_10k.sqlite3
+# ------------------------------------------------------------
+from __future__ import annotations
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import banco_substituto  # noqa: E402
+
+ESCALAS = {"10k": 10_000, "1m": 1_000_000, "10m": 10_000_000}
+_BLOCO = 50_000
+_COLS_MOV = ("DataRegistro, IDRegistro, IDColetor, IDColetorNorm, IDColaborador, RealizadoTeste, "
+             "DetectadoDefeito, SinalizaConserto, Observacao, RespProcesso, DataEnvioConserto, "
+             "Chamado, DataRetornoConserto")
+
+
+def escala_para_linhas(escala: str) -> int:
+    if escala.lower() in ESCALAS:
+        return ESCALAS[escala.lower()]
+    return int(escala)
+
+
+def _id_coletor(n: int) -> str:
+    return f"{n:06d}" if n % 2 else str(n)
+
+
+def gerar(caminho: str, movimentos: int, semente: int = 42) -> dict:
+    """Cria o arquivo do zero e devolve um resumo (coletores, usuários, linhas)."""
+    if os.path.exists(caminho):
+        os.remove(caminho)
+    banco_substituto.criar_esquema(caminho)
+    rnd = random.Random(semente)
+    n_coletores = max(200, movimentos // 200)
+    n_usuarios = n_coletores
+
+    cn = sqlite3.connect(caminho)
+    cn.execute("PRAGMA journal_mode=OFF")
+    cn.execute("PRAGMA synchronous=OFF")
+    cn.executemany(
+        "INSERT INTO COLETORES_CADASTRO (IDColetores, NumSerie, IDColetorNorm) VALUES (?, ?, ?)",
+        [(_id_coletor(i), f"SN{i:08d}", str(i)) for i in range(1, n_coletores + 1)],
+    )
+    cn.executemany(
+        "INSERT INTO SS_USUARIOS_COLETOR (ID_USUARIO, NOME_COMPLETO, INATIVO) VALUES (?, ?, 0)",
+        [(f"u{i:06d}", f"COLABORADOR {i:06d}") for i in range(1, n_usuarios + 1)],
+    )
+    cn.executemany(
+        "INSERT INTO LG_ColetoresDefeito (IdDefeito, DescricaoDefeito) VALUES (?, ?)",
+        [(i, f"DEFEITO {i}") for i in range(1, 13)],
+    )
+    cn.execute("INSERT INTO Usuario VALUES ('admin', 'ADMIN', 'admin@azzas2154.com.br', 'admin', 1)")
+
+    # estado por coletor: (idreg, usuario); usuários livres para ENTREGA
+    estado = {i: (None, None) for i in range(1, n_coletores + 1)}
+    livres = [f"u{i:06d}" for i in range(1, n_usuarios + 1)]
+    rnd.shuffle(livres)
+    inicio = datetime.now() - timedelta(days=5 * 365)
+    passo = (5 * 365 * 86400) / max(movimentos, 1)
+    movs, defeitos = [], []
+    n_def = 0
+    for k in range(movimentos):
+        data = (inicio + timedelta(seconds=k * passo)).isoformat(sep=" ", timespec="milliseconds")
+        c = rnd.randint(1, n_coletores)
+        idreg, usuario = estado[c]
+        if idreg == 1:
+            nova, colab = 2, usuario
+            livres.append(usuario)
+        elif idreg == 3:
+            nova, colab = 4, rnd.choice(livres) if livres else None
+        elif idreg in (5, 6):
+            nova, colab = 4, None  # reativação
+        else:
+            r = rnd.random()
+            if r < 0.85 and livres:
+                nova, colab = 1, livres.pop(rnd.randrange(len(livres)))
+            elif r < 0.97:
+                nova, colab = 3, rnd.choice(livres) if livres else None
+            else:
+                nova, colab = rnd.choice((5, 6)), None
+        estado[c] = (nova, colab if nova == 1 else None)
+        tem_defeito = nova in (2, 3) and rnd.random() < 0.05
+        movs.append((data, nova, _id_coletor(c), str(c), colab, 1, int(tem_defeito), int(nova == 3),
+                     None, "gerador", None, None, None))
+        if tem_defeito:
+            for d in rnd.sample(range(1, 13), rnd.randint(1, 2)):
+                defeitos.append((data, nova, _id_coletor(c), str(c), f"{d:02d}", "gerador"))
+        if len(movs) >= _BLOCO:
+            cn.executemany(f"INSERT INTO LG_ControleColetores ({_COLS_MOV}) VALUES ({', '.join('?' * 13)})", movs)
+            cn.executemany("INSERT INTO LG_ControleColetoresDefeito VALUES (?, ?, ?, ?, ?, ?)", defeitos)
+            n_def += len(defeitos)
+            movs, defeitos = [], []
+    if movs:
+        cn.executemany(f"INSERT INTO LG_ControleColetores ({_COLS_MOV}) VALUES ({', '.join('?' * 13)})", movs)
+    if defeitos:
+        cn.executemany("INSERT INTO LG_ControleColetoresDefeito VALUES (?, ?, ?, ?, ?, ?)", defeitos)
+        n_def += len(defeitos)
+    cn.commit()
+    cn.close()
+
+    # projeção de estado atual pelo mesmo caminho do aplicativo
+    import db
+    import migracoes
+    db.CONFIG["BACKEND"] = "sqlite"
+    db.CONFIG["SQLITE_PATH"] = caminho
+    db.fechar_pool()
+    migracoes.rebuild_estado_atual()
+    db.fechar_pool()
+    return {"movimentos": movimentos, "defeitos": n_def, "coletores": n_coletores, "usuarios": n_usuarios}
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Gera histórico sintético no banco substituto.")
+    parser.add_argument("--escala", default="10k", help="10k, 1m, 10m ou um número de movimentos")
+    parser.add_argument("--banco", required=True, help="arquivo SQLite de saída (é recriado)")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args(argv)
+    t0 = time.perf_counter()
+    resumo = gerar(args.banco, escala_para_linhas(args.escala), args.semente)
+    print(f"{resumo} em {time.perf_counter() - t0:.1f}s -> {args.banco}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+# stress_concorrencia.py
+# ------------------------------------------------------------
+# Estações concorrentes disputando poucos coletores e colaboradores.
+# Cada thread faz ENTREGA / DEVOLUÇÃO / ENVIO / RETORNO aleatórios; no fim
+# o histórico gravado é reproduzido em ordem com as mesmas regras
+# (_aplicar_regras_de_status) e conferido:
+#   - nenhuma transição inválida aceita;
+#   - nenhum colaborador com dois coletores EM OPERACAO;
+#   - LG_ColetoresEstadoAtual igual ao fim da reprodução.
+# --modo antigo roda o caminho de antes (validar numa conexão, gravar em
+# outra, sem índice único) para comparação.
+#
+# Uso:
+#   python benchmarks/stress_concorrencia.py --threads 32 --operacoes 200
+#   python benchmarks/stress_concorrencia.py --modo antigo
+# ------------------------------------------------------------
+from __future__ import annotations
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+_AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_AQUI))
+
+import banco_substituto  # noqa: E402
+import db  # noqa: E402
+import mov_validacoes as mv  # noqa: E402
+
+_ACOES = (
+    ("Entrega Início operação", 4),
+    ("Devolução término operação", 4),
+    ("Envio para conserto", 1),
+    ("Retorno do conserto", 1),
+)
+
+
+def _caminho_antigo(acao_ui, coletor, colab, resp):
+    """Como era antes: valida numa conexão e grava em outra, sem trava."""
+    ac = mv.normalizar_acao(acao_ui)
+    ok, msg = mv.validar_regras_de_status(ac, coletor, colab)
+    if not ok:
+        return False, msg
+    mv.inserir_mov_principal(mv.MovDados(
+        mv.ID_REGISTRO[ac], coletor, colab, True, False, False, None, resp, None, None, None))
+    return True, mv.MSG_SUCESSO
+
+
+def _estacao(n, operacoes, coletores, colaboradores, modo, barreira, contagem, lock):
+    rnd = random.Random(n)
+    acoes, pesos = zip(*_ACOES)
+    local = Counter()
+    barreira.wait()
+    for _ in range(operacoes):
+        acao = rnd.choices(acoes, pesos)[0]
+        coletor, colab = rnd.choice(coletores), rnd.choice(colaboradores)
+        if modo == "antigo":
+            try:
+                ok, msg = _caminho_antigo(acao, coletor, colab, f"estacao{n}")
+            except db.Error as e:
+                ok, msg = False, str(e)
+        else:
+            ok, msg = mv.processar_movimentacao(acao, coletor, colab, True, False, False, None,
+                                                f"estacao{n}", None, None, None)
+        local["aceitas" if ok else ("concorrencia" if msg == mv.MSG_CONCORRENCIA else "recusadas")] += 1
+    with lock:
+        contagem.update(local)
+
+
+def conferir(ordem_sql: str):
+    """Reproduz o histórico com as regras; devolve (invalidas, duplos, divergencias_estado)."""
+    with db.conectar() as cn, cn.cursor() as cur:
+        cur.execute("SELECT IDColetorNorm, IDColetor, IDRegistro, IDColaborador "
+                    f"FROM LG_ControleColetores ORDER BY {ordem_sql}")
+        historico = cur.fetchall()
+        cur.execute("SELECT IDColetorNorm, IDRegistro, IDColaborador FROM LG_ColetoresEstadoAtual")
+        projecao = {norm: (idreg, colab) for norm, idreg, colab in cur.fetchall()}
+
+    estado = {}      # norm -> (idreg, colab)
+    em_op = {}       # colab -> coletor
+    invalidas, duplos = [], 0
+    for norm, coletor, idreg, colab in historico:
+        ac = mv.ACAO_BY_IDREG[idreg]
+        last_idreg, last_colab = estado.get(norm, (None, None))
+        status = mv.STATUS_BY_IDREG.get(last_idreg, "DISPONIVEL")
+        ok, msg = mv._aplicar_regras_de_status(ac, coletor, colab, status, last_colab, em_op.get(colab))
+        if not ok:
+            invalidas.append((coletor, ac, colab, msg))
+        if last_idreg == 1 and em_op.get(last_colab) == coletor:
+            del em_op[last_colab]
+        if idreg == 1:
+            if colab in em_op:
+                duplos += 1
+            em_op[colab] = coletor
+        estado[norm] = (idreg, colab)
+    divergencias = sum(1 for norm, v in estado.items() if projecao.get(norm) != v)
+    return invalidas, duplos, divergencias
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Teste de estresse de estações concorrentes.")
+    parser.add_argument("--banco", default=os.path.join(_AQUI, "dados", "stress.sqlite3"))
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--operacoes", type=int, default=200, help="por thread")
+    parser.add_argument("--coletores", type=int, default=6)
+    parser.add_argument("--colaboradores", type=int, default=6)
+    parser.add_argument("--modo", choices=["atomico", "antigo"], default="atomico")
+    args = parser.parse_args(argv)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.banco)), exist_ok=True)
+    for sufixo in ("", "-wal", "-shm"):
+        if os.path.exists(args.banco + sufixo):
+            os.remove(args.banco + sufixo)
+    banco_substituto.criar_esquema(args.banco)
+    db.CONFIG.update(BACKEND="sqlite", SQLITE_PATH=args.banco, POOL_MAX=args.threads)
+    db.fechar_pool()
+    if args.modo == "antigo":
+        with db.conectar() as cn:
+            cn.cursor().execute("DROP INDEX UX_LG_ColetoresEstadoAtual_ColabEmOperacao")
+
+    coletores = [f"{i:06d}" if i % 2 else str(i) for i in range(1, args.coletores + 1)]
+    colaboradores = [f"stress.{i:02d}" for i in range(1, args.colaboradores + 1)]
+    barreira = threading.Barrier(args.threads)
+    contagem, lock = Counter(), threading.Lock()
+    threads = [threading.Thread(target=_estacao, args=(n, args.operacoes, coletores, colaboradores,
+                                                       args.modo, barreira, contagem, lock))
+               for n in range(args.threads)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    total = time.perf_counter() - t0
+
+    invalidas, duplos, divergencias = conferir("rowid" if db.CONFIG["BACKEND"] == "sqlite" else "DataRegistro")
+    print(f"modo={args.modo} threads={args.threads} operações={args.threads * args.operacoes} "
+          f"em {total:.1f}s: {dict(contagem)}")
+    print(f"transições inválidas aceitas: {len(invalidas)}")
+    for coletor, ac, colab, msg in invalidas[:5]:
+        print(f"  {coletor} {ac} {colab}: {msg}")
+    print(f"colaborador com dois coletores EM OPERACAO: {duplos}")
+    print(f"estado atual divergente do histórico: {divergencias}")
+    db.fechar_pool()
+    if args.modo == "atomico" and (invalidas or duplos or divergencias):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+# cache_lookup.py
+# ------------------------------------------------------------
+# Cache em memória para cadastros que mudam pouco (coletores, usuários).
+# - carga em massa (uma consulta) e respostas por chave normalizada
+# - atualização periódica por partição: a tabela é dividida em faixas
+#   (hash da chave) com uma marca cada; só as faixas cuja marca mudou são
+#   relidas, o resto fica como está. Marca exata: COUNT + MAX(rowversion).
+#   Sem rowversion (view de outro banco), COUNT + CHECKSUM_AGG é só
+#   heurística (o XOR se anula em pares, BINARY_CHECKSUM ignora colunas
+#   longas): quem confirma é a recarga completa (recarga_completa=)
+# - falta no cache => consulta pontual ao banco; ausências também são
+#   guardadas por pouco tempo (cache negativo) e saem quando vencem
+# - limite de itens (LRU) e contadores de acerto/erro
+# - busca por trecho (opcional, texto_busca=): índice de n-gramas em
+#   memória mantido junto com os itens; a recarga só reindexa o que mudou
+#   e a busca nunca vai ao banco
+# ------------------------------------------------------------
+from __future__ import annotations
+import bisect
+import heapq
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+_AUSENTE = object()
+
+
+def dobrar(texto: str) -> str:
+    """Maiúsculas sem acento ('José' -> 'JOSE'), para comparar como o operador digita."""
+    decomposto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in decomposto if not unicodedata.combining(c)).upper()
+
+
+class IndiceTexto:
+    """
+    Índice de busca por trecho: cada palavra do texto entra com os trigramas
+    e com os prefixos de 1 a 3 letras ('^J', '^JO', '^JOS'). Termo curto
+    casa com início de palavra; termo de 3 letras com qualquer trecho de
+    palavra; aí a lista já é a resposta exata. Termo maior sai da
+    interseção dos seus trigramas (a menor lista primeiro) e é conferido no
+    texto. A ordenação também sai das listas, sem olhar candidato a
+    candidato.
+    """
+
+    def __init__(self):
+        self._textos: Dict[str, str] = {}                 # chave -> texto dobrado
+        self._listas: Dict[str, Set[str]] = {}
+        self._chaves: List[Tuple[str, str]] = []          # (chave dobrada, chave), ordenada
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _gramas(texto: str) -> Set[str]:
+        gramas = set()
+        for palavra in texto.split():
+            gramas.update("^" + palavra[:n] for n in (1, 2, 3))
+            gramas.update(palavra[i:i + 3] for i in range(len(palavra) - 2))
+        return gramas
+
+    @staticmethod
+    def _gramas_termo(termo: str) -> Set[str]:
+        if len(termo) < 3:
+            return {"^" + termo}
+        return {termo[i:i + 3] for i in range(len(termo) - 2)}
+
+    # --- internos (sob self._lock) ---
+    def _remover(self, chave: str, ordenar: bool = True) -> None:
+        texto = self._textos.pop(chave, None)
+        if texto is None:
+            return
+        for g in self._gramas(texto):
+            lista = self._listas.get(g)
+            if lista is not None:
+                lista.discard(chave)
+                if not lista:
+                    del self._listas[g]
+        if ordenar:
+            item = (dobrar(chave), chave)
+            i = bisect.bisect_left(self._chaves, item)
+            if i < len(self._chaves) and self._chaves[i] == item:
+                del self._chaves[i]
+
+    def _adicionar(self, chave: str, texto: str, ordenar: bool = True) -> bool:
+        texto = " ".join(dobrar(texto).split())
+        anterior = self._textos.get(chave)
+        if anterior == texto:
+            return False
+        if anterior is not None:
+            self._remover(chave, ordenar=False)   # a chave fica onde está na lista ordenada
+        elif ordenar:
+            bisect.insort(self._chaves, (dobrar(chave), chave))
+        self._textos[chave] = texto
+        for g in self._gramas(texto):
+            self._listas.setdefault(g, set()).add(chave)
+        return True
+
+    # --- API ---
+    def adicionar(self, chave: str, texto: str) -> None:
+        with self._lock:
+            self._adicionar(chave, texto)
+
+    def remover(self, chave: str) -> None:
+        with self._lock:
+            self._remover(chave)
+
+    def sincronizar(self, textos: Dict[str, str]) -> int:
+        """Deixa o índice igual a `textos`, mexendo só no que mudou. Retorna quantos mudaram."""
+        with self._lock:
+            sairam = [c for c in self._textos if c not in textos]
+            for chave in sairam:
+                self._remover(chave, ordenar=False)
+            mudaram = len(sairam) + sum(self._adicionar(c, t, ordenar=False) for c, t in textos.items())
+            if mudaram:
+                self._chaves = sorted((dobrar(c), c) for c in self._textos)
+            return mudaram
+
+    def buscar(self, consulta: str, limite: int = 10) -> List[str]:
+        """
+        Chaves cujo texto contém todos os termos da consulta (em qualquer
+        ordem). Primeiro as chaves que começam pela consulta (ordem da
+        chave), depois os textos em que os termos começam palavras, depois
+        o resto (ordem do texto).
+        """
+        termos = dobrar(consulta).split()
+        if not termos or limite <= 0:
+            return []
+        with self._lock:
+            listas = []
+            for termo in termos:
+                for g in self._gramas_termo(termo):
+                    lista = self._listas.get(g)
+                    if not lista:
+                        return []
+                    listas.append(lista)
+            listas.sort(key=len)
+            candidatos = listas[0].intersection(*listas[1:]) if len(listas) > 1 else listas[0]
+            longos = [t for t in termos if len(t) > 3]
+            if longos:
+                textos = self._textos
+                candidatos = {c for c in candidatos if all(t in textos[c] for t in longos)}
+
+            achados: List[str] = []
+            junto = "".join(termos)
+            i = bisect.bisect_left(self._chaves, (junto,))
+            while i < len(self._chaves) and len(achados) < limite and self._chaves[i][0].startswith(junto):
+                if self._chaves[i][1] in candidatos:
+                    achados.append(self._chaves[i][1])
+                i += 1
+            if len(achados) == limite:
+                return achados
+            # termos de 3+ letras começando alguma palavra (pelos 3 primeiros caracteres)
+            inicio = [self._listas.get("^" + t[:3], set()) for t in termos if len(t) >= 3]
+            restantes = candidatos.difference(achados)
+            palavra = restantes.intersection(*inicio) if inicio else restantes
+            por_texto = self._textos.__getitem__
+            achados += heapq.nsmallest(limite - len(achados), palavra, key=por_texto)
+            if len(achados) < limite and len(palavra) < len(restantes):
+                achados += heapq.nsmallest(limite - len(achados), restantes - palavra, key=por_texto)
+            return achados
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._textos)
+
+
+class CacheLookup:
+    def __init__(
+        self,
+        nome: str,
+        carregar_particoes: Callable[[Optional[List[int]]], Iterable[Tuple[int, str, str, str]]],
+        buscar_um: Callable[[str], Optional[str]],
+        marcas: Callable[[], Dict[int, object]],
+        normalizar: Callable[[str], str] = lambda s: (s or "").strip(),
+        ttl: float = 600.0,
+        ttl_negativo: float = 60.0,
+        max_itens: int = 50000,
+        texto_busca: Optional[Callable[[str, str], str]] = None,
+        recarga_completa: Optional[float] = None,
+    ):
+        self.nome = nome
+        # partições (None = todas) -> (partição, chave normalizada, valor, chave como cadastrada)
+        self._carregar_particoes = carregar_particoes
+        self._buscar_um = buscar_um
+        # partição -> marca da faixa (COUNT + MAX(rowversion), ou checksum)
+        self._marcas = marcas
+        self._normalizar = normalizar
+        self.ttl = ttl
+        # s entre cargas completas (None = só quando as marcas mudam);
+        # obrigatório quando a marca é heurística
+        self.recarga_completa = recarga_completa
+        self.ttl_negativo = ttl_negativo
+        self.max_itens = max_itens
+        # (chave, valor) -> texto indexado para buscar(); None = sem índice
+        self._texto_busca = texto_busca
+        self._indice: Optional[IndiceTexto] = IndiceTexto() if texto_busca else None
+        # chave -> valor (ou _AUSENTE); ausências têm validade em _negativos
+        self._itens: "OrderedDict[str, object]" = OrderedDict()
+        self._negativos: Dict[str, float] = {}
+        # de onde veio cada chave: partição da carga ou consulta pontual (avulsa)
+        self._particao_de: Dict[str, int] = {}
+        self._por_particao: Dict[int, Set[str]] = {}
+        self._avulsas: Set[str] = set()
+        # chave -> como está no cadastro, quando difere da chave normalizada
+        self._rotulos: Dict[str, str] = {}
+        self._marcas_atuais: Dict[int, object] = {}
+        self._carregado_em: float = 0.0
+        self._carga_completa_em: float = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"acertos": 0, "acertos_negativos": 0, "faltas": 0, "cargas": 0,
+                       "verificacoes": 0, "atualizacoes": 0, "particoes_lidas": 0,
+                       "despejos": 0, "buscas": 0}
+
+    # --- internos (sob self._lock) ---
+    def _guardar(self, chave: str, valor: object, indexar: bool = True,
+                 particao: Optional[int] = None, rotulo: Optional[str] = None) -> None:
+        if chave in self._itens:
+            self._esquecer(chave, indice=False)
+        self._itens[chave] = valor
+        if valor is _AUSENTE:
+            self._negativos[chave] = time.monotonic() + self.ttl_negativo
+        else:
+            if particao is None:
+                self._avulsas.add(chave)
+            else:
+                self._particao_de[chave] = particao
+                self._por_particao.setdefault(particao, set()).add(chave)
+            if rotulo and rotulo != chave:
+                self._rotulos[chave] = rotulo
+            if indexar and self._indice is not None:
+                self._indice.adicionar(chave, self._texto_busca(chave, valor))
+        while len(self._itens) > self.max_itens:
+            velha = next(iter(self._itens))
+            self._esquecer(velha)
+            self._stats["despejos"] += 1
+
+    def _esquecer(self, chave: str, indice: bool = True) -> None:
+        self._itens.pop(chave, None)
+        self._negativos.pop(chave, None)
+        self._avulsas.discard(chave)
+        self._rotulos.pop(chave, None)
+        particao = self._particao_de.pop(chave, None)
+        if particao is not None and particao in self._por_particao:
+            self._por_particao[particao].discard(chave)
+        if indice and self._indice is not None:
+            self._indice.remover(chave)
+
+    # --- API ---
+    def carregar(self) -> int:
+        """Carga completa (substitui o conteúdo). Retorna o número de itens."""
+        marcas = self._marcas()
+        linhas = self._carregar_particoes(None)
+        with self._lock:
+            self._itens.clear()
+            self._negativos.clear()
+            self._particao_de.clear()
+            self._por_particao.clear()
+            self._avulsas.clear()
+            self._rotulos.clear()
+            for particao, chave, valor, rotulo in linhas:
+                if chave not in self._itens:   # chave repetida: a primeira vence
+                    self._guardar(chave, valor, indexar=False, particao=particao, rotulo=rotulo)
+            self._marcas_atuais = marcas
+            self._carregado_em = self._carga_completa_em = time.monotonic()
+            self._stats["cargas"] += 1
+            n = len(self._itens)
+            textos = ({k: self._texto_busca(k, v) for k, v in self._itens.items()}
+                      if self._indice is not None else None)
+        if textos is not None:
+            # fora do lock: só quem busca espera (a primeira carga indexa tudo)
+            self._indice.sincronizar(textos)
+        return n
+
+    def atualizar_se_mudou(self) -> bool:
+        """
+        Consulta só as marcas das partições e relê as que mudaram: as chaves
+        dessas partições são trocadas pelo que veio do banco (quem saiu some
+        também da busca). Havendo mudança, ausências e consultas avulsas
+        são descartadas. Passado `recarga_completa`, recarrega tudo (a marca
+        heurística pode não ter visto uma mudança). Retorna True se releu.
+        """
+        if (self.recarga_completa is not None and self._carga_completa_em
+                and time.monotonic() - self._carga_completa_em > self.recarga_completa):
+            self.carregar()
+            return True
+        marcas = self._marcas()
+        with self._lock:
+            self._stats["verificacoes"] += 1
+            carregado = bool(self._carregado_em)
+            mudaram = sorted(p for p in set(marcas) | set(self._marcas_atuais)
+                             if marcas.get(p) != self._marcas_atuais.get(p))
+            if carregado and not mudaram:
+                self._carregado_em = time.monotonic()
+                return False
+        if not carregado:
+            self.carregar()
+            return True
+        linhas = self._carregar_particoes(mudaram)
+        with self._lock:
+            for particao in mudaram:
+                for chave in list(self._por_particao.pop(particao, ())):
+                    self._esquecer(chave)
+            for chave in list(self._avulsas) + list(self._negativos):
+                self._esquecer(chave)
+            for particao, chave, valor, rotulo in linhas:
+                if chave not in self._itens:
+                    self._guardar(chave, valor, particao=particao, rotulo=rotulo)
+            self._marcas_atuais = marcas
+            self._carregado_em = time.monotonic()
+            self._stats["atualizacoes"] += 1
+            self._stats["particoes_lidas"] += len(mudaram)
+        return True
+
+    def obter(self, chave_bruta: str) -> Optional[str]:
+        chave = self._normalizar(chave_bruta)
+        if not chave:
+            return None
+        with self._lock:
+            valor = self._itens.get(chave, None)
+            if valor is _AUSENTE:
+                if self._negativos.get(chave, 0) > time.monotonic():
+                    self._stats["acertos_negativos"] += 1
+                    return None
+            elif valor is not None:
+                self._itens.move_to_end(chave)
+                self._stats["acertos"] += 1
+                return valor  # type: ignore[return-value]
+            self._stats["faltas"] += 1
+        # fora do lock: ida ao banco
+        valor = self._buscar_um(chave)
+        with self._lock:
+            self._guardar(chave, _AUSENTE if valor is None else valor)
+        return valor
+
+    def buscar(self, consulta: str, limite: int = 10) -> List[Tuple[str, str]]:
+        """(chave como cadastrada, valor) cujo texto de busca contém os termos de `consulta`; só memória."""
+        if self._indice is None:
+            raise RuntimeError(f"Cache {self.nome} sem índice de busca (texto_busca=).")
+        chaves = self._indice.buscar(consulta, limite)
+        with self._lock:
+            self._stats["buscas"] += 1
+            valores = [(self._rotulos.get(c, c), self._itens.get(c, _AUSENTE)) for c in chaves]
+        return [(c, v) for c, v in valores if v is not _AUSENTE]  # type: ignore[misc]
+
+    def limpar_ausencias(self) -> int:
+        """Tira do cache as ausências vencidas (não esperam a próxima mudança). Retorna quantas."""
+        agora = time.monotonic()
+        with self._lock:
+            vencidas = [c for c, validade in self._negativos.items() if validade <= agora]
+            for chave in vencidas:
+                self._esquecer(chave)
+        return len(vencidas)
+
+    def vencido(self) -> bool:
+        return not self._carregado_em or time.monotonic() - self._carregado_em > self.ttl
+
+    def itens(self) -> Dict[str, str]:
+        """Cópia dos itens conhecidos (sem as ausências)."""
+        with self._lock:
+            return {k: v for k, v in self._itens.items() if v is not _AUSENTE}  # type: ignore[misc]
+
+    def estatisticas(self) -> Dict[str, int]:
+        with self._lock:
+            st = dict(self._stats)
+            st["itens"] = len(self._itens)
+            st["negativos"] = len(self._negativos)
+        if self._indice is not None:
+            st["indexados"] = len(self._indice)
+        return st
+
+
+class AtualizadorCaches(threading.Thread):
+    """Thread que carrega os caches e, a cada `intervalo`, atualiza os vencidos."""
+
+    def __init__(self, caches: Tuple[CacheLookup, ...], intervalo: float = 30.0):
+        super().__init__(name="cache-lookup", daemon=True)
+        self._caches = caches
+        self._intervalo = intervalo
+        self._parar = threading.Event()
+
+    def run(self) -> None:
+        for cache in self._caches:
+            try:
+                cache.carregar()
+            except Exception as e:  # fica com a consulta pontual até a próxima rodada
+                print(f"Falha ao carregar cache {cache.nome}: {e}")
+        while not self._parar.wait(self._intervalo):
+            for cache in self._caches:
+                cache.limpar_ausencias()
+                if cache.vencido():
+                    try:
+                        cache.atualizar_se_mudou()
+                    except Exception as e:
+                        print(f"Falha ao atualizar cache {cache.nome}: {e}")
+
+    def parar(self) -> None:
+        self._parar.set()
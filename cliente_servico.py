@@ -0,0 +1,308 @@
+# cliente_servico.py
+# ------------------------------------------------------------
+# Cliente do serviço local de movimentações (servico.py).
+# Mesmas assinaturas usadas pela UI em mov_validacoes/totais_incrementais,
+# para o ui_principal trocar de backend só pela variável de ambiente:
+#   COLETORES_SERVICO_URL=https://servidor-cd:8765
+#   COLETORES_SERVICO_TOKEN=<o mesmo do serviço>   (enviado em toda chamada)
+#   COLETORES_SERVICO_CA=<PEM da CA>               (certificado interno, opcional)
+# - uma conexão HTTP keep-alive por thread (executor da UI)
+# - GET é repetido uma vez se o socket reaproveitado tiver caído; POST só
+#   com chave de idempotência (o serviço ignora a movimentação repetida)
+# - serviço fora do ar: a movimentação vai para o diário offline da própria
+#   estação (com a chave de idempotência); reenviar_pendentes() a manda
+#   depois pelo mesmo /movimentacao, e a chave torna o envio repetido inócuo
+# - serviço fora: o mesmo disjuntor do db.py (falha na hora durante a
+#   espera, depois uma sonda por vez); estado_conexao() para a tela
+# ------------------------------------------------------------
+from __future__ import annotations
+import http.client
+import json
+import os
+import socket
+import ssl
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode, urlsplit
+
+import db as _db
+from diario_offline import CONFLITO, ENVIADO, obter_diario
+from frota_lista import TAMANHO_PAGINA, ColetorFrota, PaginaFrota
+from mov_validacoes import (
+    ACAO_BY_IDREG,
+    LIMITE_SUGESTOES,
+    DefeitoItem,
+    MovDados,
+    ResultadoLote,
+    montar_movimentacao,
+    nova_chave,
+    registrar_offline,
+)
+
+URL = os.getenv("COLETORES_SERVICO_URL", "").rstrip("/")
+TIMEOUT = float(os.getenv("COLETORES_SERVICO_TIMEOUT", "10"))
+TOKEN = os.getenv("COLETORES_SERVICO_TOKEN", "")
+CA = os.getenv("COLETORES_SERVICO_CA", "")
+
+
+class ServicoIndisponivel(RuntimeError):
+    """Serviço fora do ar ou respondeu com erro."""
+
+
+class ServicoRecusou(ServicoIndisponivel):
+    """O serviço respondeu, mas com erro (HTTP diferente de 200)."""
+
+
+def ativo() -> bool:
+    return bool(URL)
+
+
+def configurar(url: str, token: Optional[str] = None) -> None:
+    """Troca a URL (e o token) do serviço (testes/ferramentas); vale para as próximas chamadas."""
+    global URL, TOKEN
+    URL = url.rstrip("/")
+    if token is not None:
+        TOKEN = token
+    _local.__dict__.clear()
+
+
+_local = threading.local()
+_disjuntor = _db.Disjuntor("Serviço de movimentações")
+
+
+def estado_conexao() -> Dict:
+    return _disjuntor.estado()
+
+
+def _conexao(nova: bool = False) -> http.client.HTTPConnection:
+    cn = getattr(_local, "cn", None)
+    if cn is None or nova or getattr(_local, "url", None) != URL:
+        if cn is not None:
+            cn.close()
+        partes = urlsplit(URL)
+        if partes.scheme == "https":
+            ctx = ssl.create_default_context(cafile=CA or None)
+            cn = http.client.HTTPSConnection(partes.hostname, partes.port or 443, timeout=TIMEOUT, context=ctx)
+        else:
+            cn = http.client.HTTPConnection(partes.hostname, partes.port or 80, timeout=TIMEOUT)
+        cn.connect()
+        cn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # sem atraso de Nagle
+        _local.cn, _local.url = cn, URL
+    return cn
+
+
+def _chamar(metodo: str, caminho: str, corpo: Optional[Dict] = None, repetivel: bool = False):
+    if not URL:
+        raise ServicoIndisponivel("COLETORES_SERVICO_URL não configurada.")
+    dados = json.dumps(corpo).encode("utf-8") if corpo is not None else None
+    cabecalhos = {"Content-Type": "application/json"} if dados is not None else {}
+    if TOKEN:
+        cabecalhos["Authorization"] = f"Bearer {TOKEN}"
+    tentativas = 2 if metodo == "GET" or repetivel else 1
+    try:
+        sonda = _disjuntor.antes()
+    except _db.CircuitoAberto as e:
+        raise ServicoIndisponivel(e.args[-1]) from None
+    try:
+        resp, bruto = _enviar(metodo, caminho, dados, cabecalhos, tentativas)
+    except ServicoIndisponivel:
+        _disjuntor.falha()
+        raise
+    except BaseException:
+        if sonda:
+            _disjuntor.liberar()
+        raise
+    _disjuntor.sucesso()  # respondeu (mesmo com erro HTTP): está no ar
+    resposta = json.loads(bruto.decode("utf-8")) if bruto else {}
+    if resp.status != 200:
+        raise ServicoRecusou(resposta.get("erro") or f"HTTP {resp.status}")
+    return resposta
+
+
+def _enviar(metodo: str, caminho: str, dados: Optional[bytes], cabecalhos: Dict, tentativas: int):
+    for tentativa in range(tentativas):
+        try:
+            cn = _conexao(nova=tentativa > 0)
+            cn.request(metodo, caminho, body=dados, headers=cabecalhos)
+            resp = cn.getresponse()
+            bruto = resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            if getattr(_local, "cn", None) is not None:
+                _local.cn.close()
+            _local.cn = None
+            if tentativa + 1 < tentativas:
+                continue
+            raise ServicoIndisponivel(f"Serviço de movimentações indisponível ({URL}): {e}") from e
+        return resp, bruto
+
+
+# ---------------------------
+# Mesmas funções da camada local
+# ---------------------------
+
+def _corpo_movimentacao(mov: MovDados, itens: List[DefeitoItem]) -> Dict:
+    return {
+        "acao": ACAO_BY_IDREG[mov.id_registro],
+        "id_coletor": mov.id_coletor,
+        "id_resp": mov.id_colaborador,
+        "realizado_teste": mov.realizado_teste,
+        "detectado_defeito": mov.detectado_defeito,
+        "sinaliza_conserto": mov.sinaliza_conserto,
+        "observacao": mov.observacao,
+        "resp_processo": mov.resp_processo,
+        "data_envio_conserto": mov.data_envio_conserto,
+        "chamado": mov.chamado,
+        "data_retorno_conserto": mov.data_retorno_conserto,
+        "defeitos": [it.id_defeito for it in itens],
+        "chave": mov.chave,
+    }
+
+
+def processar_movimentacao(
+    acao_ui: str,
+    id_coletor: str,
+    id_resp: Optional[str],
+    realizado_teste: bool,
+    detectado_defeito: bool,
+    sinaliza_conserto: bool,
+    observacao: Optional[str],
+    resp_processo: str,
+    data_envio_conserto: Optional[str],
+    chamado: Optional[str],
+    data_retorno_conserto: Optional[str],
+    lista_defeitos_escolhidos: Optional[List[str]] = None,
+    chave_idempotencia: Optional[str] = None,
+) -> Tuple[bool, str]:
+    # sempre com chave: sem resposta, não dá para saber se o serviço gravou
+    mov, itens, msg = montar_movimentacao(
+        acao_ui, id_coletor, id_resp, realizado_teste, detectado_defeito, sinaliza_conserto,
+        observacao, resp_processo, data_envio_conserto, chamado, data_retorno_conserto,
+        lista_defeitos_escolhidos, chave_idempotencia or nova_chave(),
+    )
+    if mov is None:
+        return False, msg
+    try:
+        r = _chamar("POST", "/movimentacao", _corpo_movimentacao(mov, itens), repetivel=True)
+    except ServicoRecusou as e:
+        return False, str(e)
+    except ServicoIndisponivel:
+        return registrar_offline(mov, itens)
+    return r["ok"], r["mensagem"]
+
+
+def processar_lote(itens: List[Tuple[str, Optional[str], str]], resp_processo: str) -> List[ResultadoLote]:
+    r = _chamar("POST", "/lote", {
+        "itens": [{"id_coletor": c, "id_resp": p, "acao": a} for c, p, a in itens],
+        "resp_processo": resp_processo,
+    })
+    return [ResultadoLote(**x) for x in r["resultados"]]
+
+
+def status_do_coletor(id_coletor: str) -> Tuple[str, Optional[str]]:
+    r = _chamar("GET", "/status?" + urlencode({"coletor": id_coletor}))
+    return r["status"], r["colaborador"]
+
+
+def nome_coletor_ou_usuario(id_busca: str, modo: str) -> Optional[str]:
+    return _chamar("GET", "/nome?" + urlencode({"id": id_busca, "modo": modo}))["nome"]
+
+
+def buscar_usuarios(texto: str, limite: int = LIMITE_SUGESTOES) -> List[Tuple[str, str]]:
+    r = _chamar("GET", "/usuarios?" + urlencode({"texto": texto, "limite": limite}))
+    return [(i, nome) for i, nome in r["usuarios"]]
+
+
+def verificar_login(usuario: str, senha: str) -> bool:
+    return bool(_chamar("POST", "/login", {"usuario": usuario, "senha": senha})["ok"])
+
+
+_reenvio_lock = threading.Lock()  # um reenvio por processo: dois mandariam os mesmos pendentes
+
+
+def reenviar_pendentes(lote: int = 500) -> Tuple[int, List[Tuple[int, str]]]:
+    """
+    Manda o diário offline da estação ao serviço, um item por vez pelo
+    /movimentacao e na ordem em que foram registrados (o serviço revalida
+    cada um no estado atual). Item que já tinha chegado volta como
+    MSG_JA_REGISTRADA pela chave. Serviço ainda fora: marca o que foi e
+    propaga ServicoIndisponivel. Retorna (enviados, [(id_local, mensagem_do_conflito)]).
+    """
+    with _reenvio_lock:
+        return _reenviar_pendentes(lote)
+
+
+def _reenviar_pendentes(lote: int) -> Tuple[int, List[Tuple[int, str]]]:
+    diario = obter_diario()
+    enviados = 0
+    conflitos: List[Tuple[int, str]] = []
+    while True:
+        pend = diario.pendentes(lote)
+        if not pend:
+            break
+        resultados: List[Tuple[int, str, Optional[str]]] = []
+        try:
+            for id_local, _criado_em, mov_d, defs_d in pend:
+                mov = MovDados(**mov_d)
+                r = _chamar("POST", "/movimentacao",
+                            _corpo_movimentacao(mov, [DefeitoItem(**x) for x in defs_d]),
+                            repetivel=bool(mov.chave))
+                if r["ok"]:
+                    resultados.append((id_local, ENVIADO, None))
+                    enviados += 1
+                elif not r.get("repetir"):   # concorrência: fica pendente para a próxima rodada
+                    resultados.append((id_local, CONFLITO, r["mensagem"]))
+                    conflitos.append((id_local, r["mensagem"]))
+        finally:
+            diario.marcar(resultados)
+        if len(pend) < lote or len(resultados) < len(pend):
+            break
+    return enviados, conflitos
+
+
+def relatorio_frota(atualizar: bool = False) -> Dict:
+    return _chamar("GET", "/analise?" + urlencode({"atualizar": int(atualizar)}))
+
+
+def _filtros_frota(status: Optional[str], colaborador: Optional[str], serie: Optional[str]) -> Dict:
+    return {c: v for c, v in (("status", status), ("colaborador", colaborador), ("serie", serie)) if v}
+
+
+def pagina_frota(apos: Optional[str] = None, tamanho: int = TAMANHO_PAGINA, status: Optional[str] = None,
+                 colaborador: Optional[str] = None, serie: Optional[str] = None) -> PaginaFrota:
+    q = {"apos": apos or "", "tamanho": tamanho, **_filtros_frota(status, colaborador, serie)}
+    r = _chamar("GET", "/frota?" + urlencode(q))
+    itens = [ColetorFrota(**{**x, "data_registro": datetime.fromisoformat(x["data_registro"])
+                             if x["data_registro"] else None}) for x in r["itens"]]
+    return PaginaFrota(itens, r["proxima"])
+
+
+def contar_frota(status: Optional[str] = None, colaborador: Optional[str] = None,
+                 serie: Optional[str] = None) -> int:
+    q = _filtros_frota(status, colaborador, serie)
+    return _chamar("GET", "/frota/contagem?" + urlencode(q))["total"]
+
+
+def saude() -> Dict:
+    return _chamar("GET", "/saude")
+
+
+class TotaisRemotos:
+    """Mesma interface de TotaisIncrementais, lendo /totais do serviço."""
+
+    def __init__(self):
+        self._totais: Dict[str, int] = {}
+
+    def carregar(self) -> Dict[str, int]:
+        return self.atualizar()
+
+    def atualizar(self) -> Dict[str, int]:
+        self._totais = _chamar("GET", "/totais")
+        return dict(self._totais)
+
+    def aplicar_local(self, id_coletor: str, id_registro: int) -> Dict[str, int]:
+        # o serviço já aplicou; a próxima atualização traz o número novo
+        return dict(self._totais)
+
+    def totais(self) -> Dict[str, int]:
+        return dict(self._totais)
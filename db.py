@@ -1,7 +1,28 @@
 # DB.py
+from __future__ import annotations
+import math
 import os
-import pyodbc
-from typing import Dict, Tuple
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as _TempoEsgotado
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial, wraps
+from typing import Any, Callable, Deque, Dict, Iterable, Optional, Tuple
+
+try:
+    import pyodbc
+except ImportError:  # sem gerenciador ODBC: só o banco substituto (DB_BACKEND=sqlite)
+    pyodbc = None
+import banco_substituto
+import instrumentacao as _instr
+from instrumentacao import operacao  # noqa: F401  (db.operacao("nome") nas camadas de cima)
+
+# Exceções de banco dos dois backends: use `except db.Error`
+Error = (pyodbc.Error, banco_substituto.Error) if pyodbc else (banco_substituto.Error,)
 
 # ---------------------------
 # Configuração (use .env/ambiente)
@@ -21,14 +42,64 @@ CONFIG = {
     "CONNECT_TIMEOUT": os.getenv("DB_CONNECT_TIMEOUT", "5"),  # segundos
     "ENCRYPT": os.getenv("DB_ENCRYPT", "yes"),                # Driver 18 exige encrypt
     "TRUST_CERT": os.getenv("DB_TRUST_CERT", "yes"),          # ok se não usar CA corporativa
+    # "odbc" (SQL Server) ou "sqlite" (banco_substituto.py: benchmarks/testes locais)
+    "BACKEND": os.getenv("DB_BACKEND", "odbc"),
+    "SQLITE_PATH": os.getenv("DB_SQLITE_PATH", "coletores_local.sqlite3"),
+    # Pool de conexões
+    "POOL_MAX": int(os.getenv("DB_POOL_MAX", "4")),                   # conexões simultâneas
+    "POOL_TIMEOUT": float(os.getenv("DB_POOL_TIMEOUT", "10")),        # espera por conexão livre (s)
+    "POOL_MAX_IDLE": float(os.getenv("DB_POOL_MAX_IDLE", "300")),     # ociosa além disso é descartada (s)
+    "POOL_MAX_LIFETIME": float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),  # idade máxima (s)
+    "POOL_PING_AFTER": float(os.getenv("DB_POOL_PING_AFTER", "30")),  # ociosa além disso faz SELECT 1 (s)
+    # Leituras numa réplica: DB_READ_SERVER (outro servidor) e/ou
+    # DB_READ_INTENT=yes (ApplicationIntent=ReadOnly: secundária legível do AG);
+    # no banco substituto, DB_READ_SQLITE_PATH. Vazio = tudo no primário.
+    "LEITURA_SERVER": os.getenv("DB_READ_SERVER", ""),
+    "LEITURA_INTENT": os.getenv("DB_READ_INTENT", "no"),
+    "LEITURA_SQLITE_PATH": os.getenv("DB_READ_SQLITE_PATH", ""),
+    # Depois de um commit, leituras vão ao primário por este tempo (s): a
+    # estação vê o que acabou de gravar mesmo com a réplica atrasada
+    "LEITURA_APOS_ESCRITA": float(os.getenv("DB_READ_AFTER_WRITE", "2")),
+    # Vários CDs (sites): DB_SITES=SP,RJ,... e, por site, DB_<SITE>_SERVER,
+    # _NAME, _USER, _PASS, _BACKEND, _SQLITE_PATH, _TIMEOUT (o que faltar vem daqui)
+    "SITES": os.getenv("DB_SITES", ""),
+    "SITE_TIMEOUT": float(os.getenv("DB_SITE_TIMEOUT", "10")),        # resposta de cada site (s)
+    "SITES_THREADS": int(os.getenv("DB_SITES_THREADS", "16")),        # consultas simultâneas aos sites
+    # Disjuntor: após N falhas de conexão seguidas, conectar() falha na hora
+    # durante a espera; depois uma sonda por vez, espera dobrando até o máximo
+    "DISJUNTOR_FALHAS": int(os.getenv("DB_BREAKER_FAILURES", "3")),
+    "DISJUNTOR_ESPERA": float(os.getenv("DB_BREAKER_COOLDOWN", "5")),        # s
+    "DISJUNTOR_ESPERA_MAX": float(os.getenv("DB_BREAKER_MAX_COOLDOWN", "60")),  # s
+    # Leituras com repetir_transitorio: tentativas e espera inicial (s)
+    "REPETICOES": int(os.getenv("DB_RETRIES", "3")),
+    "REPETICAO_ESPERA": float(os.getenv("DB_RETRY_DELAY", "0.2")),
+    # Espera máxima por trava de linha na validação+gravação (ms)
+    "LOCK_TIMEOUT_MS": int(os.getenv("DB_LOCK_TIMEOUT_MS", "5000")),
+    # Instrumentação (instrumentacao.py; liga com DB_INSTRUMENTACAO=1)
+    "METRICAS_JSON": os.getenv("DB_METRICAS_JSON", ""),
+    "METRICAS_PORTA": int(os.getenv("DB_METRICAS_PORTA", "0")),
+    "METRICAS_INTERVALO": float(os.getenv("DB_METRICAS_INTERVALO", "15")),
 }
 
+_driver_lock = threading.Lock()
+_driver_escolhido: Optional[str] = None
+
 def _pick_driver() -> str:
-    """Escolhe o primeiro driver disponível da lista de preferência."""
-    installed = set(pyodbc.drivers())
-    for drv in CONFIG["PREFERRED_DRIVERS"]:
-        if drv in installed:
-            return drv
+    """
+    Escolhe o primeiro driver disponível da lista de preferência.
+    A escolha é feita uma única vez por processo (pyodbc.drivers() é caro).
+    """
+    global _driver_escolhido
+    if _driver_escolhido is not None:
+        return _driver_escolhido
+    with _driver_lock:
+        if _driver_escolhido is not None:
+            return _driver_escolhido
+        installed = set(pyodbc.drivers())
+        for drv in CONFIG["PREFERRED_DRIVERS"]:
+            if drv in installed:
+                _driver_escolhido = drv
+                return drv
     raise RuntimeError(
         "Nenhum driver ODBC do SQL Server compatível foi encontrado.\n"
         f"Instalados: {sorted(installed)}\n"
@@ -36,29 +107,41 @@ def _pick_driver() -> str:
         "ou ajuste o nome do driver na connection string."
     )
 
-def _make_cnxn_string(driver: str) -> str:
+def _make_cnxn_string(driver: str, cfg: Optional[Dict] = None) -> str:
     # Para Driver 18: Encrypt=YES é padrão; se não tiver CA, use TrustServerCertificate=YES.
     # Para Driver 17/13, esses parâmetros são ignorados se não suportados.
+    cfg = cfg or CONFIG
     return (
         f"DRIVER={{{driver}}};"
-        f"SERVER={CONFIG['SERVER']};"
-        f"DATABASE={CONFIG['DATABASE']};"
-        f"UID={CONFIG['UID']};"
-        f"PWD={CONFIG['PWD']};"
-        f"Encrypt={CONFIG['ENCRYPT']};"
-        f"TrustServerCertificate={CONFIG['TRUST_CERT']};"
-        f"Connection Timeout={CONFIG['CONNECT_TIMEOUT']};"
+        f"SERVER={cfg['SERVER']};"
+        f"DATABASE={cfg['DATABASE']};"
+        f"UID={cfg['UID']};"
+        f"PWD={cfg['PWD']};"
+        f"Encrypt={cfg['ENCRYPT']};"
+        f"TrustServerCertificate={cfg['TRUST_CERT']};"
+        f"Connection Timeout={cfg['CONNECT_TIMEOUT']};"
+        + ("ApplicationIntent=ReadOnly;" if cfg.get("SOMENTE_LEITURA") else "")
     )
 
-def conectar() -> pyodbc.Connection:
+def _abrir_conexao(cfg: Optional[Dict] = None) -> pyodbc.Connection:
     """
-    Cria e retorna uma conexão com o SQL Server tentando drivers compatíveis.
-    Levanta uma exceção com mensagem amigável se não houver driver.
+    Abre uma conexão nova (sem pool) com o SQL Server (padrão: CONFIG;
+    cfg = perfil de um site). Levanta uma exceção com mensagem amigável se
+    não houver driver.
     """
+    cfg = cfg or CONFIG
+    if cfg["BACKEND"] == "sqlite":
+        return banco_substituto.connect(cfg["SQLITE_PATH"], timeout=float(cfg.get("TIMEOUT", 30.0)))
+    if pyodbc is None:
+        raise RuntimeError("pyodbc não está disponível (instale o pyodbc e o ODBC Driver do SQL Server).")
     driver = _pick_driver()
-    conn_str = _make_cnxn_string(driver)
+    conn_str = _make_cnxn_string(driver, cfg)
     try:
-        return pyodbc.connect(conn_str)
+        raw = pyodbc.connect(conn_str)
+        if "TIMEOUT" in cfg:
+            # site lento não prende a thread do fan-out para sempre (0 = sem limite no pyodbc)
+            raw.timeout = max(1, math.ceil(cfg["TIMEOUT"]))
+        return raw
     except pyodbc.Error as ex:
         # Mensagem melhor para IM002 (fonte de dados/driver)
         if ex.args and isinstance(ex.args[0], str) and ex.args[0].startswith("IM002"):
@@ -69,6 +152,813 @@ def conectar() -> pyodbc.Connection:
             ) from ex
         raise
 
+# SQLSTATEs de falha de comunicação/timeout (servidor fora, rede caiu)
+_SQLSTATES_CONEXAO = ("08001", "08S01", "08004", "08007", "HYT00", "HYT01")
+
+def erro_de_conexao(ex: BaseException) -> bool:
+    """True se a exceção indica servidor inalcançável (e não erro de SQL/regra)."""
+    if erro_de_concorrencia(ex):  # deadlock também chega como OperationalError
+        return False
+    if pyodbc is not None and isinstance(ex, pyodbc.OperationalError):
+        return True
+    if isinstance(ex, Error) and ex.args:
+        return str(ex.args[0])[:5] in _SQLSTATES_CONEXAO
+    return False
+
+# Concorrência: deadlock (1205), tempo de trava esgotado (1222) e chave única
+# violada (2601/2627) — outra estação mexeu no mesmo coletor/colaborador.
+_SQLSTATES_CONCORRENCIA = ("40001",)
+_ERROS_CONCORRENCIA = ("(1205)", "(1222)", "(2601)", "(2627)", "UNIQUE constraint failed")
+
+def erro_de_concorrencia(ex: BaseException) -> bool:
+    """True se a exceção é conflito com outra transação (vale repetir a operação)."""
+    if not isinstance(ex, Error) or not ex.args:
+        return False
+    if str(ex.args[0])[:5] in _SQLSTATES_CONCORRENCIA:
+        return True
+    texto = " ".join(str(a) for a in ex.args)
+    return any(marca in texto for marca in _ERROS_CONCORRENCIA)
+
+def repetir_transitorio(tentativas: Optional[int] = None):
+    """
+    Decorador para leituras (seguras para repetir): erro de conexão ou de
+    concorrência repete até `tentativas` vezes (padrão CONFIG["REPETICOES"])
+    com espera exponencial e aleatória. Disjuntor aberto não repete.
+    """
+    def decorador(fn):
+        @wraps(fn)
+        def embrulho(*args, **kwargs):
+            n = tentativas or CONFIG["REPETICOES"]
+            for tentativa in range(n):
+                try:
+                    return fn(*args, **kwargs)
+                except Error as ex:
+                    transitorio = erro_de_conexao(ex) or erro_de_concorrencia(ex)
+                    if isinstance(ex, CircuitoAberto) or not transitorio or tentativa + 1 >= n:
+                        raise
+                    time.sleep(CONFIG["REPETICAO_ESPERA"] * (2 ** tentativa) * random.uniform(0.5, 1.0))
+        return embrulho
+    return decorador
+
+# ---------------------------
+# Disjuntor (circuit breaker)
+# ---------------------------
+
+_ErroOperacional = pyodbc.OperationalError if pyodbc else banco_substituto.OperationalError
+
+class CircuitoAberto(_ErroOperacional):
+    """conectar() recusado sem ir ao servidor: disjuntor aberto (conta como erro de conexão)."""
+
+FECHADO, ABERTO, MEIO_ABERTO = "fechado", "aberto", "meio_aberto"
+
+class Disjuntor:
+    """
+    - fechado: tudo passa; `falhas` falhas de conexão seguidas abrem;
+    - aberto: recusa na hora (CircuitoAberto) até passar a espera;
+    - meio-aberto: passada a espera, UMA chamada vai ao servidor (sonda);
+      sucesso fecha, falha reabre com a espera dobrada (até espera_max).
+    """
+
+    def __init__(self, nome: str, falhas: Optional[int] = None, espera: Optional[float] = None,
+                 espera_max: Optional[float] = None):
+        self.nome = nome
+        self.falhas = falhas or CONFIG["DISJUNTOR_FALHAS"]
+        self.espera = espera or CONFIG["DISJUNTOR_ESPERA"]
+        self.espera_max = espera_max or CONFIG["DISJUNTOR_ESPERA_MAX"]
+        self._lock = threading.Lock()
+        self._estado = FECHADO
+        self._seguidas = 0
+        self._espera_atual = self.espera
+        self._tentar_em = 0.0
+        self._sondando = False
+        self.stats: Dict[str, int] = {"aberturas": 0, "recusas": 0, "sondas": 0}
+
+    def antes(self) -> bool:
+        """Levanta CircuitoAberto se a chamada não pode ir ao servidor; True se ela é a sonda."""
+        with self._lock:
+            if self._estado == FECHADO:
+                return False
+            agora = time.monotonic()
+            if self._sondando or agora < self._tentar_em:
+                self.stats["recusas"] += 1
+                raise CircuitoAberto("08001", f"{self.nome} indisponível; nova tentativa em "
+                                              f"{max(0.0, self._tentar_em - agora):.0f}s.")
+            self._estado = MEIO_ABERTO
+            self._sondando = True
+            self.stats["sondas"] += 1
+            return True
+
+    def sucesso(self) -> None:
+        with self._lock:
+            self._seguidas = 0
+            if self._estado != FECHADO:
+                self._estado = FECHADO
+                self._sondando = False
+                self._espera_atual = self.espera
+
+    def falha(self) -> bool:
+        """Registra falha de conexão; True se o disjuntor abriu agora."""
+        with self._lock:
+            self._seguidas += 1
+            if self._estado == MEIO_ABERTO:
+                self._espera_atual = min(self._espera_atual * 2, self.espera_max)
+            elif self._estado == ABERTO or self._seguidas < self.falhas:
+                return False
+            self._estado = ABERTO
+            self._sondando = False
+            # espalha as sondas das estações que caíram juntas
+            self._tentar_em = time.monotonic() + self._espera_atual * random.uniform(0.9, 1.1)
+            self.stats["aberturas"] += 1
+            return True
+
+    def liberar(self) -> None:
+        """A sonda terminou sem dizer nada sobre a conexão: a próxima chamada sonda de novo."""
+        with self._lock:
+            if self._estado == MEIO_ABERTO:
+                self._estado = ABERTO
+                self._sondando = False
+
+    def estado(self) -> Dict:
+        with self._lock:
+            return {
+                "estado": self._estado,
+                "falhas_seguidas": self._seguidas,
+                "tentar_em_s": max(0.0, self._tentar_em - time.monotonic()) if self._estado != FECHADO else 0.0,
+                **self.stats,
+            }
+
+# ---------------------------
+# Pool de conexões
+# ---------------------------
+
+# comando que grava: só ele abre a janela de leitura no primário
+_RE_ESCRITA = re.compile(r"\b(?:INSERT|UPDATE|DELETE|MERGE)\b", re.I)
+
+class _CursorEscrita:
+    """Cursor do primário: marca a conexão quando executa INSERT/UPDATE/DELETE/MERGE."""
+
+    __slots__ = ("_conexao", "_cur")
+
+    def __init__(self, conexao: "ConexaoPool", cur):
+        object.__setattr__(self, "_conexao", conexao)
+        object.__setattr__(self, "_cur", cur)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __setattr__(self, name, value):  # ex.: fast_executemany
+        setattr(self._cur, name, value)
+
+    def __enter__(self):
+        self._cur.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cur.__exit__(*exc)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def execute(self, sql, *params):
+        if _RE_ESCRITA.search(sql):
+            self._conexao._escreveu = True
+        r = self._cur.execute(sql, *params)
+        return self if r is self._cur else r
+
+    def executemany(self, sql, linhas):
+        if _RE_ESCRITA.search(sql):
+            self._conexao._escreveu = True
+        return self._cur.executemany(sql, linhas)
+
+class ConexaoPool:
+    """
+    Conexão emprestada do pool. Repassa tudo para a conexão pyodbc real.
+    No `with`, faz commit (ou rollback se houve exceção) como o pyodbc e
+    devolve a conexão ao pool em vez de deixá-la aberta até o GC.
+    """
+
+    def __init__(self, pool: "PoolConexoes", raw: pyodbc.Connection, criada_em: float):
+        self._pool = pool
+        self._raw = raw
+        self._criada_em = criada_em
+        self._devolvida = False
+        self._escreveu = False  # executou escrita desde o último commit
+
+    def __getattr__(self, name):
+        if self._devolvida:
+            raise RuntimeError("Conexão já devolvida ao pool.")
+        return getattr(self._raw, name)
+
+    def cursor(self):
+        if self._devolvida:
+            raise RuntimeError("Conexão já devolvida ao pool.")
+        cur = _instr.embrulhar_cursor(self._raw.cursor())
+        return _CursorEscrita(self, cur) if self._pool.ao_commit is not None else cur
+
+    def commit(self) -> None:
+        """
+        Commit; no primário, se houve escrita, abre a janela de leitura no
+        primário (read-your-writes). Bloco só de leitura não abre.
+        """
+        if self._devolvida:
+            raise RuntimeError("Conexão já devolvida ao pool.")
+        self._raw.commit()
+        if self._escreveu:
+            self._escreveu = False
+            if self._pool.ao_commit is not None:
+                self._pool.ao_commit()
+
+    def rollback(self) -> None:
+        if self._devolvida:
+            raise RuntimeError("Conexão já devolvida ao pool.")
+        self._raw.rollback()
+        self._escreveu = False
+
+    def close(self) -> None:
+        """Desfaz o que não foi commitado e devolve a conexão ao pool (não fecha o socket)."""
+        if self._devolvida:
+            return
+        try:
+            self._raw.rollback()
+        except Error:
+            self.invalidar()
+            return
+        self._liberar()
+
+    def _liberar(self) -> None:
+        self._escreveu = False
+        if not self._devolvida:
+            self._devolvida = True
+            self._pool._devolver(self._raw, self._criada_em)
+
+    def invalidar(self) -> None:
+        """Descarta a conexão (ex.: erro de comunicação) em vez de devolvê-la."""
+        if not self._devolvida:
+            self._devolvida = True
+            self._pool._descartar(self._raw, "descartadas_erro")
+
+    def __enter__(self) -> "ConexaoPool":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self._devolvida:
+            return
+        if exc_type is None:
+            self._pool.disjuntor.sucesso()
+        elif erro_de_conexao(exc) and not isinstance(exc, CircuitoAberto):
+            self._pool._falha_de_conexao()
+        try:
+            if exc_type is None:
+                self.commit()   # implícito: abre a janela de leitura só se houve escrita
+            else:
+                self._raw.rollback()
+        except Error:
+            # conexão em estado duvidoso: não volta para o pool
+            self.invalidar()
+            if exc_type is None:
+                raise
+            return
+        self._liberar()
+
+
+class PoolConexoes:
+    """
+    Pool limitado de conexões reutilizáveis.
+    - no máximo `max_conexoes` abertas (emprestadas + livres);
+    - checkout faz `SELECT 1` se a conexão ficou ociosa mais que `ping_apos`;
+    - conexões ociosas há mais de `max_ocioso` ou mais velhas que `max_vida`
+      são descartadas no checkout/devolução.
+    """
+
+    def __init__(
+        self,
+        fabrica=_abrir_conexao,
+        max_conexoes: int = 4,
+        timeout: float = 10.0,
+        max_ocioso: float = 300.0,
+        max_vida: float = 1800.0,
+        ping_apos: float = 30.0,
+        nome: str = "Servidor de banco",
+    ):
+        self._fabrica = fabrica
+        self.disjuntor = Disjuntor(nome)
+        self.max_conexoes = max(1, int(max_conexoes))
+        self.timeout = timeout
+        self.max_ocioso = max_ocioso
+        self.max_vida = max_vida
+        self.ping_apos = ping_apos
+        # (conexão, criada_em, devolvida_em); o fim da fila é a mais recente
+        self._livres: Deque[Tuple[pyodbc.Connection, float, float]] = deque()
+        self._abertas = 0
+        self._fechado = False
+        self._cond = threading.Condition()
+        self.ao_commit: Optional[Callable[[], None]] = None  # chamado no commit() que confirma escrita
+        self._stats: Dict[str, int] = {
+            "criadas": 0,
+            "reutilizadas": 0,
+            "esperas": 0,
+            "descartadas_ociosas": 0,
+            "descartadas_vida": 0,
+            "descartadas_saude": 0,
+            "descartadas_erro": 0,
+        }
+
+    # --- internos ---
+    def _fechar_raw(self, raw: pyodbc.Connection) -> None:
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _expirada(self, criada_em: float, agora: float) -> bool:
+        return self.max_vida > 0 and agora - criada_em > self.max_vida
+
+    def _coletar_ociosas(self, agora: float):
+        """Remove (sob o lock) as livres vencidas; devolve a lista para fechar fora do lock."""
+        vencidas = []
+        while self._livres:
+            raw, criada_em, devolvida_em = self._livres[0]
+            if self.max_ocioso > 0 and agora - devolvida_em > self.max_ocioso:
+                self._stats["descartadas_ociosas"] += 1
+            elif self._expirada(criada_em, agora):
+                self._stats["descartadas_vida"] += 1
+            else:
+                break
+            self._livres.popleft()
+            self._abertas -= 1
+            vencidas.append(raw)
+        if vencidas:
+            self._cond.notify(len(vencidas))
+        return vencidas
+
+    def _saudavel(self, raw: pyodbc.Connection) -> bool:
+        try:
+            cur = raw.cursor()
+            try:
+                cur.execute("SELECT 1")
+                cur.fetchone()
+            finally:
+                cur.close()
+            return True
+        except Exception:
+            return False
+
+    def _devolver(self, raw: pyodbc.Connection, criada_em: float) -> None:
+        agora = time.monotonic()
+        with self._cond:
+            if self._fechado or self._expirada(criada_em, agora):
+                if not self._fechado:
+                    self._stats["descartadas_vida"] += 1
+                self._abertas -= 1
+                self._cond.notify()
+                descartar = True
+            else:
+                self._livres.append((raw, criada_em, agora))
+                self._cond.notify()
+                descartar = False
+            vencidas = self._coletar_ociosas(agora)
+        if descartar:
+            self._fechar_raw(raw)
+        for r in vencidas:
+            self._fechar_raw(r)
+
+    def _falha_de_conexao(self) -> None:
+        """Servidor inalcançável: conta no disjuntor; se abriu, as livres (mortas) saem."""
+        if not self.disjuntor.falha():
+            return
+        with self._cond:
+            livres = [raw for raw, _, _ in self._livres]
+            self._abertas -= len(livres)
+            self._stats["descartadas_erro"] += len(livres)
+            self._livres.clear()
+            self._cond.notify(len(livres) or 1)
+        for raw in livres:
+            self._fechar_raw(raw)
+
+    def _descartar(self, raw: pyodbc.Connection, motivo: str) -> None:
+        with self._cond:
+            self._abertas -= 1
+            self._stats[motivo] += 1
+            self._cond.notify()
+        self._fechar_raw(raw)
+
+    # --- API ---
+    def obter(self) -> ConexaoPool:
+        """
+        Empresta uma conexão saudável; abre uma nova se houver vaga.
+        Disjuntor aberto: CircuitoAberto na hora, sem esperar o timeout.
+        """
+        sonda = self.disjuntor.antes()
+        try:
+            conexao = self._obter(sonda)
+        except BaseException as ex:
+            if erro_de_conexao(ex):
+                self._falha_de_conexao()
+            elif sonda:
+                self.disjuntor.liberar()
+            raise
+        if sonda:
+            self.disjuntor.sucesso()
+        return conexao
+
+    def _obter(self, sonda: bool) -> ConexaoPool:
+        limite = time.monotonic() + self.timeout
+        while True:
+            candidata = None
+            criar = False
+            with self._cond:
+                if self._fechado:
+                    raise RuntimeError("Pool de conexões encerrado.")
+                agora = time.monotonic()
+                vencidas = self._coletar_ociosas(agora)
+                if self._livres:
+                    candidata = self._livres.pop()
+                elif self._abertas < self.max_conexoes:
+                    self._abertas += 1
+                    criar = True
+                else:
+                    restante = limite - agora
+                    if restante <= 0:
+                        raise RuntimeError(
+                            f"Pool de conexões esgotado ({self.max_conexoes} em uso) "
+                            f"após {self.timeout:g}s de espera."
+                        )
+                    self._stats["esperas"] += 1
+                    self._cond.wait(restante)
+            for r in vencidas:
+                self._fechar_raw(r)
+
+            if criar:
+                try:
+                    raw = self._fabrica()
+                except BaseException:
+                    with self._cond:
+                        self._abertas -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats["criadas"] += 1
+                self.disjuntor.sucesso()
+                return ConexaoPool(self, raw, time.monotonic())
+
+            if candidata is not None:
+                raw, criada_em, devolvida_em = candidata
+                # a sonda do disjuntor sempre confere a conexão reaproveitada
+                if (sonda or time.monotonic() - devolvida_em > self.ping_apos) and not self._saudavel(raw):
+                    self._descartar(raw, "descartadas_saude")
+                    continue
+                with self._cond:
+                    self._stats["reutilizadas"] += 1
+                return ConexaoPool(self, raw, criada_em)
+
+    def estatisticas(self) -> Dict[str, int]:
+        """Retorna um retrato dos contadores do pool."""
+        with self._cond:
+            st = dict(self._stats)
+            st["abertas"] = self._abertas
+            st["livres"] = len(self._livres)
+            st["em_uso"] = self._abertas - len(self._livres)
+            st["max_conexoes"] = self.max_conexoes
+        return st
+
+    def fechar(self) -> None:
+        """Fecha as conexões livres; as emprestadas são fechadas ao serem devolvidas."""
+        with self._cond:
+            self._fechado = True
+            livres = [raw for raw, _, _ in self._livres]
+            self._abertas -= len(livres)
+            self._livres.clear()
+            self._cond.notify_all()
+        for raw in livres:
+            self._fechar_raw(raw)
+
+
+_pool_lock = threading.Lock()
+_pool: Optional[PoolConexoes] = None
+
+def _get_pool() -> PoolConexoes:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexoes(
+                    max_conexoes=CONFIG["POOL_MAX"],
+                    timeout=CONFIG["POOL_TIMEOUT"],
+                    max_ocioso=CONFIG["POOL_MAX_IDLE"],
+                    max_vida=CONFIG["POOL_MAX_LIFETIME"],
+                    ping_apos=CONFIG["POOL_PING_AFTER"],
+                    nome="Servidor de banco",
+                )
+                _pool.ao_commit = partial(_registrar_escrita, None)
+                if _instr.ATIVA:
+                    iniciar_exportacao_metricas()
+    return _pool
+
+# ---------------------------
+# Sites (um DbLogistica por CD)
+# ---------------------------
+# Cada site tem um perfil (CONFIG com SERVER/DATABASE/... próprios) e o seu
+# pool. conectar() usa o pool do site ativo na thread (usando_site), então
+# as funções de consulta existentes servem a qualquer site sem mudança.
+
+_CAMPOS_SITE = {
+    "SERVER": "SERVER", "DATABASE": "NAME", "UID": "USER", "PWD": "PASS",
+    "BACKEND": "BACKEND", "SQLITE_PATH": "SQLITE_PATH", "TIMEOUT": "TIMEOUT",
+    "LEITURA_SERVER": "READ_SERVER", "LEITURA_INTENT": "READ_INTENT",
+    "LEITURA_SQLITE_PATH": "READ_SQLITE_PATH",
+}
+
+SITES: Dict[str, Dict] = {}
+_pools_sites: Dict[str, PoolConexoes] = {}
+_pools_leitura: Dict[Optional[str], Optional[PoolConexoes]] = {}   # None: site sem réplica
+_ultima_escrita: Dict[Optional[str], float] = {}
+_site_local = threading.local()
+
+def registrar_site(nome: str, **config) -> None:
+    """Cria/troca o perfil do site `nome` (chaves de CONFIG; o que faltar vem de CONFIG)."""
+    perfil = dict(CONFIG, LEITURA_SERVER="", LEITURA_SQLITE_PATH="")  # réplica do padrão não vale para o site
+    perfil.update(config)
+    perfil["TIMEOUT"] = float(perfil.get("TIMEOUT") or CONFIG["SITE_TIMEOUT"])
+    # abrir conexão e esperar vaga no pool também cabem no prazo do site
+    perfil["CONNECT_TIMEOUT"] = str(min(int(perfil["CONNECT_TIMEOUT"]), max(1, math.ceil(perfil["TIMEOUT"]))))
+    perfil["POOL_TIMEOUT"] = min(float(perfil["POOL_TIMEOUT"]), perfil["TIMEOUT"])
+    with _pool_lock:
+        SITES[nome] = perfil
+        antigos = [_pools_sites.pop(nome, None), _pools_leitura.pop(nome, None)]
+    for antigo in antigos:
+        if antigo is not None:
+            antigo.fechar()
+
+def _carregar_sites() -> None:
+    for nome in (n.strip() for n in CONFIG["SITES"].split(",")):
+        if nome:
+            registrar_site(nome, **{
+                chave: os.environ[f"DB_{nome.upper()}_{sufixo}"]
+                for chave, sufixo in _CAMPOS_SITE.items()
+                if f"DB_{nome.upper()}_{sufixo}" in os.environ
+            })
+
+_carregar_sites()
+
+@contextmanager
+def usando_site(nome: Optional[str]):
+    """Dentro do bloco, conectar() sem site explícito usa o pool do site `nome` (None = CONFIG)."""
+    anterior = getattr(_site_local, "nome", None)
+    _site_local.nome = nome
+    try:
+        yield
+    finally:
+        _site_local.nome = anterior
+
+def site_atual() -> Optional[str]:
+    return getattr(_site_local, "nome", None)
+
+def _get_pool_site(nome: str) -> PoolConexoes:
+    pool = _pools_sites.get(nome)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools_sites.get(nome)
+            if pool is None:
+                perfil = SITES.get(nome)
+                if perfil is None:
+                    raise RuntimeError(f"Site não configurado: {nome} (DB_SITES={CONFIG['SITES']!r}).")
+                pool = _pools_sites[nome] = PoolConexoes(
+                    fabrica=partial(_abrir_conexao, perfil),
+                    max_conexoes=perfil["POOL_MAX"],
+                    timeout=perfil["POOL_TIMEOUT"],
+                    max_ocioso=perfil["POOL_MAX_IDLE"],
+                    max_vida=perfil["POOL_MAX_LIFETIME"],
+                    ping_apos=perfil["POOL_PING_AFTER"],
+                    nome=f"Site {nome}",
+                )
+                pool.ao_commit = partial(_registrar_escrita, nome)
+    return pool
+
+# ---------------------------
+# Leituras na réplica
+# ---------------------------
+# conectar(leitura=True) usa o pool da réplica do site (se configurada),
+# exceto logo depois de um commit deste processo no mesmo site
+# (LEITURA_APOS_ESCRITA). Leituras que validam uma gravação usam o
+# primário (conectar() sem leitura=True). Réplica fora: cai no primário.
+
+def _registrar_escrita(site: Optional[str]) -> None:
+    _ultima_escrita[site] = time.monotonic()
+
+def _perfil_leitura(cfg: Dict) -> Optional[Dict]:
+    if cfg["BACKEND"] == "sqlite":
+        if not cfg.get("LEITURA_SQLITE_PATH"):
+            return None
+        return dict(cfg, SQLITE_PATH=cfg["LEITURA_SQLITE_PATH"])
+    intencao = str(cfg.get("LEITURA_INTENT", "no")).lower() in ("yes", "sim", "1", "true")
+    if not cfg.get("LEITURA_SERVER") and not intencao:
+        return None
+    return dict(cfg, SERVER=cfg.get("LEITURA_SERVER") or cfg["SERVER"], SOMENTE_LEITURA=intencao)
+
+def _get_pool_leitura(nome: Optional[str]) -> Optional[PoolConexoes]:
+    if nome in _pools_leitura:
+        return _pools_leitura[nome]
+    with _pool_lock:
+        if nome not in _pools_leitura:
+            cfg = CONFIG if nome is None else SITES.get(nome)
+            perfil = _perfil_leitura(cfg) if cfg is not None else None
+            _pools_leitura[nome] = None if perfil is None else PoolConexoes(
+                fabrica=partial(_abrir_conexao, perfil),
+                max_conexoes=perfil["POOL_MAX"],
+                timeout=perfil["POOL_TIMEOUT"],
+                max_ocioso=perfil["POOL_MAX_IDLE"],
+                max_vida=perfil["POOL_MAX_LIFETIME"],
+                ping_apos=perfil["POOL_PING_AFTER"],
+                nome="Réplica de leitura" + (f" do site {nome}" if nome else ""),
+            )
+        return _pools_leitura[nome]
+
+def conectar(site: Optional[str] = None, leitura: bool = False) -> ConexaoPool:
+    """
+    Empresta uma conexão do pool com o SQL Server (do `site` informado, do
+    site ativo em usando_site() ou, sem nenhum, do CONFIG).
+    leitura=True: só consultas, podem vir da réplica (ligeiramente atrasada).
+    Use com `with conectar() as conn:` (commit/rollback e devolução automáticos)
+    ou chame `conn.close()` para devolvê-la.
+    """
+    nome = site or site_atual()
+    if leitura:
+        replica = _get_pool_leitura(nome)
+        recente = time.monotonic() - _ultima_escrita.get(nome, float("-inf")) < CONFIG["LEITURA_APOS_ESCRITA"]
+        if replica is not None and not recente:
+            try:
+                return _instr.medir_conectar(replica.obter)
+            except Error as ex:
+                if not erro_de_conexao(ex):
+                    raise
+                if not isinstance(ex, CircuitoAberto):  # aberto: já avisado quando abriu
+                    print(f"Réplica de leitura indisponível, usando o primário: {ex}")
+    pool = _get_pool() if nome is None else _get_pool_site(nome)
+    return _instr.medir_conectar(pool.obter)
+
+@dataclass
+class ResultadoSite:
+    site: str
+    ok: bool
+    valor: Any = None
+    erro: Optional[str] = None
+    segundos: float = 0.0
+
+_executor_sites: Optional[ThreadPoolExecutor] = None
+_em_andamento: Dict[str, Future] = {}   # site -> chamada do fan-out ainda rodando
+_em_andamento_lock = threading.Lock()
+
+def _get_executor_sites() -> ThreadPoolExecutor:
+    global _executor_sites
+    if _executor_sites is None:
+        with _pool_lock:
+            if _executor_sites is None:
+                _executor_sites = ThreadPoolExecutor(
+                    max_workers=CONFIG["SITES_THREADS"], thread_name_prefix="db-site")
+    return _executor_sites
+
+def em_sites(fn: Callable, *args, sites: Optional[Iterable[str]] = None,
+             timeout: Optional[float] = None, **kwargs) -> Dict[str, ResultadoSite]:
+    """
+    Executa fn(*args, **kwargs) em todos os sites (ou nos `sites`) ao mesmo
+    tempo, cada chamada com o seu site ativo. Espera cada site até o seu
+    TIMEOUT (ou `timeout`), contado do início: a demora total é a do site
+    mais lento, limitada pelo prazo. Site com erro ou sem resposta no prazo
+    volta com ok=False (resultado parcial); o que terminar depois é descartado.
+    Site com chamada anterior ainda rodando (travado além do prazo) volta
+    ok=False na hora, sem ocupar outra thread: um site parado não esgota
+    SITES_THREADS e não atrasa os outros.
+    """
+    nomes = list(SITES) if sites is None else list(dict.fromkeys(sites))
+
+    def tarefa(nome):
+        t0 = time.monotonic()
+        with usando_site(nome):
+            valor = fn(*args, **kwargs)
+        return valor, time.monotonic() - t0
+
+    def liberar(nome, fut):
+        with _em_andamento_lock:
+            if _em_andamento.get(nome) is fut:
+                del _em_andamento[nome]
+
+    inicio = time.monotonic()
+    executor = _get_executor_sites()
+    resultados: Dict[str, ResultadoSite] = {}
+    futuros = []
+    for nome in nomes:
+        with _em_andamento_lock:
+            anterior = _em_andamento.get(nome)
+            if anterior is not None and not anterior.done():
+                resultados[nome] = ResultadoSite(nome, False, erro="consulta anterior ainda sem resposta")
+                continue
+            fut = executor.submit(tarefa, nome)
+            _em_andamento[nome] = fut
+        fut.add_done_callback(partial(liberar, nome))
+        futuros.append((nome, fut))
+    for nome, fut in futuros:
+        prazo = timeout if timeout is not None else SITES.get(nome, CONFIG).get("TIMEOUT", CONFIG["SITE_TIMEOUT"])
+        try:
+            valor, segundos = fut.result(timeout=max(0.0, inicio + prazo - time.monotonic()))
+            resultados[nome] = ResultadoSite(nome, True, valor, segundos=segundos)
+        except _TempoEsgotado:
+            if not fut.running():
+                fut.cancel()  # ainda na fila (threads ocupadas): nem chega a rodar
+            resultados[nome] = ResultadoSite(nome, False, erro=f"sem resposta em {prazo:g}s",
+                                             segundos=time.monotonic() - inicio)
+        except Exception as ex:
+            resultados[nome] = ResultadoSite(nome, False, erro=str(ex), segundos=time.monotonic() - inicio)
+    return {nome: resultados[nome] for nome in nomes}
+
+def aquecer() -> None:
+    """
+    Escolhe o driver e deixa uma conexão pronta no pool (chamar numa thread
+    durante a tela de login: o primeiro login não paga o handshake).
+    """
+    if CONFIG["BACKEND"] != "sqlite" and pyodbc is not None:
+        _pick_driver()
+    conectar().close()
+
+def estado_conexao(site: Optional[str] = None) -> Dict:
+    """Estado do disjuntor do primário (sem I/O): estado, falhas seguidas, tentar_em_s..."""
+    return (_get_pool() if site is None else _get_pool_site(site)).disjuntor.estado()
+
+def estatisticas_pool(site: Optional[str] = None) -> Dict[str, int]:
+    """Contadores do pool (criadas, reutilizadas, descartes, em uso...)."""
+    return (_get_pool() if site is None else _get_pool_site(site)).estatisticas()
+
+def fechar_pool() -> None:
+    """Fecha os pools (o padrão e os dos sites; ex.: ao encerrar o aplicativo)."""
+    global _pool, _exportador
+    if _exportador is not None:
+        _exportador.encerrar()  # grava o último retrato
+        _exportador = None
+    with _pool_lock:
+        if _pool is not None:
+            _pool.fechar()
+            _pool = None
+        pools = list(_pools_sites.values()) + [p for p in _pools_leitura.values() if p is not None]
+        _pools_sites.clear()
+        _pools_leitura.clear()
+    for pool in pools:
+        pool.fechar()
+
+# ---------------------------
+# Métricas das consultas
+# ---------------------------
+
+_exportador: Optional[_instr.ExportadorMetricas] = None
+
+def metricas() -> Dict:
+    """Retrato da instrumentação (por operação) + contadores do pool."""
+    retrato = _instr.registro.retrato()
+    retrato["pool"] = _pool.estatisticas() if _pool is not None else {}
+    retrato["disjuntor"] = _pool.disjuntor.estado() if _pool is not None else {}
+    if any(_pools_leitura.values()):
+        retrato["pools_leitura"] = {str(nome or "padrao"): p.estatisticas()
+                                    for nome, p in list(_pools_leitura.items()) if p is not None}
+    if _pools_sites:
+        retrato["pools_sites"] = {nome: p.estatisticas() for nome, p in list(_pools_sites.items())}
+    return retrato
+
+def iniciar_exportacao_metricas() -> None:
+    """Sobe a exportação configurada (DB_METRICAS_JSON / DB_METRICAS_PORTA), uma vez."""
+    global _exportador
+    if _exportador is None and (CONFIG["METRICAS_JSON"] or CONFIG["METRICAS_PORTA"]):
+        _exportador = _instr.ExportadorMetricas(
+            metricas,
+            caminho_json=CONFIG["METRICAS_JSON"] or None,
+            porta=CONFIG["METRICAS_PORTA"] or None,
+            intervalo=CONFIG["METRICAS_INTERVALO"],
+        ).iniciar()
+
+# ---------------------------
+# Escrita em massa
+# ---------------------------
+
+TAMANHO_BLOCO_MASSA = int(os.getenv("DB_BULK_CHUNK", "1000"))
+
+def executar_em_massa(cur, sql: str, linhas, tamanho_bloco: Optional[int] = None) -> int:
+    """
+    Executa `sql` (INSERT/UPDATE de uma linha com `?`) para todas as `linhas` usando
+    fast_executemany (parâmetros enviados em array, poucas idas ao servidor),
+    em blocos de `tamanho_bloco` para limitar memória no cliente.
+    Não faz commit. Retorna o número de linhas enviadas.
+    """
+    tamanho_bloco = tamanho_bloco or TAMANHO_BLOCO_MASSA
+    linhas = list(linhas)
+    if not linhas:
+        return 0
+    anterior = getattr(cur, "fast_executemany", False)
+    cur.fast_executemany = True
+    try:
+        for i in range(0, len(linhas), tamanho_bloco):
+            cur.executemany(sql, linhas[i:i + tamanho_bloco])
+    finally:
+        cur.fast_executemany = anterior
+    return len(linhas)
+
+@operacao("login")
 def verificar_login(usuario: str, senha: str) -> bool:
     """Verifica as credenciais de login no banco de dados."""
     with conectar() as conn:
@@ -79,6 +969,7 @@ def verificar_login(usuario: str, senha: str) -> bool:
         )
         return cur.fetchone()[0] > 0
 
+@operacao("usuario_existe")
 def usuario_existe(id_usuario: str, email: str) -> bool:
     """Verifica se um usuário já existe pelo ID ou email."""
     with conectar() as conn:
@@ -89,6 +980,7 @@ def usuario_existe(id_usuario: str, email: str) -> bool:
         )
         return cur.fetchone()[0] > 0
 
+@operacao("inserir_usuario")
 def inserir_usuario(id_usuario: str, nome_usuario: str, email: str, senha: str) -> None:
     """Insere um novo usuário no banco de dados."""
     with conectar() as conn:
@@ -107,10 +999,36 @@ def get_totais_coletores() -> Dict[str, int]:
     Executa a consulta de totais dos coletores.
     Retorna um dicionário com 'EM OPERACAO', 'DISPONIVEL', 'EM CONSERTO'.
     """
+    try:
+        return _ler_totais()
+    except Error as ex:
+        print(f"Erro ao conectar/consultar o banco: {ex}")
+    return {"EM OPERACAO": 0, "DISPONIVEL": 0, "EM CONSERTO": 0}
+
+def get_totais_coletores_sites(sites: Optional[Iterable[str]] = None,
+                               timeout: Optional[float] = None) -> Tuple[Dict[str, int], Dict[str, ResultadoSite]]:
+    """
+    Totais da rede: consulta todos os sites ao mesmo tempo (em_sites).
+    Retorna (soma dos sites que responderam no prazo, resultado de cada site);
+    quem falhou fica com ok=False e fora da soma.
+    """
+    por_site = em_sites(_ler_totais, sites=sites, timeout=timeout)
+    soma = {"EM OPERACAO": 0, "DISPONIVEL": 0, "EM CONSERTO": 0}
+    for r in por_site.values():
+        if r.ok:
+            for status, qtd in r.valor.items():
+                soma[status] += qtd
+    return soma, por_site
+
+@operacao("totais")
+@repetir_transitorio()
+def _ler_totais() -> Dict[str, int]:
+    """Totais do site ativo (réplica, se houver); erro de banco sobe para quem chamou."""
     totais = {"EM OPERACAO": 0, "DISPONIVEL": 0, "EM CONSERTO": 0}
+    # Lê a projeção LG_ColetoresEstadoAtual (uma linha por coletor), não o histórico.
     sql_query = """
         SELECT
-            COUNT(DISTINCT LTRIM(RTRIM(A.IDcoletores))) AS QTColetores,
+            COUNT(DISTINCT A.IDColetorNorm) AS QTColetores,
             CASE
                 WHEN B.IDRegistro = 4 THEN 'DISPONIVEL'
                 WHEN B.IDRegistro = 1 THEN 'EM OPERACAO'
@@ -120,16 +1038,8 @@ def get_totais_coletores() -> Dict[str, int]:
                 WHEN B.IDRegistro IS NULL OR B.IDRegistro = 2 THEN 'DISPONIVEL'
             END AS STATUS_COLETOR
         FROM COLETORES_CADASTRO A WITH (NOLOCK)
-        LEFT JOIN (
-            SELECT A.IDColetor, B.IDRegistro
-            FROM (
-                SELECT MAX(DataRegistro) AS DataRegistro, IDColetor
-                FROM LG_ControleColetores
-                GROUP BY IDColetor
-            ) A
-            LEFT JOIN LG_ControleColetores B
-              ON A.IDColetor = B.IDColetor AND A.DataRegistro = B.DataRegistro
-        ) B ON LTRIM(RTRIM(A.IDcoletores)) = B.IDColetor
+        LEFT JOIN LG_ColetoresEstadoAtual B WITH (NOLOCK)
+          ON A.IDColetorNorm = B.IDColetorNorm
         GROUP BY
             CASE
                 WHEN B.IDRegistro = 4 THEN 'DISPONIVEL'
@@ -140,20 +1050,25 @@ def get_totais_coletores() -> Dict[str, int]:
                 WHEN B.IDRegistro IS NULL OR B.IDRegistro = 2 THEN 'DISPONIVEL'
             END;
     """
-    try:
-        with conectar() as conn:
-            cur = conn.cursor()
-            cur.execute(sql_query)
-            for qtd, status in cur.fetchall():
-                if status in totais:
-                    totais[status] = qtd
-    except pyodbc.Error as ex:
-        print(f"Erro ao conectar/consultar o banco: {ex}")
+    with conectar(leitura=True) as conn:
+        cur = conn.cursor()
+        cur.execute(sql_query)
+        for qtd, status in cur.fetchall():
+            if status in totais:
+                totais[status] = qtd
     return totais
 
 # Atalho opcional:
 get_conn = conectar
 
 if __name__ == "__main__":
-    print("Drivers instalados:", pyodbc.drivers())
+    print("Drivers instalados:", pyodbc.drivers() if pyodbc else "pyodbc indisponível")
     print("Totais de Coletores:", get_totais_coletores())
+    print("Pool:", estatisticas_pool())
+    if SITES:
+        soma, por_site = get_totais_coletores_sites()
+        for r in por_site.values():
+            print(f"  {r.site:<10} {r.segundos * 1000:>7.0f} ms  " + (str(r.valor) if r.ok else f"FALHOU: {r.erro}"))
+        print("Totais da rede (sites que responderam):", soma)
+    if _instr.ATIVA:
+        print(_instr.texto(metricas()))
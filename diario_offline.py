@@ -0,0 +1,152 @@
+# diario_offline.py
+# ------------------------------------------------------------
+# Diário local (SQLite) de movimentações feitas com o SQL Server fora do ar.
+# - cada registro guarda o movimento, os defeitos e o horário do cliente
+# - estados: PENDENTE -> ENVIADO | CONFLITO (com a mensagem da regra)
+# - o reenvio em lote fica em mov_validacoes.reenviar_pendentes();
+#   ReenvioPeriodico chama essa função numa thread para uso sem UI
+# ------------------------------------------------------------
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+PENDENTE = "PENDENTE"
+ENVIADO = "ENVIADO"
+CONFLITO = "CONFLITO"
+
+_DDL = """
+CREATE TABLE IF NOT EXISTS movimentos (
+    id        INTEGER PRIMARY KEY AUTOINCREMENT,
+    criado_em TEXT NOT NULL,              -- horário do cliente (ISO)
+    mov       TEXT NOT NULL,              -- MovDados em JSON
+    defeitos  TEXT NOT NULL,              -- lista de DefeitoItem em JSON
+    estado    TEXT NOT NULL DEFAULT 'PENDENTE',
+    mensagem  TEXT,
+    enviado_em TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_movimentos_estado ON movimentos (estado, id);
+"""
+
+
+def _pasta_app() -> str:
+    # ao lado do executável no PyInstaller; ao lado do código em DEV
+    if getattr(sys, "frozen", False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def caminho_padrao() -> str:
+    return os.getenv("COLETORES_DIARIO", os.path.join(_pasta_app(), "movimentos_offline.sqlite3"))
+
+
+class DiarioOffline:
+    def __init__(self, caminho: Optional[str] = None):
+        self.caminho = caminho or caminho_padrao()
+        self._lock = threading.Lock()
+        with self._abrir() as cn:
+            cn.executescript(_DDL)
+
+    @contextmanager
+    def _abrir(self):
+        """Conexão curta: commit no fim do bloco (rollback se erro) e fecha."""
+        cn = sqlite3.connect(self.caminho, timeout=10)
+        try:
+            cn.execute("PRAGMA journal_mode=WAL")
+            cn.execute("PRAGMA synchronous=FULL")  # durável: sobrevive a queda de energia
+            with cn:
+                yield cn
+        finally:
+            cn.close()
+
+    def registrar(self, mov: Dict, defeitos: List[Dict], criado_em: Optional[datetime] = None) -> int:
+        """Grava um movimento pendente; retorna o id local."""
+        criado_em = criado_em or datetime.now()
+        with self._lock, self._abrir() as cn:
+            cur = cn.execute(
+                "INSERT INTO movimentos (criado_em, mov, defeitos) VALUES (?, ?, ?)",
+                (criado_em.isoformat(sep=" "), json.dumps(mov), json.dumps(defeitos)),
+            )
+            return cur.lastrowid
+
+    def pendentes(self, limite: int = 500) -> List[Tuple[int, datetime, Dict, List[Dict]]]:
+        """Pendentes na ordem em que foram registrados."""
+        with self._lock, self._abrir() as cn:
+            rows = cn.execute(
+                "SELECT id, criado_em, mov, defeitos FROM movimentos "
+                "WHERE estado = ? ORDER BY id LIMIT ?",
+                (PENDENTE, limite),
+            ).fetchall()
+        return [(i, datetime.fromisoformat(c), json.loads(m), json.loads(d)) for i, c, m, d in rows]
+
+    def marcar(self, resultados: List[Tuple[int, str, Optional[str]]]) -> None:
+        """resultados: [(id, ENVIADO|CONFLITO, mensagem)] numa única transação."""
+        if not resultados:
+            return
+        agora = datetime.now().isoformat(sep=" ")
+        with self._lock, self._abrir() as cn:
+            cn.executemany(
+                "UPDATE movimentos SET estado = ?, mensagem = ?, enviado_em = ? WHERE id = ?",
+                [(estado, msg, agora, i) for i, estado, msg in resultados],
+            )
+
+    def contar_pendentes(self) -> int:
+        with self._lock, self._abrir() as cn:
+            return cn.execute("SELECT COUNT(*) FROM movimentos WHERE estado = ?", (PENDENTE,)).fetchone()[0]
+
+    def conflitos(self, desde_id: int = 0) -> List[Tuple[int, datetime, Dict, str]]:
+        """Movimentos recusados no reenvio (para conferência do supervisor)."""
+        with self._lock, self._abrir() as cn:
+            rows = cn.execute(
+                "SELECT id, criado_em, mov, mensagem FROM movimentos "
+                "WHERE estado = ? AND id > ? ORDER BY id",
+                (CONFLITO, desde_id),
+            ).fetchall()
+        return [(i, datetime.fromisoformat(c), json.loads(m), msg) for i, c, m, msg in rows]
+
+
+_diario_lock = threading.Lock()
+_diario: Optional[DiarioOffline] = None
+
+def obter_diario() -> DiarioOffline:
+    global _diario
+    if _diario is None:
+        with _diario_lock:
+            if _diario is None:
+                _diario = DiarioOffline()
+    return _diario
+
+
+class ReenvioPeriodico(threading.Thread):
+    """
+    Chama `reenviar()` a cada `intervalo` segundos enquanto houver pendentes.
+    `ao_resultado(resultado)` recebe o retorno de cada rodada (na thread do reenvio).
+    """
+
+    def __init__(self, reenviar: Callable[[], object], intervalo: float = 15.0,
+                 ao_resultado: Optional[Callable[[object], None]] = None):
+        super().__init__(name="diario-reenvio", daemon=True)
+        self._reenviar = reenviar
+        self._intervalo = intervalo
+        self._ao_resultado = ao_resultado
+        self._parar = threading.Event()
+
+    def run(self) -> None:
+        while not self._parar.wait(self._intervalo):
+            if obter_diario().contar_pendentes() == 0:
+                continue
+            try:
+                resultado = self._reenviar()
+            except Exception as e:  # servidor ainda fora: tenta na próxima rodada
+                print(f"Reenvio do diário offline falhou: {e}")
+                continue
+            if self._ao_resultado:
+                self._ao_resultado(resultado)
+
+    def parar(self) -> None:
+        self._parar.set()
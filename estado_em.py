@@ -0,0 +1,304 @@
+# estado_em.py
+# ------------------------------------------------------------
+# Estado da frota numa data/hora qualquer ("quem estava com o coletor X no
+# dia D", "quantos estavam em conserto no fim do mês passado").
+# - um coletor: seek no IX_LG_ControleColetores_Norm (último movimento
+#   com DataRegistro <= D), mesma ordenação do estado atual
+# - frota inteira: checkpoint (estado completo gravado em datas fixas, a
+#   cada INTERVALO_CHECKPOINT) + os movimentos entre o checkpoint e D,
+#   lidos pelo IX_LG_ControleColetores_Data; no máximo um intervalo de
+#   delta, seja qual for a idade de D
+# - checkpoints lidos ficam em memória (poucos; os mais recentes)
+# - criar_checkpoints() continua de onde parou (rode diariamente / no
+#   agendador do Windows); --refazer regrava tudo (histórico corrigido)
+# Totais usam o cadastro ATUAL (COLETORES_CADASTRO não tem histórico).
+#
+# Uso:
+#   python estado_em.py checkpoints
+#   python estado_em.py coletor 000123 --em "2025-03-01 14:00"
+#   python estado_em.py frota --em 2025-02-28T23:59:59
+# ------------------------------------------------------------
+from __future__ import annotations
+import argparse
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+import db as _db
+from mov_validacoes import STATUS_BY_IDREG, normalizar_id_coletor
+
+INTERVALO_CHECKPOINT = timedelta(days=int(os.getenv("COLETORES_CHECKPOINT_DIAS", "7")))
+_ORIGEM = datetime(2000, 1, 3)      # segunda-feira: checkpoints semanais caem às segundas 00:00
+_CHECKPOINTS_EM_MEMORIA = 8
+
+
+@dataclass(frozen=True)
+class EstadoColetor:
+    id_coletor: str
+    id_registro: int
+    id_colaborador: Optional[str]
+    data_registro: datetime
+
+    @property
+    def status(self) -> str:
+        return STATUS_BY_IDREG.get(self.id_registro, "DISPONIVEL")
+
+
+_SQL_COLETOR_EM = """
+    SELECT TOP 1 IDColetor, IDRegistro, IDColaborador, DataRegistro
+    FROM LG_ControleColetores WITH (NOLOCK)
+    WHERE IDColetorNorm = ? AND DataRegistro <= ?
+    ORDER BY DataRegistro DESC, IDRegistro DESC
+"""
+
+_SQL_CHECKPOINT_ANTERIOR = """
+    SELECT TOP 1 DataCheckpoint FROM LG_ColetoresCheckpoint WITH (NOLOCK)
+    WHERE DataCheckpoint <= ?
+    ORDER BY DataCheckpoint DESC
+"""
+
+_SQL_ESTADO_CHECKPOINT = """
+    SELECT IDColetorNorm, IDColetor, IDRegistro, IDColaborador, DataRegistro
+    FROM LG_ColetoresCheckpointEstado WITH (NOLOCK)
+    WHERE DataCheckpoint = ?
+"""
+
+# Delta: ordem crescente, o último de cada coletor prevalece.
+_SQL_DELTA = """
+    SELECT IDColetorNorm, IDColetor, IDRegistro, IDColaborador, DataRegistro
+    FROM LG_ControleColetores WITH (NOLOCK)
+    WHERE DataRegistro > ? AND DataRegistro <= ? AND IDColetorNorm IS NOT NULL
+    ORDER BY DataRegistro, IDRegistro
+"""
+
+_SQL_DELTA_INICIO = """
+    SELECT IDColetorNorm, IDColetor, IDRegistro, IDColaborador, DataRegistro
+    FROM LG_ControleColetores WITH (NOLOCK)
+    WHERE DataRegistro <= ? AND IDColetorNorm IS NOT NULL
+    ORDER BY DataRegistro, IDRegistro
+"""
+
+_SQL_CADASTRO = """
+    SELECT DISTINCT IDColetorNorm FROM COLETORES_CADASTRO WITH (NOLOCK)
+    WHERE IDColetorNorm IS NOT NULL
+"""
+
+_SQL_ULTIMO_CHECKPOINT = """
+    SELECT TOP 1 DataCheckpoint FROM LG_ColetoresCheckpoint ORDER BY DataCheckpoint DESC
+"""
+
+_SQL_PRIMEIRO_MOVIMENTO = """
+    SELECT TOP 1 DataRegistro FROM LG_ControleColetores WITH (NOLOCK) ORDER BY DataRegistro
+"""
+
+_SQL_INSERT_CHECKPOINT = """
+    INSERT INTO LG_ColetoresCheckpoint (DataCheckpoint, Coletores, CriadoEm) VALUES (?, ?, GETDATE())
+"""
+
+_SQL_INSERT_ESTADO = """
+    INSERT INTO LG_ColetoresCheckpointEstado
+    (DataCheckpoint, IDColetorNorm, IDColetor, IDRegistro, IDColaborador, DataRegistro)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+_SQL_APAGAR_CHECKPOINTS = """
+    DELETE FROM LG_ColetoresCheckpointEstado;
+    DELETE FROM LG_ColetoresCheckpoint;
+"""
+
+
+def _aplicar(estado: Dict[str, EstadoColetor], linhas) -> None:
+    for norm, id_coletor, idreg, colab, data in linhas:
+        estado[norm] = EstadoColetor((id_coletor or "").strip(), idreg, (colab or "").strip() or None, data)
+
+
+def _limite_checkpoint(quando: datetime) -> datetime:
+    """Maior data de checkpoint <= quando (grade fixa a partir de _ORIGEM)."""
+    return _ORIGEM + ((quando - _ORIGEM) // INTERVALO_CHECKPOINT) * INTERVALO_CHECKPOINT
+
+
+class _CacheCheckpoints:
+    def __init__(self, capacidade: int = _CHECKPOINTS_EM_MEMORIA):
+        self._capacidade = capacidade
+        self._itens: "OrderedDict[datetime, Dict[str, EstadoColetor]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, data: datetime) -> Optional[Dict[str, EstadoColetor]]:
+        with self._lock:
+            estado = self._itens.get(data)
+            if estado is not None:
+                self._itens.move_to_end(data)
+            return estado
+
+    def guardar(self, data: datetime, estado: Dict[str, EstadoColetor]) -> None:
+        with self._lock:
+            self._itens[data] = estado
+            self._itens.move_to_end(data)
+            while len(self._itens) > self._capacidade:
+                self._itens.popitem(last=False)
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._itens.clear()
+
+
+_cache = _CacheCheckpoints()
+
+
+# ---------------------------
+# Consultas
+# ---------------------------
+
+@_db.operacao("estado_em_coletor")
+def estado_do_coletor_em(id_coletor: str, quando: datetime) -> Optional[EstadoColetor]:
+    """Último movimento do coletor até `quando` (None: nenhum movimento até lá)."""
+    with _db.conectar(leitura=True) as cn, cn.cursor() as cur:
+        cur.execute(_SQL_COLETOR_EM, (normalizar_id_coletor(id_coletor), quando))
+        row = cur.fetchone()
+    if row is None:
+        return None
+    return EstadoColetor((row[0] or "").strip(), row[1], (row[2] or "").strip() or None, row[3])
+
+
+def status_do_coletor_em(id_coletor: str, quando: datetime) -> Tuple[str, Optional[str]]:
+    """Como status_do_coletor, mas em `quando`: (status, colaborador)."""
+    estado = estado_do_coletor_em(id_coletor, quando)
+    if estado is None:
+        return "DISPONIVEL", None
+    return estado.status, estado.id_colaborador
+
+
+@_db.operacao("estado_em_frota")
+def estado_da_frota_em(quando: datetime) -> Dict[str, EstadoColetor]:
+    """IDColetorNorm -> último movimento até `quando`, para todos os coletores com histórico."""
+    with _db.conectar(leitura=True) as cn, cn.cursor() as cur:
+        cur.execute(_SQL_CHECKPOINT_ANTERIOR, (quando,))
+        row = cur.fetchone()
+        base = row[0] if row else None
+        estado: Dict[str, EstadoColetor] = {}
+        if base is not None:
+            em_cache = _cache.obter(base)
+            if em_cache is None:
+                cur.execute(_SQL_ESTADO_CHECKPOINT, (base,))
+                em_cache = {}
+                _aplicar(em_cache, cur.fetchall())
+                _cache.guardar(base, em_cache)
+            estado.update(em_cache)
+            cur.execute(_SQL_DELTA, (base, quando))
+        else:  # antes do primeiro checkpoint (ou nenhum criado): reprodução desde o início
+            cur.execute(_SQL_DELTA_INICIO, (quando,))
+        while True:
+            linhas = cur.fetchmany(5000)
+            if not linhas:
+                break
+            _aplicar(estado, linhas)
+    return estado
+
+
+@_db.operacao("totais_em")
+def totais_em(quando: datetime) -> Dict[str, int]:
+    """Totais por status (todos os de STATUS_BY_IDREG) em `quando`, sobre o cadastro atual."""
+    estado = estado_da_frota_em(quando)
+    with _db.conectar(leitura=True) as cn, cn.cursor() as cur:
+        cur.execute(_SQL_CADASTRO)
+        cadastro = [r[0] for r in cur.fetchall()]
+    totais = {st: 0 for st in dict.fromkeys(STATUS_BY_IDREG.values())}
+    for norm in cadastro:
+        e = estado.get(norm)
+        totais[e.status if e is not None else "DISPONIVEL"] += 1
+    return totais
+
+
+# ---------------------------
+# Checkpoints
+# ---------------------------
+
+@_db.operacao("estado_em_checkpoints")
+def criar_checkpoints(ate: Optional[datetime] = None, refazer: bool = False) -> int:
+    """
+    Grava os checkpoints que faltam até `ate` (padrão: agora), um intervalo
+    por vez: estado do checkpoint anterior + movimentos do intervalo.
+    Retorna quantos checkpoints foram criados.
+    """
+    ate = ate or datetime.now()
+    criados = 0
+    with _db.conectar() as cn, cn.cursor() as cur:
+        if refazer:
+            cur.execute(_SQL_APAGAR_CHECKPOINTS)
+            cn.commit()
+            _cache.limpar()
+        cur.execute(_SQL_ULTIMO_CHECKPOINT)
+        row = cur.fetchone()
+        anterior = row[0] if row else None
+        estado: Dict[str, EstadoColetor] = {}
+        if anterior is not None:
+            cur.execute(_SQL_ESTADO_CHECKPOINT, (anterior,))
+            _aplicar(estado, cur.fetchall())
+            proximo = anterior + INTERVALO_CHECKPOINT
+        else:
+            cur.execute(_SQL_PRIMEIRO_MOVIMENTO)
+            row = cur.fetchone()
+            if row is None:
+                return 0
+            proximo = _limite_checkpoint(row[0]) + INTERVALO_CHECKPOINT
+        while proximo <= ate:
+            if anterior is None:
+                cur.execute(_SQL_DELTA_INICIO, (proximo,))
+            else:
+                cur.execute(_SQL_DELTA, (anterior, proximo))
+            _aplicar(estado, cur.fetchall())
+            cur.execute(_SQL_INSERT_CHECKPOINT, (proximo, len(estado)))
+            _db.executar_em_massa(cur, _SQL_INSERT_ESTADO, (
+                (proximo, norm, e.id_coletor, e.id_registro, e.id_colaborador, e.data_registro)
+                for norm, e in estado.items()
+            ))
+            cn.commit()   # um checkpoint por transação: interrompido, continua do último
+            anterior, proximo = proximo, proximo + INTERVALO_CHECKPOINT
+            criados += 1
+    return criados
+
+
+def _data(texto: str) -> datetime:
+    return datetime.fromisoformat(texto)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Estado da frota numa data/hora.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p = sub.add_parser("checkpoints", help="cria os checkpoints que faltam")
+    p.add_argument("--refazer", action="store_true", help="apaga e regrava todos")
+    p = sub.add_parser("coletor", help="estado de um coletor")
+    p.add_argument("id_coletor")
+    p.add_argument("--em", type=_data, default=None, help="AAAA-MM-DD[ HH:MM:SS] (padrão: agora)")
+    p = sub.add_parser("frota", help="totais por status")
+    p.add_argument("--em", type=_data, default=None, help="AAAA-MM-DD[ HH:MM:SS] (padrão: agora)")
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.comando == "checkpoints":
+        n = criar_checkpoints(refazer=args.refazer)
+        print(f"{n} checkpoint(s) criado(s) (intervalo de {INTERVALO_CHECKPOINT.days} dia(s)).")
+    elif args.comando == "coletor":
+        quando = args.em or datetime.now()
+        e = estado_do_coletor_em(args.id_coletor, quando)
+        if e is None:
+            print(f"{args.id_coletor} em {quando:%d/%m/%Y %H:%M:%S}: DISPONIVEL (sem movimentos até lá)")
+        else:
+            print(f"{e.id_coletor} em {quando:%d/%m/%Y %H:%M:%S}: {e.status}"
+                  f"{' com ' + e.id_colaborador if e.id_colaborador else ''} "
+                  f"(último movimento {e.data_registro:%d/%m/%Y %H:%M:%S})")
+    else:
+        quando = args.em or datetime.now()
+        print(f"Frota em {quando:%d/%m/%Y %H:%M:%S}:")
+        for st, n in totais_em(quando).items():
+            print(f"  {st:<12} {n:>6}")
+    print(f"({(time.perf_counter() - t0) * 1000:.0f} ms)")
+    _db.fechar_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# executor_db.py
+# ------------------------------------------------------------
+# Executa chamadas de banco (db / mov_validacoes) fora da thread do Tk.
+# - leituras num pool de threads, por "canal" (ex.: 'coletor', 'resp'):
+#   uma nova leitura no mesmo canal torna a anterior obsoleta (resultado
+#   descartado / cancelada se ainda não começou); com chave_consulta, a
+#   mesma consulta ainda em andamento no canal não é enviada de novo
+# - gravações numa fila serial (ordem preservada, nunca descartadas)
+# - resultados voltam para a thread do Tk por uma fila drenada via after()
+#   (Tk não é thread-safe: nenhuma thread de trabalho toca em widgets)
+# ------------------------------------------------------------
+from __future__ import annotations
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, Optional
+
+Callback = Optional[Callable[..., None]]
+
+
+class ExecutorDB:
+    def __init__(self, widget, leituras: int = 4, intervalo_ms: int = 25,
+                 ao_ocupado: Optional[Callable[[str, bool], None]] = None):
+        """
+        widget: qualquer widget Tk (usado só para agendar o after()).
+        ao_ocupado(canal, ocupado): chamado na thread do Tk quando um canal
+        passa a ter (ou deixa de ter) trabalho pendente — use para o
+        indicador de "consultando..." de cada campo.
+        """
+        self._widget = widget
+        self._intervalo = intervalo_ms
+        self._ao_ocupado = ao_ocupado
+        self._pool_leitura = ThreadPoolExecutor(max_workers=leituras, thread_name_prefix="db-leitura")
+        self._pool_escrita = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-escrita")
+        self._fila: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._geracao: Dict[str, int] = {}
+        self._ultimo: Dict[str, Future] = {}
+        self._chave_ultimo: Dict[str, Hashable] = {}
+        self._pendentes: Dict[str, int] = {}
+        self._ativo = True
+        self._widget.after(self._intervalo, self._drenar)
+
+    # --- internos (thread do Tk) ---
+    def _marcar(self, canal: str, delta: int) -> None:
+        antes = self._pendentes.get(canal, 0)
+        depois = max(0, antes + delta)
+        self._pendentes[canal] = depois
+        if self._ao_ocupado and (antes == 0) != (depois == 0):
+            self._ao_ocupado(canal, depois > 0)
+
+    def _drenar(self) -> None:
+        if not self._ativo:
+            return
+        try:
+            while True:
+                try:
+                    canal, geracao, ok, valor, ao_concluir, ao_falhar = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+                self._marcar(canal, -1)
+                if geracao is not None and geracao != self._geracao.get(canal):
+                    continue  # leitura obsoleta: já existe uma mais nova no canal
+                cb = ao_concluir if ok else ao_falhar
+                if cb is not None:
+                    try:
+                        cb(valor)
+                    except Exception as e:  # não derruba o laço de drenagem
+                        print(f"Erro no callback do canal {canal}: {e}")
+        finally:
+            if self._ativo:
+                self._widget.after(self._intervalo, self._drenar)
+
+    def _submeter(self, pool: ThreadPoolExecutor, canal: str, geracao: Optional[int],
+                  fn: Callable, args, kwargs, ao_concluir: Callback, ao_falhar: Callback) -> Future:
+        fila = self._fila
+
+        def tarefa():
+            try:
+                valor = fn(*args, **kwargs)
+            except Exception as e:
+                fila.put((canal, geracao, False, e, ao_concluir, ao_falhar))
+            else:
+                fila.put((canal, geracao, True, valor, ao_concluir, ao_falhar))
+
+        self._marcar(canal, +1)
+        fut = pool.submit(tarefa)
+        return fut
+
+    # --- API (chamar na thread do Tk) ---
+    def ler(self, canal: str, fn: Callable, *args,
+            ao_concluir: Callback = None, ao_falhar: Callback = None,
+            chave_consulta: Optional[Hashable] = None, **kwargs) -> Future:
+        """
+        Agenda uma leitura no canal. Se já havia uma leitura no mesmo canal,
+        ela é cancelada (se ainda na fila) ou tem o resultado ignorado.
+        chave_consulta: se a leitura pendente do canal tem a mesma chave, ela
+        é mantida (e entrega o resultado) e nada novo é enviado.
+        """
+        anterior = self._ultimo.get(canal)
+        if (chave_consulta is not None and anterior is not None and not anterior.done()
+                and self._chave_ultimo.get(canal) == chave_consulta):
+            return anterior
+        self._chave_ultimo[canal] = chave_consulta
+        geracao = self._geracao.get(canal, 0) + 1
+        self._geracao[canal] = geracao
+        if anterior is not None and anterior.cancel():
+            self._marcar(canal, -1)
+        fut = self._submeter(self._pool_leitura, canal, geracao, fn, args, kwargs, ao_concluir, ao_falhar)
+        self._ultimo[canal] = fut
+        return fut
+
+    def gravar(self, fn: Callable, *args, canal: str = "salvar",
+               ao_concluir: Callback = None, ao_falhar: Callback = None, **kwargs) -> Future:
+        """Agenda uma gravação na fila serial; todas são executadas e notificadas."""
+        return self._submeter(self._pool_escrita, canal, None, fn, args, kwargs, ao_concluir, ao_falhar)
+
+    def ocupado(self, canal: str) -> bool:
+        return self._pendentes.get(canal, 0) > 0
+
+    def encerrar(self) -> None:
+        """Para a drenagem; leituras pendentes são canceladas, gravações terminam."""
+        self._ativo = False
+        self._pool_leitura.shutdown(wait=False, cancel_futures=True)
+        self._pool_escrita.shutdown(wait=False)
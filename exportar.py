@@ -0,0 +1,425 @@
+# exportar.py
+# ------------------------------------------------------------
+# Exportação do histórico de movimentações em fluxo (CSV ou Parquet).
+# - uma única consulta ordenada pela chave da tabela, lida com fetchmany
+#   em blocos fixos: memória constante, qualquer tamanho de histórico
+# - filtros: período (desde inclusive, até exclusive), coletor (chave
+#   normalizada) e ações (chaves de ID_REGISTRO ou textos da UI)
+# - retomada por chave (keyset): o progresso vai para <saida>.progresso.json
+#   a cada bloco gravado; --retomar continua do último bloco confirmado
+#   - CSV: o arquivo é truncado no último byte confirmado e segue em append
+#   - Parquet: um arquivo por parte (<saida>/parte-00000.parquet...), o
+#     progresso só avança quando a parte fecha; a parte incompleta é refeita
+# - linhas/s informadas por callback (CLI imprime a cada bloco)
+# Parquet usa pyarrow (opcional: pip install pyarrow).
+# Linhas antigas precisam de IDColetorNorm (python migracoes.py backfill-norm).
+#
+# Uso:
+#   python exportar.py historico.csv --desde 2024-01-01 --ate 2024-07-01
+#   python exportar.py historico_pq --formato parquet --acao ENTREGA --acao DEVOLUCAO
+#   python exportar.py defeitos.csv --tabela defeitos --coletor 000123
+#   python exportar.py historico.csv --retomar
+# ------------------------------------------------------------
+from __future__ import annotations
+import argparse
+import csv
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import db as _db
+from mov_validacoes import ACAO_BY_IDREG, ID_REGISTRO, normalizar_acao, normalizar_id_coletor
+
+TAMANHO_BLOCO = int(os.getenv("EXPORTAR_BLOCO", "10000"))
+LINHAS_POR_PARTE = 1_000_000     # Parquet: linhas por arquivo de parte
+
+# Colunas exportadas: (nome, tipo). "Acao" é derivada de IDRegistro.
+# tipos: data | inteiro | texto | logico
+_COLUNAS_MOVIMENTOS = (
+    ("DataRegistro", "data"), ("IDRegistro", "inteiro"), ("Acao", "texto"),
+    ("IDColetor", "texto"), ("IDColetorNorm", "texto"), ("IDColaborador", "texto"),
+    ("RealizadoTeste", "logico"), ("DetectadoDefeito", "logico"), ("SinalizaConserto", "logico"),
+    ("Observacao", "texto"), ("RespProcesso", "texto"), ("DataEnvioConserto", "texto"),
+    ("Chamado", "texto"), ("DataRetornoConserto", "texto"),
+)
+
+_COLUNAS_DEFEITOS = (
+    ("DataRegistro", "data"), ("IDRegistro", "inteiro"), ("Acao", "texto"),
+    ("IDColetor", "texto"), ("IDColetorNorm", "texto"), ("IDDefeito", "texto"),
+    ("RespProcesso", "texto"),
+)
+
+
+@dataclass(frozen=True)
+class _Tabela:
+    nome: str
+    colunas: Tuple[Tuple[str, str], ...]
+    chave: Tuple[str, ...]      # ordenação e retomada; prefixo coberto por índice
+
+
+TABELAS: Dict[str, _Tabela] = {
+    "movimentos": _Tabela("LG_ControleColetores", _COLUNAS_MOVIMENTOS,
+                          ("DataRegistro", "IDColetorNorm", "IDRegistro")),
+    "defeitos": _Tabela("LG_ControleColetoresDefeito", _COLUNAS_DEFEITOS,
+                        ("DataRegistro", "IDColetorNorm", "IDRegistro", "IDDefeito")),
+}
+
+
+@dataclass
+class Filtros:
+    desde: Optional[datetime] = None
+    ate: Optional[datetime] = None
+    coletor: Optional[str] = None
+    acoes: List[str] = field(default_factory=list)   # chaves de ID_REGISTRO
+
+    def como_dict(self) -> Dict:
+        return {
+            "desde": self.desde.isoformat() if self.desde else None,
+            "ate": self.ate.isoformat() if self.ate else None,
+            "coletor": self.coletor,
+            "acoes": sorted(self.acoes),
+        }
+
+
+@dataclass
+class ResumoExportacao:
+    linhas: int
+    segundos: float
+    arquivos: List[str]
+
+    @property
+    def linhas_por_s(self) -> float:
+        return self.linhas / self.segundos if self.segundos else 0.0
+
+
+class ErroExportacao(RuntimeError):
+    """Parâmetros ou progresso incompatíveis com a exportação pedida."""
+
+
+def montar_filtros(desde: Optional[str] = None, ate: Optional[str] = None,
+                   coletor: Optional[str] = None, acoes: Sequence[str] = ()) -> Filtros:
+    """Converte os parâmetros da linha de comando (texto) em Filtros."""
+    chaves = []
+    for a in acoes:
+        ac = a.strip().upper() if a.strip().upper() in ID_REGISTRO else normalizar_acao(a)
+        if ac not in ID_REGISTRO:
+            raise ErroExportacao(f"ação desconhecida: {a!r} (use {', '.join(ID_REGISTRO)})")
+        chaves.append(ac)
+    return Filtros(
+        desde=datetime.fromisoformat(desde) if desde else None,
+        ate=datetime.fromisoformat(ate) if ate else None,
+        coletor=normalizar_id_coletor(coletor) if coletor else None,
+        acoes=sorted(set(chaves)),
+    )
+
+
+# ---------------------------
+# SQL
+# ---------------------------
+
+def _condicao_apos(chave: Sequence[str], valores: Sequence) -> Tuple[str, List]:
+    """
+    WHERE de retomada: chave >= valores na ordem de ORDER BY (ASC, NULL primeiro).
+    Cadeia de ORs em vez de comparação de tupla (T-SQL não tem); o >= final
+    inclui os empates, descontados depois pelo contador salvo no progresso.
+    """
+    ramos, params = [], []
+    for i, col in enumerate(chave):
+        partes, p = [], []
+        for c, v in zip(chave[:i], valores[:i]):
+            if v is None:
+                partes.append(f"{c} IS NULL")
+            else:
+                partes.append(f"{c} = ?")
+                p.append(v)
+        v = valores[i]
+        if i < len(chave) - 1:
+            partes.append(f"{col} IS NOT NULL" if v is None else f"{col} > ?")
+        elif v is not None:
+            partes.append(f"{col} >= ?")    # último: >= NULL não restringe nada
+        if v is not None:
+            p.append(v)
+        ramos.append("(" + (" AND ".join(partes) or "1 = 1") + ")")
+        params.extend(p)
+    return "(" + " OR ".join(ramos) + ")", params
+
+
+def _montar_sql(tabela: _Tabela, filtros: Filtros, apos: Optional[Sequence]) -> Tuple[str, List]:
+    colunas = [c for c, _ in tabela.colunas if c != "Acao"]
+    where, params = [], []
+    if filtros.desde:
+        where.append("DataRegistro >= ?")
+        params.append(filtros.desde)
+    if filtros.ate:
+        where.append("DataRegistro < ?")
+        params.append(filtros.ate)
+    if filtros.coletor:
+        where.append("IDColetorNorm = ?")
+        params.append(filtros.coletor)
+    if filtros.acoes:
+        where.append(f"IDRegistro IN ({', '.join('?' * len(filtros.acoes))})")
+        params.extend(ID_REGISTRO[a] for a in filtros.acoes)
+    if apos is not None:
+        cond, p = _condicao_apos(tabela.chave, apos)
+        where.append(cond)
+        params.extend(p)
+    sql = f"SELECT {', '.join(colunas)} FROM {tabela.nome}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {', '.join(tabela.chave)}"
+    return sql, params
+
+
+# ---------------------------
+# Progresso (retomada)
+# ---------------------------
+
+def _caminho_progresso(saida: str) -> str:
+    return saida.rstrip("/\\") + ".progresso.json"
+
+
+def _valor_json(v):
+    return v.isoformat() if isinstance(v, (datetime, date)) else v
+
+
+def _ler_progresso(saida: str) -> Optional[Dict]:
+    try:
+        with open(_caminho_progresso(saida), encoding="utf-8") as f:
+            prog = json.load(f)
+    except FileNotFoundError:
+        return None
+    prog["chave"] = [datetime.fromisoformat(prog["chave"][0])] + prog["chave"][1:] if prog["chave"] else None
+    return prog
+
+
+def _gravar_progresso(saida: str, prog: Dict) -> None:
+    destino = _caminho_progresso(saida)
+    tmp = destino + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({**prog, "chave": [_valor_json(v) for v in prog["chave"] or []]}, f)
+    os.replace(tmp, destino)
+
+
+# ---------------------------
+# Saídas
+# ---------------------------
+
+def _celula(valor, tipo: str):
+    if valor is None:
+        return None
+    if tipo == "logico":
+        return bool(valor)
+    if tipo == "texto" and not isinstance(valor, str):
+        return str(valor)
+    return valor
+
+
+class _SaidaCSV:
+    def __init__(self, caminho: str, colunas: Sequence[str], prog: Optional[Dict], separador: str):
+        self.arquivos = [caminho]
+        if prog is not None:
+            with open(caminho, "r+b") as f:
+                f.truncate(prog["bytes"])   # descarta o que veio depois do último bloco confirmado
+            self._f = open(caminho, "a", encoding="utf-8", newline="")
+        else:
+            self._f = open(caminho, "w", encoding="utf-8-sig", newline="")  # BOM: Excel reconhece UTF-8
+        self._csv = csv.writer(self._f, delimiter=separador)
+        if prog is None:
+            self._csv.writerow(colunas)
+
+    def escrever(self, linhas: List[list]) -> None:
+        self._csv.writerows(linhas)
+
+    def confirmar(self) -> Optional[Dict]:
+        """Garante o bloco no disco; devolve o que vai no progresso."""
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        return {"bytes": self._f.tell()}
+
+    def fechar(self) -> None:
+        self._f.close()
+
+
+class _SaidaParquet:
+    def __init__(self, pasta: str, colunas: Sequence[Tuple[str, str]], prog: Optional[Dict],
+                 linhas_por_parte: int):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ErroExportacao("Exportação Parquet requer pyarrow (pip install pyarrow).") from e
+        self._pa, self._pq = pa, pq
+        tipos = {"data": pa.timestamp("ms"), "inteiro": pa.int32(), "texto": pa.string(), "logico": pa.bool_()}
+        self._schema = pa.schema([(c, tipos[t]) for c, t in colunas])
+        self._pasta = pasta
+        self._linhas_por_parte = linhas_por_parte
+        self._parte = prog["parte"] if prog is not None else 0
+        self._na_parte = 0
+        self._escritor = None
+        self.arquivos: List[str] = []
+        os.makedirs(pasta, exist_ok=True)
+
+    def _caminho_parte(self) -> str:
+        return os.path.join(self._pasta, f"parte-{self._parte:05d}.parquet")
+
+    def escrever(self, linhas: List[list]) -> None:
+        if self._escritor is None:
+            self._escritor = self._pq.ParquetWriter(self._caminho_parte(), self._schema)
+            self.arquivos.append(self._caminho_parte())
+        colunas = [self._pa.array(col, type=tipo) for col, tipo in zip(zip(*linhas), self._schema.types)]
+        self._escritor.write_table(self._pa.Table.from_arrays(colunas, schema=self._schema))  # um row group por bloco
+        self._na_parte += len(linhas)
+
+    def confirmar(self) -> Optional[Dict]:
+        """Só há progresso novo quando uma parte fecha (Parquet sem rodapé é ilegível)."""
+        if self._na_parte < self._linhas_por_parte:
+            return None
+        self._fechar_parte()
+        return {"parte": self._parte}
+
+    def _fechar_parte(self) -> None:
+        if self._escritor is not None:
+            self._escritor.close()
+            self._escritor = None
+            self._parte += 1
+            self._na_parte = 0
+
+    def fechar(self) -> None:
+        self._fechar_parte()
+
+
+# ---------------------------
+# Exportação
+# ---------------------------
+
+@_db.operacao("exportar")
+def exportar(
+    saida: str,
+    filtros: Optional[Filtros] = None,
+    tabela: str = "movimentos",
+    formato: str = "csv",
+    retomar: bool = False,
+    tamanho_bloco: Optional[int] = None,
+    separador: str = ",",
+    linhas_por_parte: int = LINHAS_POR_PARTE,
+    ao_progredir: Optional[Callable[[int, float], None]] = None,
+) -> ResumoExportacao:
+    """
+    Exporta `tabela` ("movimentos" | "defeitos") para `saida` em `formato`
+    ("csv" = arquivo, "parquet" = pasta de partes), lendo em blocos de
+    `tamanho_bloco` linhas. `ao_progredir(linhas, segundos)` é chamado a cada bloco.
+    Com `retomar`, continua do progresso salvo (mesmos filtros/tabela/formato).
+    """
+    if tabela not in TABELAS:
+        raise ErroExportacao(f"tabela desconhecida: {tabela!r} (use {', '.join(TABELAS)})")
+    if formato not in ("csv", "parquet"):
+        raise ErroExportacao(f"formato desconhecido: {formato!r} (use csv ou parquet)")
+    tab = TABELAS[tabela]
+    filtros = filtros or Filtros()
+    tamanho_bloco = tamanho_bloco or TAMANHO_BLOCO
+    identidade = {"tabela": tabela, "formato": formato, "filtros": filtros.como_dict()}
+
+    prog = _ler_progresso(saida) if retomar else None
+    if prog is not None and prog["identidade"] != identidade:
+        raise ErroExportacao("O progresso salvo é de outra exportação (tabela/formato/filtros diferentes).")
+    if prog is None and os.path.exists(_caminho_progresso(saida)):
+        os.remove(_caminho_progresso(saida))     # exportação nova: progresso antigo não vale
+
+    nomes = [c for c, _ in tab.colunas]
+    tipos = [t for _, t in tab.colunas]
+    saida_arq = (_SaidaCSV(saida, nomes, prog, separador) if formato == "csv"
+                 else _SaidaParquet(saida, tab.colunas, prog, linhas_por_parte))
+
+    lidas = [c for c in nomes if c != "Acao"]
+    pos_chave = [lidas.index(c) for c in tab.chave]
+    pos_idreg = lidas.index("IDRegistro")
+    chave = prog["chave"] if prog else None
+    empates = prog["empates"] if prog else 0      # linhas já gravadas com chave == `chave`
+    total = prog["linhas"] if prog else 0
+    pular = empates
+
+    sql, params = _montar_sql(tab, filtros, chave)
+    t0 = time.perf_counter()
+    novas = 0
+    try:
+        with _db.conectar(leitura=True) as cn, cn.cursor() as cur:
+            cur.arraysize = tamanho_bloco
+            cur.execute(sql, params)
+            while True:
+                bloco = cur.fetchmany(tamanho_bloco)
+                if not bloco:
+                    break
+                linhas = []
+                for r in bloco:
+                    k = [r[i] for i in pos_chave]
+                    if k == chave:
+                        if pular:
+                            pular -= 1
+                            continue
+                        empates += 1
+                    else:
+                        chave, empates = k, 1
+                    valores = list(r)
+                    valores.insert(nomes.index("Acao"), ACAO_BY_IDREG.get(r[pos_idreg]))
+                    linhas.append([_celula(v, t) for v, t in zip(valores, tipos)])
+                if not linhas:
+                    continue
+                saida_arq.escrever(linhas)
+                total += len(linhas)
+                novas += len(linhas)
+                extra = saida_arq.confirmar()
+                if extra is not None:
+                    _gravar_progresso(saida, {"identidade": identidade, "chave": chave,
+                                              "empates": empates, "linhas": total, **extra})
+                if ao_progredir:
+                    ao_progredir(total, time.perf_counter() - t0)
+    finally:
+        saida_arq.fechar()
+    if os.path.exists(_caminho_progresso(saida)):
+        os.remove(_caminho_progresso(saida))     # concluída: nada a retomar
+    return ResumoExportacao(total, time.perf_counter() - t0, saida_arq.arquivos)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Exporta o histórico de movimentações (CSV/Parquet).")
+    parser.add_argument("saida", help="arquivo .csv ou pasta do Parquet")
+    parser.add_argument("--tabela", choices=list(TABELAS), default="movimentos")
+    parser.add_argument("--formato", choices=["csv", "parquet"])
+    parser.add_argument("--desde", help="AAAA-MM-DD[ HH:MM:SS], inclusive")
+    parser.add_argument("--ate", help="AAAA-MM-DD[ HH:MM:SS], exclusive")
+    parser.add_argument("--coletor")
+    parser.add_argument("--acao", action="append", default=[], help="ENTREGA, DEVOLUCAO... (repetível)")
+    parser.add_argument("--bloco", type=int, default=TAMANHO_BLOCO, help="linhas por fetchmany")
+    parser.add_argument("--separador", default=",", help="CSV: separador de campos")
+    parser.add_argument("--retomar", action="store_true", help="continua do último bloco confirmado")
+    args = parser.parse_args(argv)
+
+    formato = args.formato or ("csv" if args.saida.lower().endswith(".csv") else "parquet")
+    try:
+        filtros = montar_filtros(args.desde, args.ate, args.coletor, args.acao)
+    except (ErroExportacao, ValueError) as e:
+        parser.error(str(e))
+
+    def progresso(linhas: int, segundos: float) -> None:
+        print(f"\r{linhas:>12,} linhas  {linhas / segundos if segundos else 0:>10,.0f} linhas/s",
+              end="", flush=True)
+
+    try:
+        r = exportar(args.saida, filtros, args.tabela, formato, args.retomar, args.bloco,
+                     args.separador, ao_progredir=progresso)
+    except ErroExportacao as e:
+        print(f"Erro: {e}")
+        raise SystemExit(2)
+    except KeyboardInterrupt:
+        print("\nInterrompido; continue com --retomar.")
+        raise SystemExit(130)
+    print(f"\n{r.linhas:,} linhas em {r.segundos:.1f}s ({r.linhas_por_s:,.0f} linhas/s) -> "
+          f"{', '.join(r.arquivos) or args.saida}")
+    _db.fechar_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+# frota_lista.py
+# ------------------------------------------------------------
+# Lista da frota para a tela de consulta: cadastro (COLETORES_CADASTRO) +
+# estado atual (LG_ColetoresEstadoAtual), em páginas.
+# - paginação por chave (keyset): a próxima página começa depois do último
+#   IDColetorNorm lido, seek no IX_COLETORES_CADASTRO_Norm; custo igual na
+#   primeira e na milésima página (sem OFFSET)
+# - filtros no servidor: status (IDRegistro de STATUS_BY_IDREG; sem
+#   movimento = DISPONIVEL), colaborador (prefixo) e número de série
+#   (trecho)
+# - um item por coletor: IDColetores repetido no cadastro -> o primeiro
+#   (mesma regra do lookup de série)
+# - a ordem é a do índice (texto): '10' vem antes de '9'
+#
+# Uso:
+#   python frota_lista.py --status "EM CONSERTO" --paginas 2
+# ------------------------------------------------------------
+from __future__ import annotations
+import argparse
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import db as _db
+from mov_validacoes import STATUS_BY_IDREG
+
+TAMANHO_PAGINA = 200
+_TAMANHO_MAX = 2000
+
+_SQL_FROTA = """
+    SELECT TOP {n} A.IDColetorNorm, LTRIM(RTRIM(A.IDColetores)), LTRIM(RTRIM(A.NumSerie)),
+           B.IDRegistro, B.IDColaborador, B.DataRegistro
+    FROM COLETORES_CADASTRO A WITH (NOLOCK)
+    LEFT JOIN LG_ColetoresEstadoAtual B WITH (NOLOCK) ON B.IDColetorNorm = A.IDColetorNorm
+    WHERE A.IDColetorNorm > ?
+      AND NOT EXISTS (SELECT 1 FROM COLETORES_CADASTRO A2 WITH (NOLOCK)
+                      WHERE A2.IDColetorNorm = A.IDColetorNorm AND A2.IDColetores < A.IDColetores)
+      {filtros}
+    ORDER BY A.IDColetorNorm
+"""
+
+_SQL_CONTAR = """
+    SELECT COUNT(*)
+    FROM COLETORES_CADASTRO A WITH (NOLOCK)
+    LEFT JOIN LG_ColetoresEstadoAtual B WITH (NOLOCK) ON B.IDColetorNorm = A.IDColetorNorm
+    WHERE A.IDColetorNorm IS NOT NULL
+      AND NOT EXISTS (SELECT 1 FROM COLETORES_CADASTRO A2 WITH (NOLOCK)
+                      WHERE A2.IDColetorNorm = A.IDColetorNorm AND A2.IDColetores < A.IDColetores)
+      {filtros}
+"""
+
+
+@dataclass
+class ColetorFrota:
+    id_coletor: str
+    num_serie: Optional[str]
+    status: str
+    id_colaborador: Optional[str]
+    data_registro: Optional[datetime]   # último movimento; None = nunca movimentado
+
+
+@dataclass
+class PaginaFrota:
+    itens: List[ColetorFrota]
+    proxima: Optional[str]              # passe em `apos` para a página seguinte; None = fim
+
+
+def _like(texto: str) -> str:
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_").replace("[", "\\[")
+
+
+def _filtros(status: Optional[str], colaborador: Optional[str], serie: Optional[str]) -> Tuple[str, list]:
+    """Trecho AND ... e parâmetros; status desconhecido -> ValueError."""
+    sql, params = [], []
+    if status:
+        ids = [k for k, v in STATUS_BY_IDREG.items() if v == status]
+        if not ids:
+            raise ValueError(f"status desconhecido: {status}")
+        cond = []
+        numeros = [str(int(k)) for k in ids if k is not None]
+        if numeros:
+            cond.append(f"B.IDRegistro IN ({', '.join(numeros)})")
+        if None in ids:
+            cond.append("B.IDRegistro IS NULL")
+        sql.append(f"AND ({' OR '.join(cond)})")
+    colaborador = (colaborador or "").strip()
+    if colaborador:
+        sql.append("AND B.IDColaborador LIKE ? ESCAPE '\\'")
+        params.append(_like(colaborador) + "%")
+    serie = (serie or "").strip()
+    if serie:
+        sql.append("AND A.NumSerie LIKE ? ESCAPE '\\'")
+        params.append("%" + _like(serie) + "%")
+    return "\n      ".join(sql), params
+
+
+@_db.operacao("frota_pagina")
+@_db.repetir_transitorio()
+def pagina_frota(
+    apos: Optional[str] = None,
+    tamanho: int = TAMANHO_PAGINA,
+    status: Optional[str] = None,
+    colaborador: Optional[str] = None,
+    serie: Optional[str] = None,
+) -> PaginaFrota:
+    """Até `tamanho` coletores depois de `apos` (IDColetorNorm), já filtrados."""
+    tamanho = max(1, min(int(tamanho), _TAMANHO_MAX))
+    filtros, params = _filtros(status, colaborador, serie)
+    sql = _SQL_FROTA.format(n=tamanho + 1, filtros=filtros)   # +1: há próxima página?
+    with _db.conectar(leitura=True) as cn, cn.cursor() as cur:
+        cur.execute(sql, (apos or "", *params))
+        linhas = cur.fetchall()
+    itens = [
+        ColetorFrota(id_coletor, serie_, STATUS_BY_IDREG.get(idreg, "DISPONIVEL"),
+                     (colab or "").strip() or None, data)
+        for _norm, id_coletor, serie_, idreg, colab, data in linhas[:tamanho]
+    ]
+    proxima = linhas[tamanho - 1][0] if len(linhas) > tamanho else None
+    return PaginaFrota(itens, proxima)
+
+
+@_db.operacao("frota_contar")
+@_db.repetir_transitorio()
+def contar_frota(status: Optional[str] = None, colaborador: Optional[str] = None,
+                 serie: Optional[str] = None) -> int:
+    """Total de coletores com os mesmos filtros de pagina_frota()."""
+    filtros, params = _filtros(status, colaborador, serie)
+    with _db.conectar(leitura=True) as cn, cn.cursor() as cur:
+        cur.execute(_SQL_CONTAR.format(filtros=filtros), params)
+        return int(cur.fetchone()[0])
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Lista a frota em páginas, com filtros.")
+    parser.add_argument("--status", choices=sorted(set(STATUS_BY_IDREG.values())))
+    parser.add_argument("--colaborador", help="prefixo do IDColaborador")
+    parser.add_argument("--serie", help="trecho do número de série")
+    parser.add_argument("--tamanho", type=int, default=TAMANHO_PAGINA)
+    parser.add_argument("--paginas", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    filtros = dict(status=args.status, colaborador=args.colaborador, serie=args.serie)
+    print(f"{contar_frota(**filtros):,} coletores")
+    apos = None
+    for _ in range(args.paginas):
+        pagina = pagina_frota(apos, args.tamanho, **filtros)
+        for c in pagina.itens:
+            data = f"{c.data_registro:%d/%m/%Y %H:%M}" if c.data_registro else "-"
+            print(f"  {c.id_coletor:<12} {c.num_serie or '-':<16} {c.status:<12} "
+                  f"{c.id_colaborador or '-':<12} {data}")
+        apos = pagina.proxima
+        if apos is None:
+            break
+    _db.fechar_pool()
+
+
+if __name__ == "__main__":
+    main()
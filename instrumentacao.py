@@ -0,0 +1,463 @@
+# instrumentacao.py
+# ------------------------------------------------------------
+# Medição das consultas feitas pelo db.py (desligada por padrão).
+# - cada cursor entregue por db.conectar() é embrulhado em
+#   CursorInstrumentado: tempo de execute, de fetch e linhas
+# - o tempo de obter a conexão do pool entra como fase "conectar"
+# - tudo é agrupado pela operação lógica corrente, definida com
+#   `with operacao("status_atual"):` ou `@operacao("totais")`
+# - histogramas: baldes acumulados + janela das últimas N amostras
+#   (p50/p95/p99 "recentes")
+# - consultas acima de DB_LENTA_MS vão para um log de lentas, com os
+#   parâmetros trocados por tipo/tamanho (sem dados pessoais)
+# - retrato em JSON (arquivo regravado periodicamente) e/ou texto num
+#   endpoint HTTP local (127.0.0.1) para coleta
+# Desligada, o custo é uma checagem de flag por cursor/operação.
+#
+# Ambiente:
+#   DB_INSTRUMENTACAO=1      liga
+#   DB_LENTA_MS=500          limite do log de lentas (ms)
+#   DB_LOG_LENTAS=consultas_lentas.log
+#   DB_METRICAS_JSON=metricas_db.json   (opcional)
+#   DB_METRICAS_PORTA=9464               (opcional, só localhost)
+#   DB_METRICAS_INTERVALO=15             (s entre gravações do JSON)
+# ------------------------------------------------------------
+from __future__ import annotations
+import contextvars
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import ContextDecorator
+from datetime import datetime
+from typing import Callable, Deque, Dict, List, Optional
+
+ATIVA = os.getenv("DB_INSTRUMENTACAO", "0").lower() in ("1", "true", "sim", "yes")
+LIMITE_LENTA_MS = float(os.getenv("DB_LENTA_MS", "500"))
+ARQUIVO_LENTAS = os.getenv("DB_LOG_LENTAS", "consultas_lentas.log")
+
+SEM_OPERACAO = "sem_operacao"
+FASES = ("conectar", "execute", "fetch")
+
+# limites superiores dos baldes (ms); o último é "+Inf"
+BALDES_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+JANELA_AMOSTRAS = 1024
+
+_operacao_atual: contextvars.ContextVar[str] = contextvars.ContextVar("operacao_db", default=SEM_OPERACAO)
+
+
+def ativar(ligada: bool = True) -> None:
+    """Liga/desliga em tempo de execução (vale para os próximos cursores)."""
+    global ATIVA
+    ATIVA = ligada
+
+
+class operacao(ContextDecorator):
+    """
+    Nomeia as consultas feitas dentro do bloco/função.
+    Aninhado, vale o nome mais interno.
+    """
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self._tokens: List = []
+
+    def __enter__(self):
+        # token None: desligada na entrada (o __exit__ não mexe no contexto)
+        self._tokens.append(_operacao_atual.set(self.nome) if ATIVA else None)
+        return self
+
+    def _recreate_cm(self):
+        # como decorador, cada chamada usa uma instância própria (threads)
+        return operacao(self.nome)
+
+    def __exit__(self, *exc):
+        token = self._tokens.pop()
+        if token is not None:
+            _operacao_atual.reset(token)
+        return False
+
+
+def operacao_atual() -> str:
+    return _operacao_atual.get()
+
+
+# ---------------------------
+# Histogramas e registro
+# ---------------------------
+
+class Histograma:
+    """Baldes acumulados (desde o início) + últimas N amostras para percentis."""
+
+    __slots__ = ("n", "total_ms", "max_ms", "baldes", "recentes")
+
+    def __init__(self):
+        self.n = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.baldes = [0] * (len(BALDES_MS) + 1)
+        self.recentes: Deque[float] = deque(maxlen=JANELA_AMOSTRAS)
+
+    def registrar(self, ms: float) -> None:
+        self.n += 1
+        self.total_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        self.baldes[bisect_left(BALDES_MS, ms)] += 1
+        self.recentes.append(ms)
+
+    def retrato(self) -> Dict:
+        ordenados = sorted(self.recentes)
+
+        def pct(p: float) -> float:
+            if not ordenados:
+                return 0.0
+            return round(ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))], 3)
+
+        acumulado, baldes = 0, {}
+        for limite, qtd in zip(list(BALDES_MS) + ["+Inf"], self.baldes):
+            acumulado += qtd
+            baldes[str(limite)] = acumulado
+        return {
+            "n": self.n,
+            "total_ms": round(self.total_ms, 3),
+            "media_ms": round(self.total_ms / self.n, 3) if self.n else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "baldes_ms": baldes,
+        }
+
+
+class _MetricasOperacao:
+    __slots__ = ("fases", "linhas_lidas", "linhas_afetadas", "comandos", "erros", "lentas")
+
+    def __init__(self):
+        self.fases = {f: Histograma() for f in FASES}
+        self.linhas_lidas = 0
+        self.linhas_afetadas = 0
+        self.comandos = 0
+        self.erros = 0
+        self.lentas = 0
+
+
+class RegistroMetricas:
+    def __init__(self, limite_lenta_ms: float = LIMITE_LENTA_MS, arquivo_lentas: Optional[str] = ARQUIVO_LENTAS):
+        self._lock = threading.Lock()
+        self._ops: Dict[str, _MetricasOperacao] = {}
+        self.limite_lenta_ms = limite_lenta_ms
+        self.arquivo_lentas = arquivo_lentas
+        self._lock_log = threading.Lock()
+        self.iniciado_em = datetime.now()
+
+    def _op(self, nome: str) -> _MetricasOperacao:
+        m = self._ops.get(nome)
+        if m is None:
+            m = self._ops.setdefault(nome, _MetricasOperacao())
+        return m
+
+    def tempo(self, fase: str, ms: float, operacao_nome: Optional[str] = None) -> None:
+        with self._lock:
+            self._op(operacao_nome or _operacao_atual.get()).fases[fase].registrar(ms)
+
+    def comando(self, ms: float, sql: str, params, afetadas: int, erro: bool) -> None:
+        nome = _operacao_atual.get()
+        lenta = ms >= self.limite_lenta_ms
+        with self._lock:
+            m = self._op(nome)
+            m.fases["execute"].registrar(ms)
+            m.comandos += 1
+            if afetadas > 0:
+                m.linhas_afetadas += afetadas
+            if erro:
+                m.erros += 1
+            if lenta:
+                m.lentas += 1
+        if lenta:
+            self._logar_lenta(nome, ms, sql, params, erro)
+
+    def leitura(self, ms: float, linhas: int) -> None:
+        with self._lock:
+            m = self._op(_operacao_atual.get())
+            m.fases["fetch"].registrar(ms)
+            m.linhas_lidas += linhas
+
+    def _logar_lenta(self, nome: str, ms: float, sql: str, params, erro: bool) -> None:
+        if not self.arquivo_lentas:
+            return
+        campos = [datetime.now().isoformat(sep=" ", timespec="milliseconds"), nome, f"{ms:.1f}ms"]
+        if erro:
+            campos.append("ERRO")
+        campos += [_sql_compacto(sql), _redigir(params)]
+        linha = "\t".join(campos) + "\n"
+        try:
+            with self._lock_log, open(self.arquivo_lentas, "a", encoding="utf-8") as f:
+                f.write(linha)
+        except OSError:
+            pass  # log de lentas nunca derruba a consulta
+
+    def retrato(self) -> Dict:
+        with self._lock:
+            ops = {
+                nome: {
+                    "comandos": m.comandos,
+                    "linhas_lidas": m.linhas_lidas,
+                    "linhas_afetadas": m.linhas_afetadas,
+                    "erros": m.erros,
+                    "lentas": m.lentas,
+                    **{f: h.retrato() for f, h in m.fases.items() if h.n},
+                }
+                for nome, m in sorted(self._ops.items())
+            }
+        return {
+            "gerado_em": datetime.now().isoformat(timespec="seconds"),
+            "desde": self.iniciado_em.isoformat(timespec="seconds"),
+            "ativa": ATIVA,
+            "limite_lenta_ms": self.limite_lenta_ms,
+            "operacoes": ops,
+        }
+
+    def zerar(self) -> None:
+        with self._lock:
+            self._ops.clear()
+            self.iniciado_em = datetime.now()
+
+
+_ESPACOS = re.compile(r"\s+")
+
+def _sql_compacto(sql: str, limite: int = 500) -> str:
+    s = _ESPACOS.sub(" ", sql or "").strip()
+    return s if len(s) <= limite else s[:limite] + "…"
+
+
+def _redigir(params) -> str:
+    """Troca cada valor por tipo:tamanho (crachás, observações etc. não vão para o log)."""
+    if params is None:
+        return "[]"
+    if not isinstance(params, (list, tuple)):
+        params = (params,)
+    if len(params) > 20:
+        return f"[{len(params)} parâmetros]"
+    partes = []
+    for p in params:
+        if p is None:
+            partes.append("NULL")
+        elif isinstance(p, (str, bytes)):
+            partes.append(f"{type(p).__name__}:{len(p)}")
+        else:
+            partes.append(type(p).__name__)
+    return "[" + ", ".join(partes) + "]"
+
+
+registro = RegistroMetricas()
+
+
+# ---------------------------
+# Cursor
+# ---------------------------
+
+class CursorInstrumentado:
+    """Repassa tudo ao cursor real, medindo execute/executemany/fetch*."""
+
+    __slots__ = ("_cur",)
+
+    def __init__(self, cur):
+        object.__setattr__(self, "_cur", cur)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __setattr__(self, name, value):  # ex.: fast_executemany
+        setattr(self._cur, name, value)
+
+    def __enter__(self):
+        self._cur.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cur.__exit__(*exc)
+
+    def __iter__(self):
+        t0 = time.perf_counter()
+        n = 0
+        try:
+            for linha in self._cur:
+                n += 1
+                yield linha
+        finally:
+            registro.leitura((time.perf_counter() - t0) * 1000, n)
+
+    def _medir(self, metodo, sql, params, *args):
+        t0 = time.perf_counter()
+        erro = True
+        try:
+            r = metodo(sql, *args)
+            erro = False
+            return r
+        finally:
+            ms = (time.perf_counter() - t0) * 1000
+            afetadas = -1 if erro else getattr(self._cur, "rowcount", -1)
+            registro.comando(ms, sql, params, afetadas, erro)
+
+    def execute(self, sql, *params):
+        r = self._medir(self._cur.execute, sql, params[0] if len(params) == 1 else params, *params)
+        return self if r is self._cur else r
+
+    def executemany(self, sql, linhas):
+        linhas = list(linhas)
+        self._medir(self._cur.executemany, sql, [f"{len(linhas)} linhas"], linhas)
+
+    def _ler(self, metodo, *args):
+        t0 = time.perf_counter()
+        r = metodo(*args)
+        registro.leitura((time.perf_counter() - t0) * 1000, len(r))
+        return r
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        r = self._cur.fetchone()
+        registro.leitura((time.perf_counter() - t0) * 1000, 0 if r is None else 1)
+        return r
+
+    def fetchall(self):
+        return self._ler(self._cur.fetchall)
+
+    def fetchmany(self, *args):
+        return self._ler(self._cur.fetchmany, *args)
+
+    def nextset(self):
+        t0 = time.perf_counter()
+        r = self._cur.nextset()
+        registro.leitura((time.perf_counter() - t0) * 1000, 0)
+        return r
+
+
+def embrulhar_cursor(cur):
+    return CursorInstrumentado(cur) if ATIVA else cur
+
+
+def medir_conectar(obter: Callable):
+    """Executa `obter()` (checkout do pool) medindo a fase "conectar"."""
+    if not ATIVA:
+        return obter()
+    t0 = time.perf_counter()
+    try:
+        return obter()
+    finally:
+        registro.tempo("conectar", (time.perf_counter() - t0) * 1000)
+
+
+# ---------------------------
+# Exportação
+# ---------------------------
+
+def texto(retrato: Dict) -> str:
+    """Formato texto (estilo Prometheus) para coleta por scraper."""
+    linhas = []
+    for nome, m in retrato.get("operacoes", {}).items():
+        rotulo = f'operacao="{nome}"'
+        for chave in ("comandos", "linhas_lidas", "linhas_afetadas", "erros", "lentas"):
+            linhas.append(f"coletores_db_{chave}_total{{{rotulo}}} {m[chave]}")
+        for fase in FASES:
+            h = m.get(fase)
+            if not h:
+                continue
+            base = f"coletores_db_{fase}_ms"
+            for limite, qtd in h["baldes_ms"].items():
+                linhas.append(f'{base}_bucket{{{rotulo},le="{limite}"}} {qtd}')
+            linhas.append(f"{base}_sum{{{rotulo}}} {h['total_ms']}")
+            linhas.append(f"{base}_count{{{rotulo}}} {h['n']}")
+            for p in ("p50", "p95", "p99"):
+                linhas.append(f'{base}_recente{{{rotulo},quantil="{p}"}} {h[p + "_ms"]}')
+    for chave, valor in retrato.get("pool", {}).items():
+        linhas.append(f"coletores_db_pool_{chave} {valor}")
+    disjuntor = retrato.get("disjuntor") or {}
+    if disjuntor:
+        linhas.append(f"coletores_db_disjuntor_aberto {int(disjuntor['estado'] != 'fechado')}")
+        for chave in ("aberturas", "recusas", "sondas"):
+            linhas.append(f"coletores_db_disjuntor_{chave}_total {disjuntor[chave]}")
+    return "\n".join(linhas) + "\n"
+
+
+def gravar_json(caminho: str, retrato: Dict) -> None:
+    """Grava o retrato de forma atômica (arquivo temporário + replace)."""
+    tmp = caminho + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(retrato, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, caminho)
+
+
+class ExportadorMetricas:
+    """
+    Thread que regrava o JSON a cada `intervalo` s e/ou servidor HTTP local
+    (GET /metricas em texto, GET /metricas.json) em 127.0.0.1:`porta`.
+    `fonte` devolve o retrato atual (db.metricas()).
+    """
+
+    def __init__(self, fonte: Callable[[], Dict], caminho_json: Optional[str] = None,
+                 porta: Optional[int] = None, intervalo: float = 15.0):
+        self._fonte = fonte
+        self.caminho_json = caminho_json
+        self.porta = porta
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._http = None
+
+    def iniciar(self) -> "ExportadorMetricas":
+        if self.caminho_json and self._thread is None:
+            self._thread = threading.Thread(target=self._laco, name="metricas-db", daemon=True)
+            self._thread.start()
+        if self.porta and self._http is None:
+            self._iniciar_http()
+        return self
+
+    def _laco(self) -> None:
+        while not self._parar.wait(self.intervalo):
+            try:
+                gravar_json(self.caminho_json, self._fonte())
+            except Exception as e:
+                print(f"Falha ao exportar métricas do banco: {e}")
+
+    def _iniciar_http(self) -> None:
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        fonte = self._fonte
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metricas.json"):
+                    corpo = json.dumps(fonte(), ensure_ascii=False).encode("utf-8")
+                    tipo = "application/json"
+                elif self.path.startswith("/metricas"):
+                    corpo = texto(fonte()).encode("utf-8")
+                    tipo = "text/plain; version=0.0.4"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", f"{tipo}; charset=utf-8")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        self._http = ThreadingHTTPServer(("127.0.0.1", self.porta), _Handler)
+        threading.Thread(target=self._http.serve_forever, name="metricas-http", daemon=True).start()
+
+    def encerrar(self) -> None:
+        self._parar.set()
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+            self._http = None
+        if self.caminho_json:
+            try:
+                gravar_json(self.caminho_json, self._fonte())
+            except Exception:
+                pass
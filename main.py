@@ -1,4 +1,13 @@
-import ui_login
+import time
+
+_INICIO = time.perf_counter()  # referência da medição de abertura (--medir-inicio)
+
+import sys  # noqa: E402
+import ui_login  # noqa: E402
 
 if __name__ == "__main__":
-    ui_login.criar_tela_login()
+    ui_login.criar_tela_login(
+        inicio=_INICIO,
+        medir="--medir-inicio" in sys.argv,
+        sair_apos_medir="--sair" in sys.argv,
+    )
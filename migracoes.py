@@ -0,0 +1,288 @@
+# migracoes.py
+# ------------------------------------------------------------
+# Estruturas auxiliares (SQL Server) usadas por mov_validacoes.py e db.py
+# - LG_ColetoresEstadoAtual: projeção do ÚLTIMO movimento de cada coletor
+#   normalizado; mantida a cada INSERT e regenerável a partir do histórico.
+# - IDColetorNorm (chave normalizada) nas tabelas de movimento/defeito,
+#   preenchida no INSERT e, para linhas antigas, pelo backfill abaixo.
+# - índice único filtrado: um colaborador só pode estar EM OPERACAO com um
+#   coletor (última barreira contra estações concorrentes).
+# - ChaveIdempotencia (índice único filtrado): movimentação repetida não
+#   duplica o histórico.
+# - RV (rowversion) em COLETORES_CADASTRO: detecção exata de mudança por
+#   partição no cache de números de série (cache_lookup.py)
+# - LG_ColetoresCheckpoint(Estado): checkpoints do estado da frota
+#   (gravados por estado_em.py criar_checkpoints).
+#
+# Uso:
+#   python migracoes.py criar            # cria tabelas/colunas/índices que faltarem
+#   python migracoes.py backfill-norm    # preenche IDColetorNorm das linhas antigas
+#   python migracoes.py rebuild-estado   # regenera o estado atual do histórico
+# ------------------------------------------------------------
+from __future__ import annotations
+import argparse
+import time
+from typing import Dict
+
+import db as _db
+from mov_validacoes import normalizar_id_coletor
+
+_DDL_ESTADO_ATUAL = """
+IF OBJECT_ID('dbo.LG_ColetoresEstadoAtual', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.LG_ColetoresEstadoAtual (
+        IDColetorNorm  VARCHAR(50)  NOT NULL PRIMARY KEY,
+        IDColetor      VARCHAR(50)  NOT NULL,
+        IDRegistro     INT          NOT NULL,
+        IDColaborador  VARCHAR(50)  NULL,
+        DataRegistro   DATETIME     NOT NULL
+    );
+    CREATE INDEX IX_LG_ColetoresEstadoAtual_Colaborador
+        ON dbo.LG_ColetoresEstadoAtual (IDColaborador, IDRegistro);
+END
+"""
+
+# RV (rowversion) muda a cada INSERT/UPDATE da linha: marca d'água para
+# quem acompanha a projeção incrementalmente (totais_incrementais.py).
+_DDL_ESTADO_RV = """
+IF COL_LENGTH('dbo.LG_ColetoresEstadoAtual', 'RV') IS NULL
+    ALTER TABLE dbo.LG_ColetoresEstadoAtual ADD RV ROWVERSION;
+"""
+
+_DDL_ESTADO_RV_INDICE = """
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_LG_ColetoresEstadoAtual_RV')
+    CREATE INDEX IX_LG_ColetoresEstadoAtual_RV
+        ON dbo.LG_ColetoresEstadoAtual (RV) INCLUDE (IDRegistro);
+"""
+
+# Coluna de chave normalizada + índice de busca do "último movimento".
+# O valor é calculado em Python (normalizar_id_coletor) no INSERT/backfill.
+_DDL_CHAVE_NORM = """
+IF COL_LENGTH('dbo.LG_ControleColetores', 'IDColetorNorm') IS NULL
+    ALTER TABLE dbo.LG_ControleColetores ADD IDColetorNorm VARCHAR(50) NULL;
+IF COL_LENGTH('dbo.LG_ControleColetoresDefeito', 'IDColetorNorm') IS NULL
+    ALTER TABLE dbo.LG_ControleColetoresDefeito ADD IDColetorNorm VARCHAR(50) NULL;
+"""
+
+_DDL_INDICES_NORM = """
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_LG_ControleColetores_Norm')
+    CREATE INDEX IX_LG_ControleColetores_Norm
+        ON dbo.LG_ControleColetores (IDColetorNorm, DataRegistro DESC, IDRegistro DESC)
+        INCLUDE (IDColetor, IDColaborador);
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_LG_ControleColetoresDefeito_Norm')
+    CREATE INDEX IX_LG_ControleColetoresDefeito_Norm
+        ON dbo.LG_ControleColetoresDefeito (IDColetorNorm, DataRegistro);
+"""
+
+# Ordem da exportação em fluxo (exportar.py): varredura por período sem sort.
+_DDL_INDICE_EXPORTACAO = """
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_LG_ControleColetores_Data')
+    CREATE INDEX IX_LG_ControleColetores_Data
+        ON dbo.LG_ControleColetores (DataRegistro, IDColetorNorm, IDRegistro);
+"""
+
+# Checkpoints do estado da frota (estado_em.py): estado completo em datas
+# fixas, para consultas "como estava em D" lerem no máximo um intervalo.
+_DDL_CHECKPOINTS = """
+IF OBJECT_ID('dbo.LG_ColetoresCheckpoint', 'U') IS NULL
+BEGIN
+    CREATE TABLE dbo.LG_ColetoresCheckpoint (
+        DataCheckpoint DATETIME NOT NULL PRIMARY KEY,
+        Coletores      INT      NOT NULL,
+        CriadoEm       DATETIME NOT NULL
+    );
+    CREATE TABLE dbo.LG_ColetoresCheckpointEstado (
+        DataCheckpoint DATETIME     NOT NULL,
+        IDColetorNorm  VARCHAR(50)  NOT NULL,
+        IDColetor      VARCHAR(50)  NOT NULL,
+        IDRegistro     INT          NOT NULL,
+        IDColaborador  VARCHAR(50)  NULL,
+        DataRegistro   DATETIME     NOT NULL,
+        CONSTRAINT PK_LG_ColetoresCheckpointEstado PRIMARY KEY (DataCheckpoint, IDColetorNorm)
+    );
+END
+"""
+
+# Chave de idempotência do movimento (mov_validacoes.nova_chave): envio
+# repetido não grava outra linha. Filtrado: linhas antigas ficam NULL.
+# Índice em lote separado: a coluna precisa existir ao compilar.
+_DDL_CHAVE_IDEMPOTENCIA = """
+IF COL_LENGTH('dbo.LG_ControleColetores', 'ChaveIdempotencia') IS NULL
+    ALTER TABLE dbo.LG_ControleColetores ADD ChaveIdempotencia VARCHAR(36) NULL;
+"""
+
+_DDL_CHAVE_IDEMPOTENCIA_INDICE = """
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_LG_ControleColetores_Chave')
+    CREATE UNIQUE INDEX UX_LG_ControleColetores_Chave
+        ON dbo.LG_ControleColetores (ChaveIdempotencia)
+        WHERE ChaveIdempotencia IS NOT NULL;
+"""
+
+# COLETORES_CADASTRO é alimentada por outros sistemas, então a chave é uma
+# coluna computada persistida: espelho em T-SQL de normalizar_id_coletor.
+_DDL_CADASTRO_NORM = """
+IF COL_LENGTH('dbo.COLETORES_CADASTRO', 'IDColetorNorm') IS NULL
+    ALTER TABLE dbo.COLETORES_CADASTRO ADD IDColetorNorm AS
+        CAST(COALESCE(CONVERT(VARCHAR(50), TRY_CONVERT(BIGINT, LTRIM(RTRIM(IDColetores)))),
+                      LTRIM(RTRIM(IDColetores))) AS VARCHAR(50)) PERSISTED;
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_COLETORES_CADASTRO_Norm')
+    CREATE INDEX IX_COLETORES_CADASTRO_Norm
+        ON dbo.COLETORES_CADASTRO (IDColetorNorm) INCLUDE (IDColetores, NumSerie);
+"""
+
+# RV do cadastro: o cache de séries (mov_validacoes._cache_coletores) compara
+# COUNT + MAX(RV) por partição; inserção/alteração sobe o MAX e exclusão muda
+# o COUNT, sem os cancelamentos de um CHECKSUM_AGG.
+_DDL_CADASTRO_RV = """
+IF COL_LENGTH('dbo.COLETORES_CADASTRO', 'RV') IS NULL
+    ALTER TABLE dbo.COLETORES_CADASTRO ADD RV ROWVERSION;
+"""
+
+# Criado só se o estado atual já respeita a regra; senão, os casos são listados
+# (corrija com DEVOLUÇÃO e rode `criar` de novo).
+_SQL_COLAB_DUPLICADOS = """
+SELECT IDColaborador, COUNT(*)
+FROM LG_ColetoresEstadoAtual
+WHERE IDRegistro = 1 AND IDColaborador IS NOT NULL
+GROUP BY IDColaborador
+HAVING COUNT(*) > 1
+"""
+
+_DDL_UNICO_EM_OPERACAO = """
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'UX_LG_ColetoresEstadoAtual_ColabEmOperacao')
+    CREATE UNIQUE INDEX UX_LG_ColetoresEstadoAtual_ColabEmOperacao
+        ON dbo.LG_ColetoresEstadoAtual (IDColaborador)
+        WHERE IDRegistro = 1 AND IDColaborador IS NOT NULL;
+"""
+
+_TABELAS_COM_NORM = ("LG_ControleColetores", "LG_ControleColetoresDefeito")
+_LOTE_BACKFILL = 50000
+
+# Mesma ordenação determinística das consultas antigas (DataRegistro, IDRegistro).
+_SQL_REBUILD_ESTADO = """
+DELETE FROM LG_ColetoresEstadoAtual;
+
+WITH Movs AS (
+  SELECT
+      IDColetorNorm,
+      LTRIM(RTRIM(IDColetor))                         AS IDColetorTrim,
+      LTRIM(RTRIM(IDColaborador))                     AS IDColaborador,
+      CAST(IDRegistro AS INT)                         AS IDRegistro,
+      DataRegistro,
+      ROW_NUMBER() OVER (
+        PARTITION BY IDColetorNorm
+        ORDER BY DataRegistro DESC, IDRegistro DESC
+      ) AS rn
+  FROM LG_ControleColetores
+  WHERE IDColetorNorm IS NOT NULL
+)
+INSERT INTO LG_ColetoresEstadoAtual (IDColetorNorm, IDColetor, IDRegistro, IDColaborador, DataRegistro)
+SELECT IDColetorNorm, IDColetorTrim, IDRegistro, NULLIF(IDColaborador, ''), DataRegistro
+FROM Movs
+WHERE rn = 1;
+"""
+
+
+def criar_estruturas() -> None:
+    """Cria (se não existirem) as tabelas, colunas e índices auxiliares."""
+    with _db.conectar() as cn, cn.cursor() as cur:
+        cur.execute(_DDL_ESTADO_ATUAL)
+        cur.execute(_DDL_CHAVE_NORM)
+        cur.execute(_DDL_ESTADO_RV)
+        cn.commit()
+        # índices em lote separado: a coluna precisa existir na compilação
+        cur.execute(_DDL_INDICES_NORM)
+        cur.execute(_DDL_CADASTRO_NORM)
+        cur.execute(_DDL_CADASTRO_RV)
+        cur.execute(_DDL_ESTADO_RV_INDICE)
+        cur.execute(_DDL_INDICE_EXPORTACAO)
+        cur.execute(_DDL_CHECKPOINTS)
+        cur.execute(_DDL_CHAVE_IDEMPOTENCIA)
+        cn.commit()
+        cur.execute(_DDL_CHAVE_IDEMPOTENCIA_INDICE)
+        cn.commit()
+        cur.execute(_SQL_COLAB_DUPLICADOS)
+        duplicados = cur.fetchall()
+        if duplicados:
+            print("Índice único de colaborador EM OPERACAO não criado; colaboradores com mais de um coletor:")
+            for colab, n in duplicados:
+                print(f"  {colab}: {n} coletores")
+        else:
+            cur.execute(_DDL_UNICO_EM_OPERACAO)
+            cn.commit()
+
+
+def backfill_chave_norm() -> Dict[str, int]:
+    """
+    Preenche IDColetorNorm das linhas gravadas antes da coluna existir.
+    A regra é aplicada em Python sobre os valores DISTINTOS de IDColetor
+    (poucos milhares), carregados numa tabela temporária; o UPDATE por junção
+    roda em lotes para não inflar o log. Pode ser reexecutado.
+    Retorna as linhas atualizadas por tabela.
+    """
+    atualizadas: Dict[str, int] = {}
+    with _db.conectar() as cn, cn.cursor() as cur:
+        for tabela in _TABELAS_COM_NORM:
+            cur.execute(f"SELECT DISTINCT IDColetor FROM {tabela} WHERE IDColetorNorm IS NULL")
+            mapa = [(raw, normalizar_id_coletor(raw)) for (raw,) in cur.fetchall() if raw is not None]
+            total = 0
+            if mapa:
+                cur.execute("IF OBJECT_ID('tempdb..#MapaNorm') IS NOT NULL DROP TABLE #MapaNorm;"
+                            "CREATE TABLE #MapaNorm (IDColetor VARCHAR(50) PRIMARY KEY, IDColetorNorm VARCHAR(50))")
+                _db.executar_em_massa(cur, "INSERT INTO #MapaNorm (IDColetor, IDColetorNorm) VALUES (?, ?)", mapa)
+                while True:
+                    cur.execute(
+                        f"""
+                        UPDATE TOP ({_LOTE_BACKFILL}) T
+                           SET IDColetorNorm = M.IDColetorNorm
+                          FROM {tabela} T
+                          JOIN #MapaNorm M ON M.IDColetor = T.IDColetor
+                         WHERE T.IDColetorNorm IS NULL
+                        """
+                    )
+                    n = cur.rowcount
+                    cn.commit()
+                    total += max(n, 0)
+                    if n <= 0:
+                        break
+            atualizadas[tabela] = total
+    return atualizadas
+
+
+def rebuild_estado_atual() -> int:
+    """
+    Regenera LG_ColetoresEstadoAtual a partir de todo o histórico, numa única
+    transação (quem lê vê o estado antigo ou o novo, nunca vazio).
+    Retorna o número de coletores na projeção.
+    """
+    with _db.conectar() as cn, cn.cursor() as cur:
+        cur.execute(_SQL_REBUILD_ESTADO)
+        cur.execute("SELECT COUNT(*) FROM LG_ColetoresEstadoAtual")
+        total = cur.fetchone()[0]
+        cn.commit()
+        return total
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Migrações do controle de coletores.")
+    parser.add_argument("comando", choices=["criar", "backfill-norm", "rebuild-estado"])
+    args = parser.parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.comando == "criar":
+        criar_estruturas()
+        print("Estruturas criadas/verificadas.")
+    elif args.comando == "backfill-norm":
+        criar_estruturas()
+        for tabela, n in backfill_chave_norm().items():
+            print(f"{tabela}: {n} linhas normalizadas.")
+    elif args.comando == "rebuild-estado":
+        criar_estruturas()
+        backfill_chave_norm()  # o rebuild agrupa por IDColetorNorm
+        total = rebuild_estado_atual()
+        print(f"Estado atual regenerado: {total} coletores.")
+    print(f"Concluído em {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
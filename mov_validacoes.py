@@ -2,18 +2,41 @@
 # ------------------------------------------------------------
 # Validações e inserts de coletores (SQL Server), alinhado ao db.py
 # - junções com LTRIM/RTRIM (sem RIGHT/zero-pad)
-# - usa exatamente db.conectar()
-# - "último movimento" via ROW_NUMBER (determinístico)
+# - usa exatamente db.conectar(); consultas de tela/lookup com
+#   leitura=True (réplica, se configurada), validação no primário
+# - "último movimento" lido de LG_ColetoresEstadoAtual (uma linha por
+#   coletor normalizado), mantida no mesmo lote/transação do INSERT.
+#   Para (re)gerar a partir do histórico: python migracoes.py rebuild-estado
+# - coletor identificado pela chave normalizada (normalizar_id_coletor),
+#   gravada em IDColetorNorm no INSERT: filtros viram seeks de índice
+# - consultas nomeadas com @_db.operacao(...) para a instrumentação
+#   (instrumentacao.py, ligada por DB_INSTRUMENTACAO=1)
+# - servidor fora do ar: a movimentação vai para o diário local
+#   (diario_offline.py) e é reenviada em lote por reenviar_pendentes();
+#   com o disjuntor do db aberto isso é imediato. Leituras repetem erro
+#   transitório algumas vezes (db.repetir_transitorio)
+# - regras de transição de status: tabela em regras_status.py (a mesma
+#   usada pela auditoria do histórico)
+# - chave de idempotência (ChaveIdempotencia, índice único filtrado): a
+#   mesma movimentação enviada de novo (duplo clique, repetição após
+#   timeout, reenvio do diário) é reconhecida e não grava outra linha
 # ------------------------------------------------------------
 from __future__ import annotations
-from dataclasses import dataclass
-from typing import Optional, Tuple, List, Dict
-from datetime import datetime
-import pyodbc
+from dataclasses import dataclass, asdict
+from typing import Optional, Tuple, List, Dict, Set
+from datetime import datetime, timedelta
+import random
+import re
+import threading
+import time
+import uuid
 
 import db as _db
-def get_conn():
-    return _db.conectar()
+import regras_status as _regras
+from cache_lookup import AtualizadorCaches, CacheLookup
+from diario_offline import obter_diario, ENVIADO, CONFLITO
+def get_conn(leitura: bool = False):
+    return _db.conectar(leitura=leitura)
 
 ID_REGISTRO = {
     "ENTREGA":   1,
@@ -34,6 +57,17 @@ STATUS_BY_IDREG = {
     None: "DISPONIVEL",
 }
 
+ACAO_BY_IDREG = {v: k for k, v in ID_REGISTRO.items()}
+
+MSG_SUCESSO = "Movimentação registrada com sucesso."
+MSG_JA_REGISTRADA = "Movimentação já registrada (envio repetido ignorado)."
+# conflito com outra estação que não se resolveu nas novas tentativas: pode bipar de novo
+MSG_CONCORRENCIA = "Outra estação movimentou este coletor/colaborador ao mesmo tempo. Bipe novamente."
+_TENTATIVAS_CONCORRENCIA = 3
+
+# ações que exigem o crachá do colaborador
+ACOES_COM_RESPONSAVEL = ("DEVOLUCAO", "ENTREGA", "ENVIO", "RETORNO")
+
 @dataclass
 class MovDados:
     id_registro: int
@@ -47,6 +81,7 @@ class MovDados:
     data_envio_conserto: Optional[str]   # YYYY-MM-DD
     chamado: Optional[str]
     data_retorno_conserto: Optional[str] # YYYY-MM-DD
+    chave: Optional[str] = None          # idempotência: nova_chave(), uma por envio
 
 @dataclass
 class DefeitoItem:
@@ -55,6 +90,22 @@ class DefeitoItem:
     id_defeito: str
     resp_processo: str
 
+_RE_INTEIRO = re.compile(r"^[+-]?[0-9]+$")
+_BIGINT_MAX = 2**63 - 1
+
+def normalizar_id_coletor(id_coletor: Optional[str]) -> str:
+    """
+    Chave normalizada do coletor: numérico => sem zeros à esquerda
+    ('000073' == '73'); caso contrário, o texto trimado.
+    Mesma regra do TRY_CONVERT(BIGINT, ...) usado no SQL.
+    """
+    s = (id_coletor or "").strip()
+    if _RE_INTEIRO.match(s):
+        n = int(s)
+        if -_BIGINT_MAX - 1 <= n <= _BIGINT_MAX:
+            return str(n)
+    return s
+
 def yyyymmdd(date_iso: Optional[str]) -> Optional[str]:
     if not date_iso:
         return None
@@ -65,13 +116,15 @@ def yyyymmdd(date_iso: Optional[str]) -> Optional[str]:
 # LOOKUPS AUXILIARES
 # =========================
 
+@_db.operacao("lista_defeitos")
+@_db.repetir_transitorio()
 def fetch_defeitos_list() -> List[str]:
     sql = (
         "SELECT CASE WHEN LEN(IdDefeito)<2 THEN '0'+CONVERT(VARCHAR,IdDefeito) "
         "            ELSE CONVERT(VARCHAR,IdDefeito) END + ' - ' + DescricaoDefeito "
         "FROM LG_ColetoresDefeito WITH (NOLOCK) ORDER BY IdDefeito"
     )
-    with get_conn() as cn, cn.cursor() as cur:
+    with get_conn(leitura=True) as cn, cn.cursor() as cur:
         cur.execute(sql)
         return [r[0] for r in cur.fetchall()]
 
@@ -79,52 +132,48 @@ def fetch_defeitos_list() -> List[str]:
 # ÚLTIMO MOVIMENTO (determinístico)
 # =========================
 
-def _get_ultimo_mov_do_coletor(id_coletor: str):
+_SQL_ULTIMO_MOV = """
+    SELECT IDRegistro, IDColaborador
+    FROM LG_ColetoresEstadoAtual
+    WHERE IDColetorNorm = ?;
+"""
+
+# Versões com trava, para ler e gravar na mesma transação: UPDLOCK segura a
+# linha do coletor (ou o intervalo da chave, se ainda não existe) e HOLDLOCK
+# o intervalo (IDColaborador, IDRegistro = 1) até o commit. Outra estação
+# validando o mesmo coletor/colaborador espera em vez de ler o estado velho.
+_SQL_ULTIMO_MOV_TRAVA = """
+    SELECT IDRegistro, IDColaborador
+    FROM LG_ColetoresEstadoAtual WITH (UPDLOCK, HOLDLOCK, ROWLOCK)
+    WHERE IDColetorNorm = ?;
+"""
+
+_SQL_COLAB_EM_OPERACAO_TRAVA = """
+    SELECT TOP 1 IDColetor
+    FROM LG_ColetoresEstadoAtual WITH (UPDLOCK, HOLDLOCK, ROWLOCK)
+    WHERE IDColaborador = ?
+      AND IDRegistro = 1;
+"""
+
+@_db.operacao("status_atual")
+@_db.repetir_transitorio()
+def _get_ultimo_mov_do_coletor(id_coletor: str, recente: bool = False):
     """
     Retorna (IDRegistro:int, IDColaborador) do ÚLTIMO movimento do coletor,
     unificando variações como '73' e '000073' na mesma partição.
+    recente=True: lê do primário (validação precisa do estado mais novo).
     """
-    sql = """
-    WITH Base AS (
-      SELECT
-          LTRIM(RTRIM(IDColetor))                         AS IDColetorTrim,
-          LTRIM(RTRIM(IDColaborador))                     AS IDColaborador,
-          CAST(IDRegistro AS INT)                         AS IDRegistro,   -- <<<<<< AQUI
-          DataRegistro,
-          /* Normaliza: se for número => '73'; senão => texto trimado */
-          COALESCE(CONVERT(VARCHAR(50),
-                   TRY_CONVERT(BIGINT, LTRIM(RTRIM(IDColetor)))),
-                   LTRIM(RTRIM(IDColetor)))               AS IDColetorNorm
-      FROM LG_ControleColetores
-    ),
-    Movs AS (
-      SELECT *,
-             ROW_NUMBER() OVER (
-               PARTITION BY IDColetorNorm
-               ORDER BY DataRegistro DESC, IDRegistro DESC
-             ) AS rn
-      FROM Base
-    )
-    SELECT TOP 1 IDRegistro, IDColaborador
-    FROM Movs
-    WHERE rn = 1
-      AND IDColetorNorm = COALESCE(
-            CONVERT(VARCHAR(50), TRY_CONVERT(BIGINT, LTRIM(RTRIM(?)))),
-            LTRIM(RTRIM(?))
-          );
-    """
-    with get_conn() as cn, cn.cursor() as cur:
-        p = id_coletor.strip()
-        cur.execute(sql, (p, p))
+    with get_conn(leitura=not recente) as cn, cn.cursor() as cur:
+        cur.execute(_SQL_ULTIMO_MOV, (normalizar_id_coletor(id_coletor),))
         row = cur.fetchone()
         return (row[0], row[1]) if row else (None, None)
 
 
-def _status_atual(id_coletor: str) -> Tuple[str, Optional[str]]:
+def _status_atual(id_coletor: str, recente: bool = False) -> Tuple[str, Optional[str]]:
     """
     Mapeia o último IDRegistro para o texto de status e retorna também o colaborador.
     """
-    last_idreg, last_colab = _get_ultimo_mov_do_coletor(id_coletor)
+    last_idreg, last_colab = _get_ultimo_mov_do_coletor(id_coletor, recente)
     return STATUS_BY_IDREG.get(last_idreg, "DISPONIVEL"), last_colab
 
 # =========================
@@ -136,95 +185,122 @@ def validar_bipagem(acao: str, id_coletor: Optional[str], id_resp: Optional[str]
     id_resp    = (id_resp or "").strip()
     if id_coletor == "" and id_resp != "":
         return False, "É necessário bipar o endereço do coletor para processar os dados."
-    if id_coletor != "" and id_resp == "" and acao.upper() in ("DEVOLUCAO","ENTREGA","ENVIO","RETORNO"):
+    if id_coletor != "" and id_resp == "" and acao.upper() in ACOES_COM_RESPONSAVEL:
         return False, "É necessário bipar o crachá do colaborador para processar os dados."
     return True, ""
 
+_SQL_COLAB_EM_OPERACAO = """
+    SELECT TOP 1 IDColetor
+    FROM LG_ColetoresEstadoAtual
+    WHERE IDColaborador = ?
+      AND IDRegistro = 1;
+"""
+
+@_db.operacao("colab_em_operacao")
 def _colaborador_tem_coletor_em_operacao(id_resp: str) -> Optional[str]:
     """
     Retorna o IDColetor *textual* (trimado) se o colaborador estiver, no estado atual,
     com algum coletor EM OPERACAO. Usa a mesma normalização de partição.
     """
-    sql = """
-    WITH Base AS (
-      SELECT
-          LTRIM(RTRIM(IDColetor))                         AS IDColetorTrim,
-          LTRIM(RTRIM(IDColaborador))                     AS IDColaborador,
-          IDRegistro,
-          DataRegistro,
-          COALESCE(CONVERT(VARCHAR(50),
-                   TRY_CONVERT(BIGINT, LTRIM(RTRIM(IDColetor)))),
-                   LTRIM(RTRIM(IDColetor)))               AS IDColetorNorm
-      FROM LG_ControleColetores
-    ),
-    Movs AS (
-      SELECT *,
-             ROW_NUMBER() OVER (
-               PARTITION BY IDColetorNorm
-               ORDER BY DataRegistro DESC, IDRegistro DESC
-             ) AS rn
-      FROM Base
-    )
-    SELECT TOP 1 IDColetorTrim
-    FROM Movs
-    WHERE rn = 1
-      AND IDRegistro = 1
-      AND IDColaborador = LTRIM(RTRIM(?));
-    """
     with get_conn() as cn, cn.cursor() as cur:
-        cur.execute(sql, (id_resp.strip(),))
+        cur.execute(_SQL_COLAB_EM_OPERACAO, (id_resp.strip(),))
         row = cur.fetchone()
         return row[0] if row else None
 
 
+@_db.operacao("ler_estado")
+def _ler_estado(cur, id_coletor: str, id_resp: Optional[str], incluir_colab: bool, travar: bool = False):
+    """
+    Lê, num único lote (uma ida ao servidor), o último movimento do coletor e,
+    se pedido, o coletor EM OPERACAO do colaborador.
+    travar=True: lê com UPDLOCK/HOLDLOCK (validar e gravar na mesma transação),
+    esperando por trava no máximo LOCK_TIMEOUT_MS; a sessão volta ao padrão
+    em seguida (a conexão é do pool e serve depois a outras consultas).
+    Retorna (IDRegistro, IDColaborador, coletor_do_resp).
+    """
+    p = normalizar_id_coletor(id_coletor)
+    if travar:
+        sql_mov = f"SET LOCK_TIMEOUT {_db.CONFIG['LOCK_TIMEOUT_MS']};" + _SQL_ULTIMO_MOV_TRAVA
+        sql_colab = _SQL_COLAB_EM_OPERACAO_TRAVA
+    else:
+        sql_mov, sql_colab = _SQL_ULTIMO_MOV, _SQL_COLAB_EM_OPERACAO
+    try:
+        if incluir_colab:
+            cur.execute(sql_mov + sql_colab, (p, (id_resp or "").strip()))
+        else:
+            cur.execute(sql_mov, (p,))
+        row = cur.fetchone()
+        last_idreg, last_colab = (row[0], row[1]) if row else (None, None)
+        coletor_do_resp = None
+        if incluir_colab and cur.nextset():
+            row = cur.fetchone()
+            coletor_do_resp = row[0] if row else None
+    finally:
+        if travar:
+            cur.execute("SET LOCK_TIMEOUT -1")  # também após 1222: o padrão volta com a conexão
+    return last_idreg, last_colab, coletor_do_resp
+
+
+def _aplicar_regras_de_status(
+    ac: str,
+    id_coletor: str,
+    id_resp: Optional[str],
+    status: str,
+    last_colab: Optional[str],
+    coletor_do_resp: Optional[str],
+) -> Tuple[bool, str]:
+    """Regras de transição sobre um estado já lido (sem acesso ao banco); tabela em regras_status.py."""
+    return _regras.avaliar(ac, id_coletor, id_resp, status, last_colab, coletor_do_resp)
+
+
 def validar_regras_de_status(acao: str, id_coletor: str, id_resp: Optional[str]) -> Tuple[bool, str]:
     ac = acao.upper()
-    status, last_colab = _status_atual(id_coletor)
-
-    # ENTREGA
+    status, last_colab = _status_atual(id_coletor, recente=True)
+    coletor_do_resp = None
     if ac == "ENTREGA" and (id_resp or "").strip():
-        atual = _colaborador_tem_coletor_em_operacao(id_resp)
-        if atual:
-            return False, f"{id_resp} já está com o coletor {atual}. EFETUE A DEVOLUÇÃO para prosseguir."
-
-    # DEVOLUÇÃO
-    if ac == "DEVOLUCAO":
-        if status == "DISPONIVEL":
-            return False, f"{id_coletor} não está em operação para ser devolvido. EFETUE ENTREGA para prosseguir."
-        if status in ("EXTRAVIADO", "INATIVO") and id_resp:
-            return False, f"Retorno de coletor que estava {status}."
-        if status == "EM OPERACAO" and id_resp and last_colab and id_resp.strip() != last_colab.strip():
-            return False, f"{last_colab} que estava com esse coletor. Verifique o USUÁRIO CORRETO para prosseguir."
-
-    # ENVIO (conserto)
-    if ac == "ENVIO":
-        if status == "EM OPERACAO":
-            return False, f"{id_coletor} está em operação. EFETUE DEVOLUÇÃO para prosseguir."
-        if status == "EM CONSERTO":
-            return False, f"{id_coletor} já está em conserto. EFETUE RETORNO para prosseguir."
-
-    # RETORNO (conserto)
-    if ac == "RETORNO" and status != "EM CONSERTO":
-        return False, f"{id_coletor} não foi enviado para conserto. EFETUE O ENVIO para prosseguir."
-
-    return True, ""
+        coletor_do_resp = _colaborador_tem_coletor_em_operacao(id_resp)
+    return _aplicar_regras_de_status(ac, id_coletor, id_resp, status, last_colab, coletor_do_resp)
 
 # =========================
 # INSERTS
 # =========================
 
-def inserir_mov_principal(d: MovDados) -> None:
-    sql = """
+_SQL_INSERT_MOV = """
     INSERT INTO LG_ControleColetores
-    (DataRegistro, IDRegistro, IDColetor, IDColaborador,
+    (DataRegistro, IDRegistro, IDColetor, IDColetorNorm, IDColaborador,
      RealizadoTeste, DetectadoDefeito, SinalizaConserto,
-     Observacao, RespProcesso, DataEnvioConserto, Chamado, DataRetornoConserto)
+     Observacao, RespProcesso, DataEnvioConserto, Chamado, DataRetornoConserto, ChaveIdempotencia)
     VALUES
-    (GETDATE(), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """
-    params = (
+    (GETDATE(), ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+
+# Upsert portátil (sem MERGE) da projeção de estado atual.
+_SQL_UPSERT_ESTADO = """
+    UPDATE LG_ColetoresEstadoAtual
+       SET IDColetor = ?, IDRegistro = ?, IDColaborador = ?, DataRegistro = GETDATE()
+     WHERE IDColetorNorm = ?;
+    INSERT INTO LG_ColetoresEstadoAtual (IDColetorNorm, IDColetor, IDRegistro, IDColaborador, DataRegistro)
+    SELECT ?, ?, ?, ?, GETDATE()
+     WHERE NOT EXISTS (SELECT 1 FROM LG_ColetoresEstadoAtual WHERE IDColetorNorm = ?);
+"""
+
+_SQL_INSERT_DEFEITOS = """
+    INSERT INTO LG_ControleColetoresDefeito
+    (DataRegistro, IDRegistro, IDColetor, IDColetorNorm, IDDefeito, RespProcesso)
+    VALUES {valores};
+"""
+
+_SQL_INSERT_DEFEITO = _SQL_INSERT_DEFEITOS.format(valores="(GETDATE(), ?, ?, ?, ?, ?)")
+
+# Até este tamanho os defeitos vão no mesmo lote do movimento (INSERT multi-linha,
+# 6 parâmetros cada, longe do limite de 2100); acima, fast_executemany em blocos.
+_MAX_DEFEITOS_NO_LOTE = 50
+
+def _params_mov(d: MovDados) -> tuple:
+    return (
         d.id_registro,
         d.id_coletor.strip(),
+        normalizar_id_coletor(d.id_coletor),
         (d.id_colaborador or "").strip() or None,
         1 if d.realizado_teste else 0,
         1 if d.detectado_defeito else 0,
@@ -234,30 +310,323 @@ def inserir_mov_principal(d: MovDados) -> None:
         yyyymmdd(d.data_envio_conserto),
         (d.chamado or "").strip() or None,
         yyyymmdd(d.data_retorno_conserto),
+        d.chave,
     )
-    with get_conn() as cn, cn.cursor() as cur:
-        cur.execute(sql, params)
-        cn.commit()  # <<<<<< AQUI
 
+def _sql_params_defeitos(defeitos: List[DefeitoItem]) -> Tuple[str, list]:
+    """Um único INSERT multi-linha para a lista de defeitos."""
+    sql = _SQL_INSERT_DEFEITOS.format(valores=", ".join(["(GETDATE(), ?, ?, ?, ?, ?)"] * len(defeitos)))
+    params: list = []
+    for it in defeitos:
+        params.extend(_params_defeito(it))
+    return sql, params
+
+# Versões de uma linha por execução (executemany) com DataRegistro explícito:
+# usadas no reenvio do diário, que grava o horário do cliente.
+_SQL_INSERT_MOV_DATADO = """
+    INSERT INTO LG_ControleColetores
+    (DataRegistro, IDRegistro, IDColetor, IDColetorNorm, IDColaborador,
+     RealizadoTeste, DetectadoDefeito, SinalizaConserto,
+     Observacao, RespProcesso, DataEnvioConserto, Chamado, DataRetornoConserto, ChaveIdempotencia)
+    VALUES
+    (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
+_SQL_INSERT_DEFEITO_DATADO = """
+    INSERT INTO LG_ControleColetoresDefeito
+    (DataRegistro, IDRegistro, IDColetor, IDColetorNorm, IDDefeito, RespProcesso)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+_SQL_ESTADO_UPDATE_DATADO = """
+    UPDATE LG_ColetoresEstadoAtual
+       SET IDColetor = ?, IDRegistro = ?, IDColaborador = ?, DataRegistro = ?
+     WHERE IDColetorNorm = ?
+"""
+
+_SQL_ESTADO_INSERT_DATADO = """
+    INSERT INTO LG_ColetoresEstadoAtual (IDColetorNorm, IDColetor, IDRegistro, IDColaborador, DataRegistro)
+    SELECT ?, ?, ?, ?, ?
+     WHERE NOT EXISTS (SELECT 1 FROM LG_ColetoresEstadoAtual WHERE IDColetorNorm = ?)
+"""
+
+def _params_defeito(it: DefeitoItem) -> tuple:
+    return (it.id_registro, it.id_coletor.strip(), normalizar_id_coletor(it.id_coletor),
+            it.id_defeito.strip(), it.resp_processo.strip())
+
+def _params_estado(d: MovDados) -> tuple:
+    norm = normalizar_id_coletor(d.id_coletor)
+    coletor = d.id_coletor.strip()
+    colab = (d.id_colaborador or "").strip() or None
+    return (coletor, d.id_registro, colab, norm,
+            norm, coletor, d.id_registro, colab, norm)
+
+@_db.operacao("insert_mov")
+def _gravar_movimentacao(cur, d: MovDados, defeitos: Optional[List[DefeitoItem]] = None) -> None:
+    """
+    Envia o movimento, a atualização do estado atual e os defeitos num único
+    lote no cursor informado. Não faz commit: quem chama controla a transação.
+    """
+    sql = _SQL_INSERT_MOV + _SQL_UPSERT_ESTADO
+    params = list(_params_mov(d)) + list(_params_estado(d))
+    if defeitos and len(defeitos) <= _MAX_DEFEITOS_NO_LOTE:
+        sql_def, params_def = _sql_params_defeitos(defeitos)
+        sql += sql_def
+        params.extend(params_def)
+    cur.execute(sql, params)
+    if defeitos and len(defeitos) > _MAX_DEFEITOS_NO_LOTE:
+        _db.executar_em_massa(cur, _SQL_INSERT_DEFEITO, [_params_defeito(it) for it in defeitos])
+
+
+# Busca pelo índice único filtrado UX_LG_ControleColetores_Chave.
+_SQL_CHAVE_REGISTRADA = """
+    SELECT TOP 1 1 FROM LG_ControleColetores WHERE ChaveIdempotencia = ?;
+"""
+
+def nova_chave() -> str:
+    """Chave de idempotência de um envio (gerada uma vez, repetida nas novas tentativas)."""
+    return uuid.uuid4().hex
+
+def _chave_registrada(cur, chave: Optional[str]) -> bool:
+    if not chave:
+        return False
+    cur.execute(_SQL_CHAVE_REGISTRADA, (chave,))
+    return cur.fetchone() is not None
+
+@_db.operacao("insert_mov")
+def inserir_mov_principal(d: MovDados) -> bool:
+    """
+    Grava o movimento. Com d.chave já registrada não grava de novo.
+    Retorna True se gravou, False se era repetição.
+    """
+    try:
+        with get_conn() as cn, cn.cursor() as cur:
+            if _chave_registrada(cur, d.chave):
+                return False
+            _gravar_movimentacao(cur, d)
+            cn.commit()  # <<<<<< AQUI
+    except _db.Error as e:
+        # envio simultâneo com a mesma chave: o outro gravou primeiro
+        if d.chave and _db.erro_de_concorrencia(e):
+            with get_conn() as cn, cn.cursor() as cur:
+                if _chave_registrada(cur, d.chave):
+                    return False
+        raise
+    return True
+
+
+@_db.operacao("insert_defeitos")
 def inserir_defeitos(defeitos: List[DefeitoItem]) -> None:
     if not defeitos:
         return
-    sql = """
-    INSERT INTO LG_ControleColetoresDefeito
-    (DataRegistro, IDRegistro, IDColetor, IDDefeito, RespProcesso)
-    VALUES (GETDATE(), ?, ?, ?, ?)
-    """
     with get_conn() as cn, cn.cursor() as cur:
-        for it in defeitos:
-            cur.execute(sql, (it.id_registro, it.id_coletor.strip(), it.id_defeito.strip(), it.resp_processo.strip()))
+        _db.executar_em_massa(cur, _SQL_INSERT_DEFEITO, [_params_defeito(it) for it in defeitos])
         cn.commit()  # <<<<<< AQUI
 
+# =========================
+# LOTE (reenvio do diário offline)
+# =========================
+
+_MAX_PARAMS_IN = 1000  # SQL Server aceita até 2100 parâmetros por comando
+_PRECISAO_DATETIME = timedelta(milliseconds=10)  # DATETIME arredonda para 1/300 s
+
+def _em_blocos(valores: List, tamanho: int = _MAX_PARAMS_IN):
+    for i in range(0, len(valores), tamanho):
+        yield valores[i:i + tamanho]
+
+@_db.operacao("ler_estado_lote")
+def _ler_estados_em_lote(cur, coletores_norm: Set[str], colaboradores: Set[str]):
+    """
+    Estado atual de vários coletores e colaboradores com consultas por conjunto,
+    travadas (UPDLOCK/HOLDLOCK) até o commit de quem chamou.
+    Retorna:
+      estados:   {IDColetorNorm: (IDRegistro, IDColaborador, IDColetor, DataRegistro)}
+      em_op:     {IDColaborador: IDColetor} para quem está com coletor EM OPERACAO
+    """
+    estados: Dict[str, tuple] = {}
+    em_op: Dict[str, str] = {}
+    for bloco in _em_blocos(sorted(coletores_norm)):
+        cur.execute(
+            "SELECT IDColetorNorm, IDRegistro, IDColaborador, IDColetor, DataRegistro "
+            "FROM LG_ColetoresEstadoAtual WITH (UPDLOCK, HOLDLOCK) "
+            f"WHERE IDColetorNorm IN ({', '.join('?' * len(bloco))})",
+            bloco,
+        )
+        for norm, idreg, colab, coletor, data in cur.fetchall():
+            estados[norm] = (idreg, colab, coletor, data)
+    for bloco in _em_blocos(sorted(colaboradores)):
+        cur.execute(
+            "SELECT IDColaborador, IDColetor FROM LG_ColetoresEstadoAtual WITH (UPDLOCK, HOLDLOCK) "
+            f"WHERE IDRegistro = 1 AND IDColaborador IN ({', '.join('?' * len(bloco))})",
+            bloco,
+        )
+        for colab, coletor in cur.fetchall():
+            em_op[colab] = coletor
+    return estados, em_op
+
+@_db.operacao("chaves_lote")
+def _chaves_registradas(cur, chaves: Set[str]) -> Set[str]:
+    """Quais das chaves de idempotência já estão gravadas (lidas depois das travas do lote)."""
+    registradas: Set[str] = set()
+    for bloco in _em_blocos(sorted(chaves)):
+        cur.execute(
+            "SELECT ChaveIdempotencia FROM LG_ControleColetores "
+            f"WHERE ChaveIdempotencia IN ({', '.join('?' * len(bloco))})",
+            bloco,
+        )
+        registradas.update(r[0] for r in cur.fetchall())
+    return registradas
+
+def _validar_em_memoria(
+    mov: MovDados,
+    data_cliente: Optional[datetime],
+    estados: Dict[str, tuple],
+    em_op: Dict[str, str],
+) -> Tuple[bool, str]:
+    """
+    Aplica as regras de status sobre o estado em memória e, se aceito,
+    atualiza esse estado (para validar o próximo item do mesmo lote).
+    """
+    ac = ACAO_BY_IDREG[mov.id_registro]
+    norm = normalizar_id_coletor(mov.id_coletor)
+    id_resp = (mov.id_colaborador or "").strip()
+    last_idreg, last_colab, _, last_data = estados.get(norm, (None, None, None, None))
+
+    if data_cliente is not None and last_data is not None and last_data > data_cliente - _PRECISAO_DATETIME:
+        return False, (f"{mov.id_coletor} já tem movimento em {last_data:%d/%m/%Y %H:%M:%S}, "
+                       "igual ou posterior a este registro offline.")
+
+    status = STATUS_BY_IDREG.get(last_idreg, "DISPONIVEL")
+    ok, msg = _aplicar_regras_de_status(ac, mov.id_coletor, id_resp, status, last_colab,
+                                        em_op.get(id_resp) if id_resp else None)
+    if not ok:
+        return False, msg
+
+    if last_idreg == 1 and last_colab:
+        em_op.pop(last_colab.strip(), None)
+    estados[norm] = (mov.id_registro, id_resp or None, mov.id_coletor.strip(), data_cliente)
+    if mov.id_registro == 1 and id_resp:
+        em_op[id_resp] = mov.id_coletor.strip()
+    return True, ""
+
+@_db.operacao("insert_lote")
+def _gravar_em_lote(cur, movs: List[Tuple[MovDados, datetime]], defeitos: List[Tuple[DefeitoItem, datetime]]) -> None:
+    """
+    Grava vários movimentos (com DataRegistro informado) e seus defeitos com
+    executemany, e aplica só o estado FINAL de cada coletor na projeção.
+    Não faz commit.
+    """
+    if not movs:
+        return
+    _db.executar_em_massa(cur, _SQL_INSERT_MOV_DATADO, [(data,) + _params_mov(d) for d, data in movs])
+    _db.executar_em_massa(cur, _SQL_INSERT_DEFEITO_DATADO, [(data,) + _params_defeito(it) for it, data in defeitos])
+
+    finais: Dict[str, Tuple[MovDados, datetime]] = {}
+    for d, data in movs:
+        finais[normalizar_id_coletor(d.id_coletor)] = (d, data)
+    upd, ins = [], []
+    for norm, (d, data) in finais.items():
+        coletor = d.id_coletor.strip()
+        colab = (d.id_colaborador or "").strip() or None
+        upd.append((coletor, d.id_registro, colab, data, norm))
+        ins.append((norm, coletor, d.id_registro, colab, data, norm))
+    _db.executar_em_massa(cur, _SQL_ESTADO_UPDATE_DATADO, upd)
+    _db.executar_em_massa(cur, _SQL_ESTADO_INSERT_DATADO, ins)
+
+def registrar_offline(mov: MovDados, itens: List[DefeitoItem]) -> Tuple[bool, str]:
+    try:
+        obter_diario().registrar(asdict(mov), [asdict(it) for it in itens])
+    except Exception as e:
+        return False, f"Servidor indisponível e falha ao gravar o diário local: {e}"
+    return True, ("Servidor indisponível: movimentação guardada no diário local "
+                  "e será enviada (e revalidada) quando a conexão voltar.")
+
+_reenvio_lock = threading.Lock()  # um reenvio por processo: dois leriam os mesmos pendentes
+
+@_db.operacao("reenvio_offline")
+def reenviar_pendentes(lote: int = 500) -> Tuple[int, List[Tuple[int, str]]]:
+    """
+    Envia o diário offline em lotes: lê o estado atual de todos os coletores e
+    colaboradores do lote de uma vez, revalida as regras em memória na ordem em
+    que foram registrados, grava os aceitos com executemany e commita uma vez
+    por lote. Retorna (enviados, [(id_local, mensagem_do_conflito)]).
+    Chamadas simultâneas esperam a anterior terminar.
+    """
+    with _reenvio_lock:
+        return _reenviar_pendentes(lote)
+
+def _reenviar_pendentes(lote: int) -> Tuple[int, List[Tuple[int, str]]]:
+    diario = obter_diario()
+    enviados = 0
+    conflitos: List[Tuple[int, str]] = []
+    while True:
+        pend = diario.pendentes(lote)
+        if not pend:
+            break
+        itens = []
+        for id_local, criado_em, mov_d, defs_d in pend:
+            itens.append((id_local, criado_em, MovDados(**mov_d), [DefeitoItem(**x) for x in defs_d]))
+
+        resultados: List[Tuple[int, str, Optional[str]]] = []
+        aceitos: List[Tuple[MovDados, datetime]] = []
+        defeitos: List[Tuple[DefeitoItem, datetime]] = []
+        with get_conn() as cn, cn.cursor() as cur:
+            estados, em_op = _ler_estados_em_lote(
+                cur,
+                {normalizar_id_coletor(m.id_coletor) for _, _, m, _ in itens},
+                {(m.id_colaborador or "").strip() for _, _, m, _ in itens if (m.id_colaborador or "").strip()},
+            )
+            ja_gravadas = _chaves_registradas(cur, {m.chave for _, _, m, _ in itens if m.chave})
+            for id_local, criado_em, mov, defs in itens:
+                if mov.chave in ja_gravadas:
+                    # gravada antes (commit sem resposta, ou diário marcado tarde)
+                    resultados.append((id_local, ENVIADO, None))
+                    continue
+                ok, msg = _validar_em_memoria(mov, criado_em, estados, em_op)
+                if ok:
+                    aceitos.append((mov, criado_em))
+                    defeitos.extend((it, criado_em) for it in defs)
+                    resultados.append((id_local, ENVIADO, None))
+                else:
+                    resultados.append((id_local, CONFLITO, msg))
+                    conflitos.append((id_local, msg))
+            _gravar_em_lote(cur, aceitos, defeitos)
+            cn.commit()
+        # se cair aqui entre o commit e a marcação, o próximo reenvio acha as
+        # chaves já gravadas e só marca os itens (itens antigos, sem chave:
+        # o estado com DataRegistro >= horário do item vira conflito)
+        diario.marcar(resultados)
+        enviados += len(aceitos)
+        if len(pend) < lote:
+            break
+    return enviados, conflitos
+
 # =========================
 # ORQUESTRAÇÃO
 # =========================
 
-def processar_movimentacao(
+def normalizar_acao(acao_ui: str) -> Optional[str]:
+    """Texto da UI ('Entrega Início operação'...) -> chave de ID_REGISTRO."""
+    acao_norm = (acao_ui or "").strip().upper()
+    if acao_norm.startswith("ENTREGA"):
+        return "ENTREGA"
+    if acao_norm.startswith("DEVOLU"):
+        return "DEVOLUCAO"
+    if acao_norm.startswith("ENVIO"):
+        return "ENVIO"
+    if acao_norm.startswith("RETORNO"):
+        return "RETORNO"
+    if "EXTRAVI" in acao_norm:
+        return "EXTRAVIO"
+    if "INATIV" in acao_norm:
+        return "INATIVO"
+    return None
+
+def _esperar_nova_tentativa(tentativa: int) -> None:
+    # espera curta e aleatória: as estações em conflito não colidem de novo juntas
+    time.sleep(random.uniform(0.01, 0.05) * (tentativa + 1))
+
+def montar_movimentacao(
     acao_ui: str,
     id_coletor: str,
     id_resp: Optional[str],
@@ -270,23 +639,15 @@ def processar_movimentacao(
     chamado: Optional[str],
     data_retorno_conserto: Optional[str],
     lista_defeitos_escolhidos: Optional[List[str]] = None,
-) -> Tuple[bool, str]:
-
-    acao_norm = acao_ui.strip().upper()
-    if acao_norm.startswith("ENTREGA"):
-        ac = "ENTREGA"
-    elif acao_norm.startswith("DEVOLU"):
-        ac = "DEVOLUCAO"
-    elif acao_norm.startswith("ENVIO"):
-        ac = "ENVIO"
-    elif acao_norm.startswith("RETORNO"):
-        ac = "RETORNO"
-    elif "EXTRAVI" in acao_norm:
-        ac = "EXTRAVIO"
-    elif "INATIV" in acao_norm:
-        ac = "INATIVO"
-    else:
-        return False, f"Ação não reconhecida: {acao_ui}"
+    chave_idempotencia: Optional[str] = None,
+) -> Tuple[Optional[MovDados], List[DefeitoItem], str]:
+    """
+    Movimento e defeitos como vão para o banco (ou para o diário offline),
+    sem consultar o banco. Ação ou bipagem inválida: (None, [], mensagem).
+    """
+    ac = normalizar_acao(acao_ui)
+    if ac is None:
+        return None, [], f"Ação não reconhecida: {acao_ui}"
 
     id_reg = ID_REGISTRO[ac]
     id_coletor = (id_coletor or "").strip()
@@ -294,11 +655,7 @@ def processar_movimentacao(
 
     ok, msg = validar_bipagem(ac, id_coletor, id_resp)
     if not ok:
-        return False, msg
-
-    ok, msg = validar_regras_de_status(ac, id_coletor, id_resp)
-    if not ok:
-        return False, msg
+        return None, [], msg
 
     mov = MovDados(
         id_registro=id_reg,
@@ -312,54 +669,323 @@ def processar_movimentacao(
         data_envio_conserto=data_envio_conserto,
         chamado=chamado,
         data_retorno_conserto=data_retorno_conserto,
+        chave=chave_idempotencia or None,
     )
 
-    try:
-        inserir_mov_principal(mov)
-
-        if detectado_defeito and lista_defeitos_escolhidos:
-            itens: List[DefeitoItem] = []
-            for s in lista_defeitos_escolhidos:
-                id_def = s.split(" - ")[0].strip()
-                itens.append(DefeitoItem(
-                    id_registro=id_reg,
-                    id_coletor=id_coletor,
-                    id_defeito=id_def,
-                    resp_processo=resp_processo
-                ))
-            inserir_defeitos(itens)
-
-        return True, "Movimentação registrada com sucesso."
-    except pyodbc.Error as e:
-        return False, f"Erro de banco: {e}"
-    except Exception as e:
-        return False, f"Falha ao processar movimentação: {e}"
+    itens: List[DefeitoItem] = []
+    if detectado_defeito and lista_defeitos_escolhidos:
+        for s in lista_defeitos_escolhidos:
+            id_def = s.split(" - ")[0].strip()
+            itens.append(DefeitoItem(
+                id_registro=id_reg,
+                id_coletor=id_coletor,
+                id_defeito=id_def,
+                resp_processo=resp_processo
+            ))
+    return mov, itens, ""
+
+@_db.operacao("processar_movimentacao")
+def processar_movimentacao(
+    acao_ui: str,
+    id_coletor: str,
+    id_resp: Optional[str],
+    realizado_teste: bool,
+    detectado_defeito: bool,
+    sinaliza_conserto: bool,
+    observacao: Optional[str],
+    resp_processo: str,
+    data_envio_conserto: Optional[str],
+    chamado: Optional[str],
+    data_retorno_conserto: Optional[str],
+    lista_defeitos_escolhidos: Optional[List[str]] = None,
+    chave_idempotencia: Optional[str] = None,
+) -> Tuple[bool, str]:
+    """
+    Valida e grava uma movimentação. chave_idempotencia (nova_chave()): a
+    mesma chave enviada de novo devolve (True, MSG_JA_REGISTRADA) sem gravar.
+    """
+    mov, itens, msg = montar_movimentacao(
+        acao_ui, id_coletor, id_resp, realizado_teste, detectado_defeito, sinaliza_conserto,
+        observacao, resp_processo, data_envio_conserto, chamado, data_retorno_conserto,
+        lista_defeitos_escolhidos, chave_idempotencia,
+    )
+    if mov is None:
+        return False, msg
+    ac = ACAO_BY_IDREG[mov.id_registro]
+    id_coletor, id_resp = mov.id_coletor, mov.id_colaborador
+
+    # Uma conexão, uma leitura travada, uma escrita em lote e um único commit:
+    # validação e gravação são uma unidade atômica por coletor e colaborador.
+    for tentativa in range(_TENTATIVAS_CONCORRENCIA):
+        commit_enviado = False
+        try:
+            with get_conn() as cn, cn.cursor() as cur:
+                last_idreg, last_colab, coletor_do_resp = _ler_estado(
+                    cur, id_coletor, id_resp, incluir_colab=(ac == "ENTREGA" and bool(id_resp)), travar=True
+                )
+                # depois das travas: um envio repetido em paralelo já terminou
+                if _chave_registrada(cur, mov.chave):
+                    return True, MSG_JA_REGISTRADA
+                status = STATUS_BY_IDREG.get(last_idreg, "DISPONIVEL")
+                ok, msg = _aplicar_regras_de_status(ac, id_coletor, id_resp, status, last_colab, coletor_do_resp)
+                if not ok:
+                    return False, msg
+
+                _gravar_movimentacao(cur, mov, itens)
+                commit_enviado = True
+                cn.commit()
+
+            return True, MSG_SUCESSO
+        except _db.Error as e:
+            # Deadlock/trava/índice único: outra estação venceu; relê e revalida.
+            if _db.erro_de_concorrencia(e):
+                if tentativa + 1 < _TENTATIVAS_CONCORRENCIA:
+                    _esperar_nova_tentativa(tentativa)
+                    continue
+                return False, MSG_CONCORRENCIA
+            # Servidor inalcançável: vai para o diário. Falha durante o próprio
+            # commit é ambígua; só com chave o reenvio sabe se já foi gravada.
+            if _db.erro_de_conexao(e) and (not commit_enviado or mov.chave):
+                return registrar_offline(mov, itens)
+            return False, f"Erro de banco: {e}"
+        except Exception as e:
+            return False, f"Falha ao processar movimentação: {e}"
+    return False, MSG_CONCORRENCIA
+
+@dataclass
+class ResultadoLote:
+    id_coletor: str
+    id_colaborador: Optional[str]
+    acao: str
+    ok: bool
+    mensagem: str
+
+@_db.operacao("processar_lote")
+def processar_lote(
+    itens: List[Tuple[str, Optional[str], str]],
+    resp_processo: str,
+) -> List[ResultadoLote]:
+    """
+    Bipagem em lote: itens = [(id_coletor, id_colaborador, acao_ui), ...].
+    Lê o estado de todos os coletores/colaboradores com consultas por conjunto,
+    valida em memória na ordem recebida (incluindo conflitos dentro do próprio
+    lote: mesmo coletor duas vezes, mesmo colaborador recebendo dois coletores),
+    grava todos os válidos com um INSERT em massa e um commit.
+    Retorna um resultado por item, na mesma ordem.
+    """
+    resultados: List[Optional[ResultadoLote]] = [None] * len(itens)
+    candidatos: List[Tuple[int, MovDados]] = []
+    vistos: Dict[str, int] = {}
+    for i, (id_coletor, id_resp, acao_ui) in enumerate(itens):
+        id_coletor = (id_coletor or "").strip()
+        id_resp = (id_resp or "").strip()
+        ac = normalizar_acao(acao_ui)
+
+        def recusar(msg: str) -> None:
+            resultados[i] = ResultadoLote(id_coletor, id_resp or None, ac or acao_ui, False, msg)
+
+        if ac is None:
+            recusar(f"Ação não reconhecida: {acao_ui}")
+            continue
+        ok, msg = validar_bipagem(ac, id_coletor, id_resp)
+        if not ok:
+            recusar(msg)
+            continue
+        norm = normalizar_id_coletor(id_coletor)
+        if norm in vistos:
+            recusar(f"{id_coletor} repetido no lote (item {vistos[norm] + 1}).")
+            continue
+        vistos[norm] = i
+        candidatos.append((i, MovDados(
+            id_registro=ID_REGISTRO[ac],
+            id_coletor=id_coletor,
+            id_colaborador=id_resp,
+            realizado_teste=False,
+            detectado_defeito=False,
+            sinaliza_conserto=False,
+            observacao=None,
+            resp_processo=resp_processo,
+            data_envio_conserto=None,
+            chamado=None,
+            data_retorno_conserto=None,
+        )))
+
+    for tentativa in range(_TENTATIVAS_CONCORRENCIA if candidatos else 0):
+        try:
+            with get_conn() as cn, cn.cursor() as cur:
+                estados, em_op = _ler_estados_em_lote(
+                    cur,
+                    {normalizar_id_coletor(m.id_coletor) for _, m in candidatos},
+                    {m.id_colaborador for _, m in candidatos if m.id_colaborador},
+                )
+                cur.execute("SELECT GETDATE()")
+                agora = cur.fetchone()[0]
+                aceitos: List[Tuple[MovDados, datetime]] = []
+                for i, mov in candidatos:
+                    ok, msg = _validar_em_memoria(mov, None, estados, em_op)
+                    if ok:
+                        aceitos.append((mov, agora))
+                        msg = MSG_SUCESSO
+                    resultados[i] = ResultadoLote(mov.id_coletor, mov.id_colaborador or None,
+                                                  ACAO_BY_IDREG[mov.id_registro], ok, msg)
+                _gravar_em_lote(cur, aceitos, [])
+                cn.commit()
+            break
+        except Exception as e:
+            concorrencia = isinstance(e, _db.Error) and _db.erro_de_concorrencia(e)
+            if concorrencia and tentativa + 1 < _TENTATIVAS_CONCORRENCIA:
+                _esperar_nova_tentativa(tentativa)
+                continue
+            # nada foi gravado: o lote inteiro volta como falha
+            if concorrencia:
+                msg = MSG_CONCORRENCIA
+            else:
+                msg = f"Erro de banco: {e}" if isinstance(e, _db.Error) else f"Falha ao processar lote: {e}"
+            for i, mov in candidatos:
+                resultados[i] = ResultadoLote(mov.id_coletor, mov.id_colaborador or None,
+                                              ACAO_BY_IDREG[mov.id_registro], False, msg)
+            break
+    return resultados  # type: ignore[return-value]
 
 # =========================
 # HELPERS DE UI
 # =========================
 
-def nome_coletor_ou_usuario(id_busca: str, modo: str) -> Optional[str]:
-    if modo.upper() == "COLETOR":
-        sql = """
-        SELECT TOP 1 LTRIM(RTRIM(NumSerie))
-        FROM COLETORES_CADASTRO WITH (NOLOCK)
-        WHERE LTRIM(RTRIM(IDColetores)) = LTRIM(RTRIM(?))
-          AND LTRIM(RTRIM(NumSerie)) NOT LIKE '%COLETOR%'
-        ORDER BY IDColetores
-        """
-    else:
-        sql = """
-        SELECT TOP 1 NOME_COMPLETO
-        FROM [DB_VIEWS].[dbo].[SS_USUARIOS_COLETOR] WITH (NOLOCK)
-        WHERE INATIVO = 0
-          AND LTRIM(RTRIM(ID_USUARIO)) = LTRIM(RTRIM(?))
-          --AND NOME_COMPLETO NOT LIKE '%G21%'
-        """
-    with get_conn() as cn, cn.cursor() as cur:
-        cur.execute(sql, (id_busca.strip(),))
+LIMITE_SUGESTOES = 8
+
+# Partição (0..255) de cada linha dos cadastros em cache: a mesma expressão
+# nas marcas e na carga; só as partições cuja marca mudou são relidas.
+_PARTICAO_COLETOR = "BINARY_CHECKSUM(IDColetorNorm) & 255"
+_PARTICAO_USUARIO = "BINARY_CHECKSUM(UPPER(LTRIM(RTRIM(ID_USUARIO)))) & 255"
+
+_SQL_NOME_COLETOR = """
+    SELECT TOP 1 LTRIM(RTRIM(NumSerie))
+    FROM COLETORES_CADASTRO WITH (NOLOCK)
+    WHERE IDColetorNorm = ?
+      AND LTRIM(RTRIM(NumSerie)) NOT LIKE '%COLETOR%'
+    ORDER BY IDColetores
+"""
+
+_SQL_NOME_USUARIO = """
+    SELECT TOP 1 NOME_COMPLETO
+    FROM [DB_VIEWS].[dbo].[SS_USUARIOS_COLETOR] WITH (NOLOCK)
+    WHERE INATIVO = 0
+      AND LTRIM(RTRIM(ID_USUARIO)) = LTRIM(RTRIM(?))
+      --AND NOME_COMPLETO NOT LIKE '%G21%'
+"""
+
+@_db.operacao("lookup_item")
+@_db.repetir_transitorio()
+def _buscar_um(sql: str, chave: str) -> Optional[str]:
+    with get_conn(leitura=True) as cn, cn.cursor() as cur:
+        cur.execute(sql, (chave,))
         row = cur.fetchone()
         return row[0] if row else None
 
+def _so_particoes(expr: str, particoes: Optional[List[int]]) -> str:
+    if particoes is None:
+        return ""
+    return f"AND ({expr}) IN ({', '.join(str(int(p)) for p in particoes) or 'NULL'})"
+
+@_db.operacao("lookup_coletores")
+@_db.repetir_transitorio()
+def _carregar_coletores(particoes: Optional[List[int]] = None) -> List[Tuple[int, str, str, str]]:
+    """Números de série por chave normalizada (primeiro IDColetores vence, como no TOP 1)."""
+    sql = f"""
+    SELECT {_PARTICAO_COLETOR}, IDColetorNorm, LTRIM(RTRIM(NumSerie))
+    FROM COLETORES_CADASTRO WITH (NOLOCK)
+    WHERE LTRIM(RTRIM(NumSerie)) NOT LIKE '%COLETOR%'
+      {_so_particoes(_PARTICAO_COLETOR, particoes)}
+    ORDER BY IDColetorNorm, IDColetores
+    """
+    with get_conn(leitura=True) as cn, cn.cursor() as cur:
+        cur.execute(sql)
+        return [(particao, norm, serie, norm) for particao, norm, serie in cur.fetchall()
+                if norm is not None]
+
+@_db.operacao("lookup_usuarios")
+@_db.repetir_transitorio()
+def _carregar_usuarios(particoes: Optional[List[int]] = None) -> List[Tuple[int, str, str, str]]:
+    sql = f"""
+    SELECT {_PARTICAO_USUARIO}, LTRIM(RTRIM(ID_USUARIO)), NOME_COMPLETO
+    FROM [DB_VIEWS].[dbo].[SS_USUARIOS_COLETOR] WITH (NOLOCK)
+    WHERE INATIVO = 0
+      {_so_particoes(_PARTICAO_USUARIO, particoes)}
+    """
+    with get_conn(leitura=True) as cn, cn.cursor() as cur:
+        cur.execute(sql)
+        return [(particao, id_usuario.upper(), nome, id_usuario)
+                for particao, id_usuario, nome in cur.fetchall() if id_usuario]
+
+@_db.operacao("lookup_marcas")
+@_db.repetir_transitorio()
+def _marcas(expr: str, agregados: str, tabela: str) -> Dict[int, Tuple]:
+    """Partição -> agregados de todas as linhas, inclusive as inativas."""
+    sql = f"""
+    SELECT {expr}, {agregados}
+    FROM {tabela} WITH (NOLOCK)
+    GROUP BY {expr}
+    """
+    with get_conn(leitura=True) as cn, cn.cursor() as cur:
+        cur.execute(sql)
+        return {linha[0]: tuple(linha[1:]) for linha in cur.fetchall()}
+
+_cache_coletores = CacheLookup(
+    "coletores",
+    carregar_particoes=_carregar_coletores,
+    buscar_um=lambda chave: _buscar_um(_SQL_NOME_COLETOR, chave),
+    # RV do cadastro (migracoes.py): exata, inserção/alteração sobe o MAX, exclusão muda o COUNT
+    marcas=lambda: _marcas(_PARTICAO_COLETOR, "COUNT_BIG(*), MAX(RV)", "COLETORES_CADASTRO"),
+    normalizar=normalizar_id_coletor,
+)
+
+_cache_usuarios = CacheLookup(
+    "usuarios",
+    carregar_particoes=_carregar_usuarios,
+    buscar_um=lambda chave: _buscar_um(_SQL_NOME_USUARIO, chave),
+    # view de outro banco, sem rowversion: CHECKSUM_AGG é heurística (XOR pode
+    # se anular; colunas > 8000 bytes ficam de fora); a recarga completa
+    # periódica corrige o que ela deixar passar
+    marcas=lambda: _marcas(_PARTICAO_USUARIO,
+                           "COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM(ID_USUARIO, NOME_COMPLETO, INATIVO))",
+                           "[DB_VIEWS].[dbo].[SS_USUARIOS_COLETOR]"),
+    recarga_completa=3600.0,
+    # SQL Server compara sem diferenciar maiúsculas (collation padrão)
+    normalizar=lambda s: (s or "").strip().upper(),
+    texto_busca=lambda chave, nome: f"{chave} {nome or ''}",
+)
+
+_atualizador: Optional[AtualizadorCaches] = None
+
+def precarregar_lookups() -> None:
+    """
+    Carrega coletores e usuários em segundo plano (chamar no login) e mantém
+    os caches atualizados enquanto o aplicativo estiver aberto.
+    """
+    global _atualizador
+    if _atualizador is None:
+        _atualizador = AtualizadorCaches((_cache_coletores, _cache_usuarios))
+        _atualizador.start()
+
+def estatisticas_lookups() -> Dict[str, Dict[str, int]]:
+    return {c.nome: c.estatisticas() for c in (_cache_coletores, _cache_usuarios)}
+
+def nome_coletor_ou_usuario(id_busca: str, modo: str) -> Optional[str]:
+    if modo.upper() == "COLETOR":
+        return _cache_coletores.obter(id_busca)
+    return _cache_usuarios.obter(id_busca)
+
+def buscar_usuarios(texto: str, limite: int = LIMITE_SUGESTOES) -> List[Tuple[str, str]]:
+    """
+    (ID_USUARIO, nome) de quem tem `texto` no ID ou no nome (termos em
+    qualquer ordem, sem acento/maiúsculas). Só o cache em memória: com o
+    cache ainda carregando, volta vazio em vez de consultar o banco.
+    """
+    return _cache_usuarios.buscar(texto, limite)
+
 def status_do_coletor(id_coletor: str) -> Tuple[str, Optional[str]]:
     return _status_atual(id_coletor)
+
+def status_do_coletor_sites(id_coletor: str, sites=None, timeout: Optional[float] = None) -> Dict[str, "_db.ResultadoSite"]:
+    """status_do_coletor em todos os sites ao mesmo tempo (db.em_sites); valor = (status, colaborador)."""
+    return _db.em_sites(_status_atual, id_coletor, sites=sites, timeout=timeout)
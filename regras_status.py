@@ -0,0 +1,101 @@
+# regras_status.py
+# ------------------------------------------------------------
+# Máquina de estados do coletor em forma de tabela: as regras de transição
+# (ENTREGA / DEVOLUCAO / ENVIO / RETORNO / EXTRAVIO / INATIVO) escritas uma
+# vez e avaliadas pelo mesmo código na validação ao vivo (mov_validacoes)
+# e na reprodução do histórico (auditoria_historico).
+# - cada regra: ação, status de origem em que vale, condição extra
+#   (opcional) sobre o crachá e mensagem de recusa
+# - regras avaliadas na ordem da tabela; a primeira que casar recusa
+# - ação sem regra que case = transição permitida
+# Sem acesso ao banco: quem chama fornece o estado já lido.
+# ------------------------------------------------------------
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Callable, Dict, FrozenSet, Optional, Tuple
+
+STATUS = ("DISPONIVEL", "EM OPERACAO", "EM CONSERTO", "EXTRAVIADO", "INATIVO")
+
+
+def _resp_com_outro_coletor(resp: Optional[str], ultimo_colab: Optional[str], coletor_do_resp: Optional[str]) -> bool:
+    return bool((resp or "").strip()) and bool(coletor_do_resp)
+
+
+def _resp_informado(resp: Optional[str], ultimo_colab: Optional[str], coletor_do_resp: Optional[str]) -> bool:
+    return bool(resp)
+
+
+def _resp_diferente_do_ultimo(resp: Optional[str], ultimo_colab: Optional[str], coletor_do_resp: Optional[str]) -> bool:
+    return bool(resp) and bool(ultimo_colab) and resp.strip() != ultimo_colab.strip()
+
+
+Condicao = Callable[[Optional[str], Optional[str], Optional[str]], bool]
+
+
+@dataclass(frozen=True)
+class Regra:
+    nome: str
+    acao: str
+    status: FrozenSet[str]           # status de origem em que a regra vale
+    mensagem: str                    # campos: coletor, resp, ultimo_colab, coletor_do_resp, status
+    condicao: Optional[Condicao] = None
+
+
+REGRAS: Tuple[Regra, ...] = (
+    Regra("entrega_em_operacao", "ENTREGA", frozenset({"EM OPERACAO"}),
+          "{coletor} já está em operação com {ultimo_colab}. EFETUE A DEVOLUÇÃO para prosseguir."),
+    Regra("entrega_resp_com_coletor", "ENTREGA", frozenset(STATUS),
+          "{resp} já está com o coletor {coletor_do_resp}. EFETUE A DEVOLUÇÃO para prosseguir.",
+          _resp_com_outro_coletor),
+    Regra("devolucao_disponivel", "DEVOLUCAO", frozenset({"DISPONIVEL"}),
+          "{coletor} não está em operação para ser devolvido. EFETUE ENTREGA para prosseguir."),
+    Regra("devolucao_extraviado_inativo", "DEVOLUCAO", frozenset({"EXTRAVIADO", "INATIVO"}),
+          "Retorno de coletor que estava {status}.",
+          _resp_informado),
+    Regra("devolucao_outro_colaborador", "DEVOLUCAO", frozenset({"EM OPERACAO"}),
+          "{ultimo_colab} que estava com esse coletor. Verifique o USUÁRIO CORRETO para prosseguir.",
+          _resp_diferente_do_ultimo),
+    Regra("envio_em_operacao", "ENVIO", frozenset({"EM OPERACAO"}),
+          "{coletor} está em operação. EFETUE DEVOLUÇÃO para prosseguir."),
+    Regra("envio_em_conserto", "ENVIO", frozenset({"EM CONSERTO"}),
+          "{coletor} já está em conserto. EFETUE RETORNO para prosseguir."),
+    Regra("retorno_sem_envio", "RETORNO", frozenset(STATUS) - {"EM CONSERTO"},
+          "{coletor} não foi enviado para conserto. EFETUE O ENVIO para prosseguir."),
+)
+
+# (ação, status de origem) -> regras aplicáveis, na ordem de REGRAS.
+# EXTRAVIO e INATIVO não têm restrição de origem.
+_TABELA: Dict[Tuple[str, str], Tuple[Regra, ...]] = {}
+for _r in REGRAS:
+    for _st in _r.status:
+        _TABELA[(_r.acao, _st)] = _TABELA.get((_r.acao, _st), ()) + (_r,)
+
+
+def regra_violada(
+    acao: str,
+    status: str,
+    resp: Optional[str],
+    ultimo_colab: Optional[str],
+    coletor_do_resp: Optional[str],
+) -> Optional[Regra]:
+    """Primeira regra que recusa a transição, ou None se permitida."""
+    for regra in _TABELA.get((acao, status), ()):
+        if regra.condicao is None or regra.condicao(resp, ultimo_colab, coletor_do_resp):
+            return regra
+    return None
+
+
+def avaliar(
+    acao: str,
+    id_coletor: str,
+    id_resp: Optional[str],
+    status: str,
+    ultimo_colab: Optional[str],
+    coletor_do_resp: Optional[str],
+) -> Tuple[bool, str]:
+    """(ok, mensagem) da transição `acao` a partir de `status`."""
+    regra = regra_violada(acao, status, id_resp, ultimo_colab, coletor_do_resp)
+    if regra is None:
+        return True, ""
+    return False, regra.mensagem.format(coletor=id_coletor, resp=id_resp, ultimo_colab=ultimo_colab,
+                                        coletor_do_resp=coletor_do_resp, status=status)
@@ -0,0 +1,373 @@
+# servico.py
+# ------------------------------------------------------------
+# Serviço local de movimentações (modo sem tela): um processo por CD com
+# o pool de conexões e os caches de cadastro; as estações falam com ele
+# por HTTP/JSON (cliente_servico.py) em vez de abrir ODBC cada uma.
+# - POST /movimentacao   -> mov_validacoes.processar_movimentacao
+# - POST /lote           -> mov_validacoes.processar_lote
+# - GET  /status?coletor=       -> status_do_coletor
+# - GET  /nome?id=&modo=        -> nome_coletor_ou_usuario (caches em memória)
+# - GET  /usuarios?texto=&limite= -> buscar_usuarios (índice em memória, sem banco)
+# - GET  /totais         -> TotaisIncrementais compartilhado
+# - POST /login          -> db.verificar_login
+# - GET  /saude          -> pool, caches, diário offline e métricas
+# - GET  /analise?atualizar=    -> analise_frota.relatorio_frota (retrato do serviço)
+# - GET  /frota?apos=&tamanho=&status=&colaborador=&serie=
+#                        -> frota_lista.pagina_frota (uma página da lista)
+# - GET  /frota/contagem?status=&colaborador=&serie=  -> frota_lista.contar_frota
+# Servidor fora do ar: o diário offline fica no serviço e é reenviado por ele.
+# Acesso:
+# - com COLETORES_SERVICO_TOKEN, toda rota exige "Authorization: Bearer <token>"
+#   (401 sem ele); a estação usa o mesmo valor na mesma variável
+# - fora do loopback só sobe com token e TLS (COLETORES_SERVICO_CERT e
+#   COLETORES_SERVICO_CERT_CHAVE, PEM): senha de /login e token não passam
+#   em texto aberto pela rede
+#
+# Uso:
+#   python servico.py --porta 8765
+#   DB_BACKEND=sqlite DB_SQLITE_PATH=... python servico.py   (banco substituto)
+# ------------------------------------------------------------
+from __future__ import annotations
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import ssl
+import threading
+import time
+from dataclasses import asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import db as _db
+import frota_lista as _frota
+import mov_validacoes as _mv
+from diario_offline import ReenvioPeriodico, obter_diario
+from totais_incrementais import TotaisIncrementais
+
+PORTA_PADRAO = 8765
+INTERVALO_TOTAIS = 2.0      # s: pedidos de totais mais próximos que isso usam a memória
+INTERVALO_REENVIO = 15.0    # s entre rodadas do diário offline
+_MAX_CORPO = 1 << 20        # 1 MB por requisição
+_ESPERA_TLS = 30.0          # s para o cliente concluir o handshake
+
+TOKEN = os.getenv("COLETORES_SERVICO_TOKEN", "")
+CERTIFICADO = os.getenv("COLETORES_SERVICO_CERT", "")
+CHAVE_CERTIFICADO = os.getenv("COLETORES_SERVICO_CERT_CHAVE", "")
+
+
+class ErroRequisicao(Exception):
+    """Requisição inválida (400)."""
+
+
+class _TotaisCompartilhados:
+    """Um TotaisIncrementais para todas as estações, atualizado no máximo a cada `intervalo` s."""
+
+    def __init__(self, intervalo: float = INTERVALO_TOTAIS):
+        self.intervalo = intervalo
+        self._totais = TotaisIncrementais()
+        self._lock = threading.Lock()
+        self._ultima = 0.0
+
+    def obter(self) -> Dict[str, int]:
+        with self._lock:
+            if time.monotonic() - self._ultima >= self.intervalo:
+                self._totais.atualizar()
+                self._ultima = time.monotonic()
+            return self._totais.totais()
+
+    def aplicar_local(self, id_coletor: str, id_registro: int) -> None:
+        self._totais.aplicar_local(id_coletor, id_registro)
+
+    def estatisticas(self) -> Dict[str, int]:
+        return dict(self._totais.stats)
+
+
+_totais = _TotaisCompartilhados()
+
+
+# ---------------------------
+# Rotas
+# ---------------------------
+
+def _movimentacao(corpo: Dict) -> Dict:
+    try:
+        ok, msg = _mv.processar_movimentacao(
+            corpo["acao"],
+            corpo["id_coletor"],
+            corpo.get("id_resp"),
+            bool(corpo.get("realizado_teste")),
+            bool(corpo.get("detectado_defeito")),
+            bool(corpo.get("sinaliza_conserto")),
+            corpo.get("observacao"),
+            corpo["resp_processo"],
+            corpo.get("data_envio_conserto"),
+            corpo.get("chamado"),
+            corpo.get("data_retorno_conserto"),
+            corpo.get("defeitos") or None,
+            corpo.get("chave"),
+        )
+    except KeyError as e:
+        raise ErroRequisicao(f"campo obrigatório ausente: {e.args[0]}")
+    if ok and msg == _mv.MSG_SUCESSO:
+        _totais.aplicar_local(corpo["id_coletor"], _mv.ID_REGISTRO[_mv.normalizar_acao(corpo["acao"])])
+    return {"ok": ok, "mensagem": msg, "repetir": msg == _mv.MSG_CONCORRENCIA}
+
+
+def _lote(corpo: Dict) -> Dict:
+    try:
+        itens = [(i["id_coletor"], i.get("id_resp"), i["acao"]) for i in corpo["itens"]]
+        resultados = _mv.processar_lote(itens, corpo["resp_processo"])
+    except (KeyError, TypeError) as e:
+        raise ErroRequisicao(f"lote inválido: {e}")
+    for r in resultados:
+        if r.ok:
+            _totais.aplicar_local(r.id_coletor, _mv.ID_REGISTRO[r.acao])
+    return {"resultados": [asdict(r) for r in resultados]}
+
+
+def _status(q: Dict) -> Dict:
+    status, colaborador = _mv.status_do_coletor(_param(q, "coletor"))
+    return {"status": status, "colaborador": colaborador}
+
+
+def _nome(q: Dict) -> Dict:
+    return {"nome": _mv.nome_coletor_ou_usuario(_param(q, "id"), _param(q, "modo", "COLETOR"))}
+
+
+def _usuarios(q: Dict) -> Dict:
+    try:
+        limite = int(_param(q, "limite", str(_mv.LIMITE_SUGESTOES)))
+    except ValueError as e:
+        raise ErroRequisicao(str(e))
+    return {"usuarios": _mv.buscar_usuarios(_param(q, "texto"), limite)}
+
+
+def _login(corpo: Dict) -> Dict:
+    return {"ok": _db.verificar_login(corpo.get("usuario", ""), corpo.get("senha", ""))}
+
+
+def _analise(q: Dict) -> Dict:
+    import analise_frota  # NumPy só quando alguém pede o relatório
+    return analise_frota.relatorio_frota(atualizar=_param(q, "atualizar", "0") == "1")
+
+
+def _filtros_frota(q: Dict) -> Dict:
+    return {c: _param(q, c, "") or None for c in ("status", "colaborador", "serie")}
+
+
+def _frota_pagina(q: Dict) -> Dict:
+    try:
+        tamanho = int(_param(q, "tamanho", str(_frota.TAMANHO_PAGINA)))
+        pagina = _frota.pagina_frota(_param(q, "apos", "") or None, tamanho, **_filtros_frota(q))
+    except ValueError as e:
+        raise ErroRequisicao(str(e))
+    return asdict(pagina)
+
+
+def _frota_contagem(q: Dict) -> Dict:
+    try:
+        return {"total": _frota.contar_frota(**_filtros_frota(q))}
+    except ValueError as e:
+        raise ErroRequisicao(str(e))
+
+
+def _saude(_q: Dict) -> Dict:
+    return {
+        "pool": _db.estatisticas_pool(),
+        "lookups": _mv.estatisticas_lookups(),
+        "totais": _totais.estatisticas(),
+        "diario_pendentes": obter_diario().contar_pendentes(),
+        "metricas": _db.metricas(),
+    }
+
+
+def _param(q: Dict, nome: str, padrao: Optional[str] = None) -> str:
+    valores = q.get(nome)
+    if not valores:
+        if padrao is None:
+            raise ErroRequisicao(f"parâmetro obrigatório ausente: {nome}")
+        return padrao
+    return valores[0]
+
+
+ROTAS_GET: Dict[str, Callable[[Dict], Dict]] = {
+    "/status": _status,
+    "/nome": _nome,
+    "/usuarios": _usuarios,
+    "/totais": lambda _q: _totais.obter(),
+    "/saude": _saude,
+    "/analise": _analise,
+    "/frota": _frota_pagina,
+    "/frota/contagem": _frota_contagem,
+}
+
+ROTAS_POST: Dict[str, Callable[[Dict], Dict]] = {
+    "/movimentacao": _movimentacao,
+    "/lote": _lote,
+    "/login": _login,
+}
+
+
+# ---------------------------
+# HTTP
+# ---------------------------
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive: a estação reaproveita o socket
+    server_version = "ColetoresServico/1"
+    disable_nagle_algorithm = True  # cabeçalho e corpo saem em writes separados
+
+    def setup(self):
+        # handshake TLS na thread da conexão, não na que aceita as conexões
+        if isinstance(self.request, ssl.SSLSocket):
+            self.request.settimeout(_ESPERA_TLS)
+            self.request.do_handshake()
+            self.request.settimeout(None)
+        super().setup()
+
+    def _responder(self, codigo: int, obj) -> None:
+        corpo = json.dumps(obj, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _autorizado(self) -> bool:
+        token = self.server.token
+        if not token:
+            return True
+        recebido = self.headers.get("Authorization", "").encode("utf-8")
+        if hmac.compare_digest(recebido, f"Bearer {token}".encode("utf-8")):
+            return True
+        self.close_connection = True   # corpo não lido: não reaproveita o socket
+        self._responder(401, {"erro": "token do serviço ausente ou inválido"})
+        return False
+
+    def _executar(self, fn: Callable[[Dict], Dict], arg: Dict) -> None:
+        try:
+            self._responder(200, fn(arg))
+        except ErroRequisicao as e:
+            self._responder(400, {"erro": str(e)})
+        except _db.Error as e:
+            self._responder(503, {"erro": f"Erro de banco: {e}"})
+        except Exception as e:
+            self._responder(500, {"erro": f"{type(e).__name__}: {e}"})
+
+    def do_GET(self):
+        if not self._autorizado():
+            return
+        url = urlsplit(self.path)
+        fn = ROTAS_GET.get(url.path)
+        if fn is None:
+            self._responder(404, {"erro": f"rota desconhecida: {url.path}"})
+            return
+        self._executar(fn, parse_qs(url.query))
+
+    def do_POST(self):
+        if not self._autorizado():
+            return
+        fn = ROTAS_POST.get(urlsplit(self.path).path)
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        if tamanho > _MAX_CORPO:
+            self.close_connection = True
+            self._responder(413, {"erro": "requisição grande demais"})
+            return
+        bruto = self.rfile.read(tamanho) if tamanho else b"{}"
+        if fn is None:
+            self._responder(404, {"erro": f"rota desconhecida: {self.path}"})
+            return
+        try:
+            corpo = json.loads(bruto.decode("utf-8"))
+        except ValueError:
+            self._responder(400, {"erro": "JSON inválido"})
+            return
+        self._executar(fn, corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class ServicoMovimentacoes(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", porta: int = PORTA_PADRAO,
+                 token: Optional[str] = None, certificado: Optional[str] = None,
+                 chave_certificado: Optional[str] = None):
+        self.token = TOKEN if token is None else token
+        certificado = CERTIFICADO if certificado is None else certificado
+        chave_certificado = CHAVE_CERTIFICADO if chave_certificado is None else chave_certificado
+        if not _loopback(host) and not (self.token and certificado):
+            raise ValueError(
+                f"Serviço em {host} exige COLETORES_SERVICO_TOKEN e TLS "
+                "(COLETORES_SERVICO_CERT/COLETORES_SERVICO_CERT_CHAVE); "
+                "sem eles, só em 127.0.0.1."
+            )
+        super().__init__((host, porta), _Handler)
+        self.tls = bool(certificado)
+        if certificado:
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ctx.load_cert_chain(certificado, chave_certificado or None)
+            self.socket = ctx.wrap_socket(self.socket, server_side=True, do_handshake_on_connect=False)
+        self._reenvio: Optional[ReenvioPeriodico] = None
+
+    def preparar(self) -> None:
+        """Aquece pool, caches e totais; liga o reenvio do diário offline."""
+        _db.aquecer()
+        _mv.precarregar_lookups()
+        _totais.obter()
+        self._reenvio = ReenvioPeriodico(_mv.reenviar_pendentes, INTERVALO_REENVIO)
+        self._reenvio.start()
+
+    def encerrar(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._reenvio is not None:
+            self._reenvio.parar()
+        _db.fechar_pool()
+
+
+def _loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def iniciar_em_thread(host: str = "127.0.0.1", porta: int = 0) -> Tuple[ServicoMovimentacoes, str]:
+    """Sobe o serviço numa thread (porta 0 = livre); devolve (servidor, url)."""
+    servidor = ServicoMovimentacoes(host, porta)
+    servidor.preparar()
+    threading.Thread(target=servidor.serve_forever, name="servico-http", daemon=True).start()
+    h, p = servidor.server_address[:2]
+    return servidor, f"{'https' if servidor.tls else 'http'}://{h}:{p}"
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serviço local de movimentações de coletores.")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="fora do loopback exige COLETORES_SERVICO_TOKEN e TLS")
+    parser.add_argument("--porta", type=int, default=PORTA_PADRAO)
+    args = parser.parse_args(argv)
+    try:
+        servidor = ServicoMovimentacoes(args.host, args.porta)
+    except ValueError as e:
+        parser.error(str(e))
+    servidor.preparar()
+    print(f"Serviço de movimentações em {'https' if servidor.tls else 'http'}://{args.host}:{args.porta} "
+          f"(backend {_db.CONFIG['BACKEND']}, pool {_db.CONFIG['POOL_MAX']})")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.encerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# conftest.py
+# ------------------------------------------------------------
+# Fixtures dos testes: banco substituto (SQLite) novo por teste, no lugar
+# do SQL Server, e diário offline num arquivo temporário.
+# - db.CONFIG é lido na importação: os testes trocam as chaves com
+#   monkeypatch e fecham os pools antes e depois (nenhum pool fica
+#   apontando para o arquivo de outro teste)
+# ------------------------------------------------------------
+from __future__ import annotations
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import banco_substituto  # noqa: E402
+import db  # noqa: E402
+import diario_offline  # noqa: E402
+
+
+@pytest.fixture
+def banco(tmp_path, monkeypatch):
+    """Caminho do banco substituto vazio (esquema criado) usado por db.conectar()."""
+    caminho = str(tmp_path / "coletores.sqlite3")
+    banco_substituto.criar_esquema(caminho)
+    db.fechar_pool()
+    monkeypatch.setitem(db.CONFIG, "BACKEND", "sqlite")
+    monkeypatch.setitem(db.CONFIG, "SQLITE_PATH", caminho)
+    monkeypatch.setitem(db.CONFIG, "LEITURA_SQLITE_PATH", "")
+    monkeypatch.setattr(db, "_ultima_escrita", {})
+    yield caminho
+    db.fechar_pool()
+
+
+@pytest.fixture
+def diario(tmp_path, monkeypatch):
+    """Diário offline do processo (obter_diario()) num arquivo do teste."""
+    d = diario_offline.DiarioOffline(str(tmp_path / "diario.sqlite3"))
+    monkeypatch.setattr(diario_offline, "_diario", d)
+    return d
+
+
+@pytest.fixture
+def contar():
+    """contar(caminho, sql, *params): COUNT direto no arquivo, sem passar pelo pool."""
+    def _contar(caminho: str, sql: str, *params) -> int:
+        cn = banco_substituto.connect(caminho)
+        try:
+            return cn.execute(sql, *params).fetchone()[0]
+        finally:
+            cn.close()
+    return _contar
@@ -0,0 +1,102 @@
+# test_diario_offline.py
+# ------------------------------------------------------------
+# Diário offline (user-006): movimentação guardada com o servidor fora e
+# reenviada depois, revalidada contra o estado do servidor; o que não
+# passa nas regras fica CONFLITO e não volta a ser enviado.
+# ------------------------------------------------------------
+from dataclasses import asdict
+from datetime import datetime, timedelta
+import sqlite3
+
+import banco_substituto
+import diario_offline
+import mov_validacoes as mv
+
+_SQL_MOVS = "SELECT COUNT(*) FROM LG_ControleColetores"
+
+
+def _mov(acao: str, coletor: str, colaborador: str, chave=None) -> mv.MovDados:
+    mov, _, msg = mv.montar_movimentacao(
+        acao, coletor, colaborador, False, False, False,
+        None, "teste", None, None, None, chave_idempotencia=chave,
+    )
+    assert mov is not None, msg
+    return mov
+
+
+def _estados(diario) -> dict:
+    cn = sqlite3.connect(diario.caminho)
+    try:
+        return dict(cn.execute("SELECT id, estado FROM movimentos").fetchall())
+    finally:
+        cn.close()
+
+
+def test_servidor_fora_vai_para_o_diario_e_reenvia(banco, diario, contar, monkeypatch):
+    def fora():
+        raise banco_substituto.OperationalError("08001", "servidor inalcançável")
+
+    with monkeypatch.context() as m:
+        m.setattr(mv, "get_conn", fora)
+        ok, msg = mv.processar_movimentacao(
+            "Entrega Início operação", "201", "U1", False, False, False,
+            None, "teste", None, None, None, chave_idempotencia=mv.nova_chave(),
+        )
+    assert ok and "diário local" in msg
+    assert diario.contar_pendentes() == 1
+    assert contar(banco, _SQL_MOVS) == 0
+
+    assert mv.reenviar_pendentes() == (1, [])
+    assert diario.contar_pendentes() == 0
+    assert contar(banco, _SQL_MOVS) == 1
+
+
+def test_reenvio_revalida_na_ordem_e_marca_conflito(banco, diario, contar):
+    inicio = datetime.now() - timedelta(minutes=10)
+    ids = [
+        diario.registrar(asdict(_mov("Entrega Início operação", "201", "U1")), [], inicio),
+        # U1 já está com o 201 (item anterior do mesmo lote): conflito
+        diario.registrar(asdict(_mov("Entrega Início operação", "202", "U1")), [], inicio + timedelta(minutes=1)),
+        diario.registrar(asdict(_mov("Devolução Fim operação", "201", "U1")), [], inicio + timedelta(minutes=2)),
+    ]
+
+    enviados, conflitos = mv.reenviar_pendentes()
+
+    assert enviados == 2
+    assert [i for i, _ in conflitos] == [ids[1]]
+    assert _estados(diario) == {ids[0]: diario_offline.ENVIADO, ids[1]: diario_offline.CONFLITO,
+                                ids[2]: diario_offline.ENVIADO}
+    assert [c[0] for c in diario.conflitos()] == [ids[1]]
+    assert diario.contar_pendentes() == 0
+    assert contar(banco, _SQL_MOVS) == 2
+    # nada pendente: um novo reenvio não grava de novo
+    assert mv.reenviar_pendentes() == (0, [])
+    assert contar(banco, _SQL_MOVS) == 2
+
+
+def test_movimento_posterior_no_servidor_e_conflito(banco, diario, contar):
+    id_local = diario.registrar(asdict(_mov("Entrega Início operação", "301", "U3")), [],
+                                datetime.now() - timedelta(hours=1))
+    # outra estação, online, movimentou o coletor depois do registro offline
+    assert mv.processar_movimentacao("Entrega Início operação", "301", "U4", False, False, False,
+                                     None, "teste", None, None, None)[0]
+
+    enviados, conflitos = mv.reenviar_pendentes()
+
+    assert enviados == 0
+    assert [i for i, _ in conflitos] == [id_local]
+    assert _estados(diario) == {id_local: diario_offline.CONFLITO}
+    assert contar(banco, _SQL_MOVS) == 1
+
+
+def test_chave_ja_gravada_so_marca_enviado(banco, diario, contar):
+    # commit feito, resposta perdida: o mesmo envio está no banco e no diário
+    chave = mv.nova_chave()
+    assert mv.processar_movimentacao("Entrega Início operação", "401", "U5", False, False, False,
+                                     None, "teste", None, None, None, chave_idempotencia=chave)[0]
+    id_local = diario.registrar(asdict(_mov("Entrega Início operação", "401", "U5", chave)), [],
+                                datetime.now() - timedelta(minutes=1))
+
+    assert mv.reenviar_pendentes() == (0, [])
+    assert _estados(diario) == {id_local: diario_offline.ENVIADO}
+    assert contar(banco, _SQL_MOVS) == 1
@@ -0,0 +1,47 @@
+# test_idempotencia.py
+# ------------------------------------------------------------
+# Chave de idempotência de processar_movimentacao (user-020): o mesmo
+# envio repetido (duplo clique, nova tentativa após timeout) grava uma vez.
+# ------------------------------------------------------------
+import mov_validacoes as mv
+
+_SQL_MOVS = "SELECT COUNT(*) FROM LG_ControleColetores"
+
+
+def _entregar(coletor: str, colaborador: str, chave=None):
+    return mv.processar_movimentacao(
+        "Entrega Início operação", coletor, colaborador, False, False, False,
+        None, "teste", None, None, None, chave_idempotencia=chave,
+    )
+
+
+def test_mesma_chave_grava_uma_vez(banco, contar):
+    chave = mv.nova_chave()
+    assert _entregar("101", "U1", chave) == (True, mv.MSG_SUCESSO)
+    assert _entregar("101", "U1", chave) == (True, mv.MSG_JA_REGISTRADA)
+    assert contar(banco, _SQL_MOVS) == 1
+    assert contar(banco, "SELECT COUNT(*) FROM LG_ControleColetores WHERE ChaveIdempotencia = ?", (chave,)) == 1
+
+
+def test_chave_nova_passa_pelas_regras(banco, contar):
+    assert _entregar("101", "U1", mv.nova_chave())[0]
+    # outro envio (outra chave) da mesma entrega: recusado pela regra, não pela chave
+    ok, msg = _entregar("101", "U1", mv.nova_chave())
+    assert not ok and msg != mv.MSG_JA_REGISTRADA
+    assert contar(banco, _SQL_MOVS) == 1
+
+
+def test_sem_chave_nao_deduplica(banco, contar):
+    assert _entregar("101", "U1") == (True, mv.MSG_SUCESSO)
+    assert _entregar("102", "U2") == (True, mv.MSG_SUCESSO)
+    assert contar(banco, "SELECT COUNT(*) FROM LG_ControleColetores WHERE ChaveIdempotencia IS NULL") == 2
+
+
+def test_inserir_mov_principal_com_chave_repetida(banco, contar):
+    mov, _, _ = mv.montar_movimentacao(
+        "Entrega Início operação", "101", "U1", False, False, False,
+        None, "teste", None, None, None, chave_idempotencia=mv.nova_chave(),
+    )
+    assert mv.inserir_mov_principal(mov) is True
+    assert mv.inserir_mov_principal(mov) is False
+    assert contar(banco, _SQL_MOVS) == 1
@@ -0,0 +1,78 @@
+# test_replica_leitura.py
+# ------------------------------------------------------------
+# Roteamento de conectar(leitura=True) (user-022): réplica por padrão,
+# primário logo depois de uma gravação deste processo (read-your-writes).
+# Primário e réplica são dois arquivos do banco substituto; uma linha
+# marcadora em cada um diz de onde a leitura veio.
+# ------------------------------------------------------------
+import pytest
+
+import banco_substituto
+import db
+
+_SQL_ORIGEM = "SELECT NumSerie FROM COLETORES_CADASTRO WHERE IDColetores = 'ORIGEM'"
+
+
+def _marcar(caminho: str, origem: str) -> None:
+    cn = banco_substituto.connect(caminho)
+    try:
+        cn.execute("INSERT INTO COLETORES_CADASTRO (IDColetores, NumSerie, IDColetorNorm) "
+                   "VALUES ('ORIGEM', ?, 'ORIGEM')", (origem,))
+        cn.commit()
+    finally:
+        cn.close()
+
+
+@pytest.fixture
+def replica(banco, tmp_path, monkeypatch):
+    caminho = str(tmp_path / "replica.sqlite3")
+    banco_substituto.criar_esquema(caminho)
+    _marcar(banco, "primario")
+    _marcar(caminho, "replica")
+    monkeypatch.setitem(db.CONFIG, "LEITURA_SQLITE_PATH", caminho)
+    return caminho
+
+
+def _origem_da_leitura() -> str:
+    with db.conectar(leitura=True) as cn, cn.cursor() as cur:
+        cur.execute(_SQL_ORIGEM)
+        return cur.fetchone()[0]
+
+
+def _gravar_no_primario(commit: bool = True) -> None:
+    with db.conectar() as cn, cn.cursor() as cur:
+        cur.execute("UPDATE COLETORES_CADASTRO SET NumSerie = NumSerie WHERE IDColetores = 'ORIGEM'")
+        if commit:
+            cn.commit()
+        else:
+            cn.rollback()
+
+
+def test_sem_escrita_le_da_replica(replica):
+    assert _origem_da_leitura() == "replica"
+
+
+def test_leitura_no_primario_nao_desvia_da_replica(replica):
+    with db.conectar() as cn, cn.cursor() as cur:
+        cur.execute(_SQL_ORIGEM)
+        assert cur.fetchone()[0] == "primario"
+    assert db._ultima_escrita == {}
+    assert _origem_da_leitura() == "replica"
+
+
+def test_apos_escrita_le_do_primario_ate_a_janela_passar(replica, monkeypatch):
+    _gravar_no_primario()
+    assert _origem_da_leitura() == "primario"
+    monkeypatch.setitem(db.CONFIG, "LEITURA_APOS_ESCRITA", 0.0)
+    assert _origem_da_leitura() == "replica"
+
+
+def test_escrita_desfeita_nao_desvia_da_replica(replica):
+    _gravar_no_primario(commit=False)
+    assert db._ultima_escrita == {}
+    assert _origem_da_leitura() == "replica"
+
+
+def test_sem_replica_le_do_primario(banco):
+    _marcar(banco, "primario")
+    assert _origem_da_leitura() == "primario"
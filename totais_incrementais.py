@@ -0,0 +1,152 @@
+# totais_incrementais.py
+# ------------------------------------------------------------
+# Totais do painel mantidos em memória e atualizados por diferença.
+# - carga inicial: cadastro (chaves normalizadas) + LG_ColetoresEstadoAtual
+# - a cada atualização, UMA ida ao servidor:
+#     * linhas da projeção com RV (rowversion) entre a marca d'água e
+#       MIN_ACTIVE_ROWVERSION() (seek no índice de RV; sem mudança => zero
+#       linhas). O limite de cima é a menor RV de transação ainda aberta:
+#       RV é dada na escrita, não no commit, e uma transação lenta com RV
+#       menor que uma linha já lida seria pulada para sempre. Esse limite
+#       vira a próxima marca d'água.
+#     * assinatura do cadastro (COUNT + CHECKSUM_AGG) para novos coletores
+# - a projeção é lida sem NOLOCK: linha suja desfeita depois não entra
+# - carga completa a cada RECARGA_COMPLETA s, como rede de segurança
+# - salvamentos locais entram na hora (aplicar_local)
+# Mesma regra de get_totais_coletores: só conta quem está no cadastro,
+# e sem movimento = DISPONIVEL.
+# ------------------------------------------------------------
+from __future__ import annotations
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Set
+
+import db as _db
+from mov_validacoes import STATUS_BY_IDREG, normalizar_id_coletor
+
+_SQL_CADASTRO = """
+    SELECT DISTINCT IDColetorNorm FROM COLETORES_CADASTRO WITH (NOLOCK)
+    WHERE IDColetorNorm IS NOT NULL
+"""
+
+_SQL_ASSINATURA_CADASTRO = """
+    SELECT COUNT_BIG(*), CHECKSUM_AGG(BINARY_CHECKSUM(IDColetores))
+    FROM COLETORES_CADASTRO WITH (NOLOCK)
+"""
+
+_SQL_LIMITE_RV = "SELECT MIN_ACTIVE_ROWVERSION()"
+
+_SQL_ESTADO = """
+    SELECT IDColetorNorm, IDRegistro FROM LG_ColetoresEstadoAtual
+"""
+
+# limite lido antes, no mesmo lote: se avançar entre os comandos, o delta
+# traz linhas a mais, que a próxima rodada relê sem efeito (reaplicar é idempotente)
+_SQL_ESTADO_DELTA = """
+    SELECT IDColetorNorm, IDRegistro FROM LG_ColetoresEstadoAtual
+    WHERE RV >= ? AND RV < MIN_ACTIVE_ROWVERSION()
+"""
+
+RECARGA_COMPLETA = 600.0  # s
+
+
+class TotaisIncrementais:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cadastro: Set[str] = set()
+        self._status: Dict[str, str] = {}      # IDColetorNorm -> status (só do cadastro)
+        self._idreg: Dict[str, int] = {}       # IDColetorNorm -> último IDRegistro (todos)
+        self._contagem: Counter = Counter()
+        self._rv: Optional[bytes] = None       # marca d'água: próxima RV a ler
+        self._carregado_em = 0.0
+        self._assinatura_cadastro = None
+        self.stats = {"cargas": 0, "verificacoes": 0, "sem_mudanca": 0, "linhas_delta": 0, "locais": 0}
+
+    # --- internos (sob self._lock) ---
+    def _definir(self, norm: str, idreg: Optional[int]) -> None:
+        if idreg is not None:
+            self._idreg[norm] = idreg
+        if norm not in self._cadastro:
+            return
+        novo = STATUS_BY_IDREG.get(idreg, "DISPONIVEL")
+        antigo = self._status.get(norm)
+        if antigo == novo:
+            return
+        if antigo is not None:
+            self._contagem[antigo] -= 1
+        self._status[norm] = novo
+        self._contagem[novo] += 1
+
+    def _recontar(self) -> None:
+        self._status.clear()
+        self._contagem.clear()
+        for norm in self._cadastro:
+            self._definir(norm, self._idreg.get(norm))
+
+    # --- API ---
+    @_db.operacao("totais_carga")
+    @_db.repetir_transitorio()
+    def carregar(self) -> Dict[str, int]:
+        """Carga completa (ao abrir a tela ou se a projeção for regenerada)."""
+        with _db.conectar(leitura=True) as cn, cn.cursor() as cur:
+            cur.execute(_SQL_LIMITE_RV)  # antes da leitura: o que vier depois fica para o delta
+            limite = cur.fetchone()[0]
+            cur.execute(_SQL_ASSINATURA_CADASTRO)
+            assinatura = tuple(cur.fetchone())
+            cur.execute(_SQL_CADASTRO)
+            cadastro = {r[0] for r in cur.fetchall()}
+            cur.execute(_SQL_ESTADO)
+            linhas = cur.fetchall()
+        with self._lock:
+            self._cadastro = cadastro
+            self._assinatura_cadastro = assinatura
+            self._idreg = {norm: idreg for norm, idreg in linhas}
+            self._rv = limite
+            self._carregado_em = time.monotonic()
+            self._recontar()
+            self.stats["cargas"] += 1
+            return self._totais()
+
+    @_db.operacao("totais_delta")
+    @_db.repetir_transitorio()
+    def atualizar(self) -> Dict[str, int]:
+        """Aplica só o que mudou desde a última marca d'água."""
+        if self._rv is None or time.monotonic() - self._carregado_em > RECARGA_COMPLETA:
+            return self.carregar()
+        with _db.conectar(leitura=True) as cn, cn.cursor() as cur:
+            cur.execute(_SQL_LIMITE_RV + ";" + _SQL_ESTADO_DELTA + ";" + _SQL_ASSINATURA_CADASTRO,
+                        (self._rv,))
+            limite = cur.fetchone()[0]
+            cur.nextset()
+            delta = cur.fetchall()
+            cur.nextset()
+            assinatura = tuple(cur.fetchone())
+        if assinatura != self._assinatura_cadastro:
+            return self.carregar()  # coletor novo/removido no cadastro
+        with self._lock:
+            self.stats["verificacoes"] += 1
+            if not delta:
+                self.stats["sem_mudanca"] += 1
+            for norm, idreg in delta:
+                self._definir(norm, idreg)
+            self._rv = limite
+            self.stats["linhas_delta"] += len(delta)
+            return self._totais()
+
+    def aplicar_local(self, id_coletor: str, id_registro: int) -> Dict[str, int]:
+        """Reflete na hora um movimento gravado por esta estação."""
+        with self._lock:
+            self._definir(normalizar_id_coletor(id_coletor), id_registro)
+            self.stats["locais"] += 1
+            return self._totais()
+
+    def _totais(self) -> Dict[str, int]:
+        totais = {st: 0 for st in dict.fromkeys(STATUS_BY_IDREG.values())}
+        for st, n in self._contagem.items():
+            totais[st] = n
+        return totais
+
+    def totais(self) -> Dict[str, int]:
+        with self._lock:
+            return self._totais()
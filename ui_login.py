@@ -1,10 +1,27 @@
+# ui_login.py
+# ------------------------------------------------------------
+# Tela de login/cadastro. A janela aparece antes de tudo:
+# - db/pyodbc, mov_validacoes e ui_principal são importados sob demanda;
+#   o driver ODBC e a primeira conexão do pool são aquecidos numa thread
+#   enquanto o usuário digita (db.aquecer())
+# - o logo vem pré-redimensionado (assets/logo_120.png) e é lido direto
+#   pelo Tk; o PIL só é usado se esse arquivo faltar
+# - medição do tempo de abertura: python main.py --medir-inicio
+#   (ou COLETORES_MEDIR_INICIO=1); relatório no console e em tempo_inicio.log
+# - com COLETORES_SERVICO_URL, login e tela principal usam o serviço local
+#   (servico.py / cliente_servico.py) em vez do banco
+# ------------------------------------------------------------
 import tkinter as tk
 from tkinter import messagebox
-from PIL import Image, ImageTk
-import db  # conexão com banco
+import threading
+import time
 import sys  # ## AJUSTE 1: Importar a biblioteca SYS
 import os   # ## AJUSTE 2: Importar a biblioteca OS
 
+LOGO_PRONTO = "assets/logo_120.png"          # 120x120, gerado a partir do original
+LOGO_ORIGINAL = "assets/Logo Minimalista AZZAS.png"
+TAMANHO_LOGO = (120, 120)
+
 
 # ## AJUSTE 3: Adicionar esta função no início do seu script ##
 def resource_path(relative_path):
@@ -18,6 +35,82 @@ def resource_path(relative_path):
     return os.path.join(base_path, relative_path)
 
 
+def _pasta_app() -> str:
+    # ao lado do executável no PyInstaller; ao lado do código em DEV
+    if getattr(sys, "frozen", False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+class _Cronometro:
+    """Marcas de tempo da abertura (só registra se ativo)."""
+
+    def __init__(self, inicio: float, ativo: bool):
+        self.inicio = inicio
+        self.ativo = ativo
+        self.marcas = []
+        self._lock = threading.Lock()
+
+    def marcar(self, etapa: str) -> None:
+        if self.ativo:
+            with self._lock:
+                self.marcas.append((etapa, time.perf_counter() - self.inicio, threading.current_thread().name))
+
+    def relatorio(self) -> str:
+        with self._lock:
+            marcas = sorted(self.marcas, key=lambda m: m[1])
+        linhas = [f"Abertura ({time.strftime('%Y-%m-%d %H:%M:%S')}, frozen={getattr(sys, 'frozen', False)}):"]
+        for etapa, seg, thread in marcas:
+            linhas.append(f"  {seg * 1000:8.1f} ms  {etapa:<28} [{thread}]")
+        return "\n".join(linhas)
+
+    def gravar(self) -> None:
+        texto = self.relatorio()
+        print(texto)
+        try:
+            with open(os.path.join(_pasta_app(), "tempo_inicio.log"), "a", encoding="utf-8") as f:
+                f.write(texto + "\n")
+        except OSError:
+            pass
+
+
+_cronometro = _Cronometro(time.perf_counter(), False)
+_aquecimento_concluido = threading.Event()
+
+
+def _aquecer_banco():
+    """
+    Em segundo plano: importa db (pyodbc), escolhe o driver e abre a primeira
+    conexão do pool; depois importa mov_validacoes. Falhas são ignoradas aqui —
+    o login mostra o erro se o banco continuar indisponível.
+    """
+    try:
+        import cliente_servico
+        if cliente_servico.ativo():  # estação atendida pelo serviço local
+            cliente_servico.saude()
+            _cronometro.marcar("serviço respondeu")
+            return
+        import db
+        _cronometro.marcar("import db/pyodbc")
+        db.aquecer()
+        _cronometro.marcar("driver + 1ª conexão")
+        import mov_validacoes  # noqa: F401
+        _cronometro.marcar("import mov_validacoes")
+    except Exception as e:
+        _cronometro.marcar(f"aquecimento falhou: {type(e).__name__}")
+    finally:
+        _aquecimento_concluido.set()
+
+
+def _carregar_logo():
+    """PhotoImage 120x120: usa o PNG pronto; sem ele, redimensiona o original com PIL."""
+    pronto = resource_path(LOGO_PRONTO)
+    if os.path.exists(pronto):
+        return tk.PhotoImage(file=pronto)
+    from PIL import Image, ImageTk
+    return ImageTk.PhotoImage(Image.open(resource_path(LOGO_ORIGINAL)).resize(TAMANHO_LOGO))
+
+
 # Função para gerar IDUsuario automaticamente
 def gerar_id_usuario(nome_completo):
     nome_completo = nome_completo.upper().strip()
@@ -38,8 +131,18 @@ def login():
         messagebox.showerror("Erro", "Preencha todos os campos!")
         return
 
-    if db.verificar_login(usuario, senha):
+    import cliente_servico
+    remoto = cliente_servico.ativo()
+    if remoto:
+        verificar_login = cliente_servico.verificar_login
+    else:
+        import db  # já importado pelo aquecimento, na maioria das vezes
+        verificar_login = db.verificar_login
+    if verificar_login(usuario, senha):
         root.withdraw()  # esconde a janela de login
+        if not remoto:  # no modo serviço os caches ficam no serviço
+            import mov_validacoes
+            mov_validacoes.precarregar_lookups()  # cadastros em memória, em segundo plano
         import ui_principal
         ui_principal.abrir_ui_principal(usuario)
 
@@ -79,6 +182,7 @@ def cadastrar_usuario():
         return
 
     try:
+        import db
         if db.usuario_existe(id_usuario, email):
             messagebox.showerror("Erro", "Usuário ou e-mail já cadastrados!")
             return
@@ -105,59 +209,87 @@ def mostrar_cadastro():
 
 
 # --- Janela principal ---
-root = tk.Tk()
-root.title("Sistema de Cadastro e Login")
-root.geometry("400x550")
-
-# --- Logo ---
-# ## AJUSTE 4: Substituir o caminho antigo pelo novo, que usa a função ##
-# O caminho relativo agora inclui a pasta 'assets'.
-logo_path = resource_path("assets/Logo Minimalista AZZAS.png")
+def criar_tela_login(inicio=None, medir=False, sair_apos_medir=False):
+    """
+    Monta a janela de login e entra no mainloop.
+    `inicio`: perf_counter() do começo do processo (main.py), para a medição.
+    """
+    global root, logo_tk, frame_login, frame_cadastro
+    global entry_usuario, entry_senha, entry_nome, entry_email, entry_senha_cadastro
+    global _cronometro
+
+    medir = medir or os.getenv("COLETORES_MEDIR_INICIO") == "1"
+    _cronometro = _Cronometro(inicio if inicio is not None else time.perf_counter(), medir)
+    _cronometro.marcar("imports da tela")
+
+    # banco aquece enquanto a janela é montada e o usuário digita
+    threading.Thread(target=_aquecer_banco, name="aquecer-banco", daemon=True).start()
+
+    root = tk.Tk()
+    root.title("Sistema de Cadastro e Login")
+    root.geometry("400x550")
+    _cronometro.marcar("tk.Tk()")
+
+    # --- Logo ---
+    logo_tk = _carregar_logo()
+    tk.Label(root, image=logo_tk).pack(pady=10)
+    _cronometro.marcar("logo")
+
+    # --- Frame Login ---
+    frame_login = tk.Frame(root)
+
+    tk.Label(frame_login, text="Usuário:").pack(pady=5)
+    entry_usuario = tk.Entry(frame_login, width=30)
+    entry_usuario.pack(pady=5)
+
+    tk.Label(frame_login, text="Senha:").pack(pady=5)
+    entry_senha = tk.Entry(frame_login, show="*", width=30)
+    entry_senha.pack(pady=5)
+
+    tk.Button(frame_login, text="Login", command=login).pack(pady=10)
+    tk.Button(frame_login, text="Esqueci minha senha", command=esqueci_senha).pack(pady=5)
+    tk.Button(frame_login, text="Cadastrar novo usuário", command=mostrar_cadastro).pack(pady=5)
 
-logo_img = Image.open(logo_path)
-logo_img = logo_img.resize((120, 120))
-logo_tk = ImageTk.PhotoImage(logo_img)
-tk.Label(root, image=logo_tk).pack(pady=10)
-
-# --- Frame Login ---
-frame_login = tk.Frame(root)
-
-tk.Label(frame_login, text="Usuário:").pack(pady=5)
-entry_usuario = tk.Entry(frame_login, width=30)
-entry_usuario.pack(pady=5)
-
-tk.Label(frame_login, text="Senha:").pack(pady=5)
-entry_senha = tk.Entry(frame_login, show="*", width=30)
-entry_senha.pack(pady=5)
+    frame_login.pack(pady=10)
 
-tk.Button(frame_login, text="Login", command=login).pack(pady=10)
-tk.Button(frame_login, text="Esqueci minha senha", command=esqueci_senha).pack(pady=5)
-tk.Button(frame_login, text="Cadastrar novo usuário", command=mostrar_cadastro).pack(pady=5)
+    # --- Frame Cadastro ---
+    frame_cadastro = tk.Frame(root)
 
-frame_login.pack(pady=10)
+    tk.Label(frame_cadastro, text="Nome completo:").pack(pady=5)
+    entry_nome = tk.Entry(frame_cadastro, width=30)
+    entry_nome.pack(pady=5)
 
+    tk.Label(frame_cadastro, text="E-mail corporativo:").pack(pady=5)
+    entry_email = tk.Entry(frame_cadastro, width=30)
+    entry_email.pack(pady=5)
 
-# --- Frame Cadastro ---
-frame_cadastro = tk.Frame(root)
+    tk.Label(frame_cadastro, text="Senha:").pack(pady=5)
+    entry_senha_cadastro = tk.Entry(frame_cadastro, show="*", width=30)
+    entry_senha_cadastro.pack(pady=5)
 
-tk.Label(frame_cadastro, text="Nome completo:").pack(pady=5)
-entry_nome = tk.Entry(frame_cadastro, width=30)
-entry_nome.pack(pady=5)
+    tk.Button(frame_cadastro, text="Cadastrar", command=cadastrar_usuario).pack(pady=10)
+    tk.Button(frame_cadastro, text="Voltar ao Login", command=mostrar_login).pack(pady=5)
 
-tk.Label(frame_cadastro, text="E-mail corporativo:").pack(pady=5)
-entry_email = tk.Entry(frame_cadastro, width=30)
-entry_email.pack(pady=5)
 
-tk.Label(frame_cadastro, text="Senha:").pack(pady=5)
-entry_senha_cadastro = tk.Entry(frame_cadastro, show="*", width=30)
-entry_senha_cadastro.pack(pady=5)
+    # Inicialmente mostra login, mas não o recarrega se já estiver visível
+    if not frame_cadastro.winfo_ismapped():
+        frame_login.pack(pady=10)
 
-tk.Button(frame_cadastro, text="Cadastrar", command=cadastrar_usuario).pack(pady=10)
-tk.Button(frame_cadastro, text="Voltar ao Login", command=mostrar_login).pack(pady=5)
+    entry_usuario.focus_set()
+    _cronometro.marcar("widgets")
 
+    def _janela_visivel():
+        _cronometro.marcar("janela desenhada")
+        if medir:
+            _aguardar_aquecimento()
 
-# Inicialmente mostra login, mas não o recarrega se já estiver visível
-if not frame_cadastro.winfo_ismapped():
-    frame_login.pack(pady=10)
+    def _aguardar_aquecimento():
+        if not _aquecimento_concluido.is_set():
+            root.after(50, _aguardar_aquecimento)
+            return
+        _cronometro.gravar()
+        if sair_apos_medir:
+            root.destroy()
 
-root.mainloop()
\ No newline at end of file
+    root.after_idle(_janela_visivel)
+    root.mainloop()
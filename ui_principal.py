@@ -1,14 +1,160 @@
+import time
 import tkinter as tk
 from tkinter import ttk, messagebox
 from datetime import datetime
+from typing import Callable, Dict, Hashable, List, Tuple
 
-from db import get_totais_coletores
+import cliente_servico
+import db as _db
+from diario_offline import obter_diario
+from executor_db import ExecutorDB
 from mov_validacoes import (
-    processar_movimentacao,
-    nome_coletor_ou_usuario,
-    status_do_coletor,
+    normalizar_acao,
+    ACOES_COM_RESPONSAVEL,
+    ID_REGISTRO,
+    LIMITE_SUGESTOES,
+    MSG_SUCESSO,
+    STATUS_BY_IDREG,
+    nova_chave,
 )
 
+# Com COLETORES_SERVICO_URL definida, a tela fala com o serviço local
+# (servico.py) em vez de abrir conexões ODBC próprias.
+if cliente_servico.ativo():
+    from cliente_servico import (
+        processar_movimentacao,
+        nome_coletor_ou_usuario,
+        buscar_usuarios,
+        status_do_coletor,
+        reenviar_pendentes,
+        processar_lote,
+        relatorio_frota,
+        pagina_frota,
+        contar_frota,
+        estado_conexao,
+        TotaisRemotos as TotaisIncrementais,
+    )
+else:
+    from mov_validacoes import (
+        processar_movimentacao,
+        nome_coletor_ou_usuario,
+        buscar_usuarios,
+        status_do_coletor,
+        reenviar_pendentes,
+        processar_lote,
+    )
+    from totais_incrementais import TotaisIncrementais
+    from frota_lista import pagina_frota, contar_frota
+    from db import estado_conexao
+
+    def relatorio_frota(atualizar: bool = False):
+        import analise_frota  # NumPy só quando o relatório é aberto
+        return analise_frota.relatorio_frota(atualizar)
+
+INTERVALO_REENVIO_MS = 15000
+INTERVALO_TOTAIS_MS = 10000
+INTERVALO_CONEXAO_MS = 1000  # só lê o estado do disjuntor, sem ir ao servidor
+JANELA_REPETICAO_S = 0.8  # Enter duplo do leitor / duplo clique em Salvar
+ATRASO_FILTRO_MS = 300   # digitação no filtro da frota: consulta só quando para de digitar
+MARGEM_ROLAGEM = 0.9     # fração da lista visível a partir da qual a próxima página é pedida
+PAGINAS_NA_TELA = 3      # páginas da frota mantidas no Treeview; as da outra ponta saem
+MIN_CARACTERES_BUSCA = 2  # sugestões de colaborador a partir de 2 letras
+
+
+class _FiltroRepeticao:
+    """Aponta o mesmo valor chegando de novo no mesmo campo dentro da janela."""
+
+    def __init__(self, janela_s: float = JANELA_REPETICAO_S):
+        self._janela = janela_s
+        self._ultimo: Dict[str, Tuple[Hashable, float]] = {}
+
+    def repetido(self, campo: str, valor: Hashable) -> bool:
+        agora = time.monotonic()
+        anterior = self._ultimo.get(campo)
+        self._ultimo[campo] = (valor, agora)
+        return anterior is not None and anterior[0] == valor and agora - anterior[1] < self._janela
+
+
+class _SugestoesUsuario:
+    """
+    Lista suspensa sob o campo do responsável: nome ou trecho do ID digitado
+    -> colaboradores do cache em memória (buscar_usuarios), sem ir ao banco.
+    Setas escolhem, Enter confirma, Esc fecha; crachá bipado segue direto.
+    """
+
+    def __init__(self, entry: tk.Entry, executor: ExecutorDB, ao_escolher: Callable[[str], None]):
+        self._entry = entry
+        self._executor = executor
+        self._ao_escolher = ao_escolher
+        self._ids: List[str] = []
+        self._visivel = False
+        self._geracao = 0   # resposta de busca anterior a esconder()/nova busca é descartada
+        self._lista = tk.Listbox(entry.winfo_toplevel(), height=LIMITE_SUGESTOES, width=50,
+                                 takefocus=0, exportselection=False)
+        self._lista.bind("<ButtonRelease-1>", lambda e: self.escolher())
+        entry.bind("<KeyRelease>", self._digitou, add="+")
+        entry.bind("<Down>", lambda e: self._mover(1))
+        entry.bind("<Up>", lambda e: self._mover(-1))
+        entry.bind("<Escape>", lambda e: self.esconder())
+        entry.bind("<FocusOut>", lambda e: entry.after(200, self._esconder_sem_foco), add="+")
+
+    def _digitou(self, event) -> None:
+        if event.keysym in ("Return", "KP_Enter", "Up", "Down", "Escape", "Tab"):
+            return
+        texto = self._entry.get().strip()
+        if len(texto) < MIN_CARACTERES_BUSCA:
+            self.esconder()
+            return
+        self._geracao += 1
+        geracao = self._geracao
+        self._executor.ler("sugestoes", buscar_usuarios, texto, chave_consulta=texto,
+                           ao_concluir=lambda r: self._mostrar(geracao, r))
+
+    def _mostrar(self, geracao: int, sugestoes: List[Tuple[str, str]]) -> None:
+        if geracao != self._geracao:
+            return
+        if not sugestoes:
+            self.esconder()
+            return
+        self._ids = [i for i, _ in sugestoes]
+        self._lista.delete(0, tk.END)
+        for i, nome in sugestoes:
+            self._lista.insert(tk.END, f"{i}  {nome or ''}")
+        self._lista.config(height=len(sugestoes))
+        self._lista.place(in_=self._entry, x=0, rely=1.0, y=2)
+        self._lista.lift()
+        self._visivel = True
+
+    def _mover(self, passo: int):
+        if not self._visivel:
+            return None
+        atual = self._lista.curselection()
+        i = max(0, min(len(self._ids) - 1, (atual[0] + passo) if atual else 0))
+        self._lista.selection_clear(0, tk.END)
+        self._lista.selection_set(i)
+        self._lista.see(i)
+        return "break"
+
+    def _esconder_sem_foco(self) -> None:
+        if self._entry.focus_get() not in (self._entry, self._lista):
+            self.esconder()
+
+    def escolher(self) -> bool:
+        """Confirma a sugestão marcada (se houver) e fecha a lista."""
+        atual = self._lista.curselection() if self._visivel else ()
+        if not atual:
+            return False
+        id_usuario = self._ids[atual[0]]
+        self.esconder()
+        self._ao_escolher(id_usuario)
+        return True
+
+    def esconder(self) -> None:
+        self._geracao += 1
+        if self._visivel:
+            self._lista.place_forget()
+            self._visivel = False
+
 
 def abrir_ui_principal(usuario_logado: str):
     """
@@ -23,16 +169,86 @@ def abrir_ui_principal(usuario_logado: str):
     # Estado
     # -------------------------
     acao_var = tk.StringVar(value="")  # ação escolhida
+    totais_inc = TotaisIncrementais()  # contadores em memória, atualizados por diferença
+    repeticoes = _FiltroRepeticao()
+    # chave de idempotência do formulário em preenchimento: nasce ao bipar o
+    # coletor e vale para todo envio desse formulário (inclusive o devolvido)
+    envio = {"chave": None, "coletor": None}
 
     # -------------------------
     # Funções
     # -------------------------
-    def carregar_totais():
-        totais = get_totais_coletores()
+    def chave_do_formulario(id_coletor):
+        if envio["chave"] is None or envio["coletor"] != id_coletor:
+            envio.update(chave=nova_chave(), coletor=id_coletor)
+        return envio["chave"]
+
+    def mostrar_totais(totais):
         lbl_em_operacao.config(text=str(totais.get("EM OPERACAO", 0)))
         lbl_disponiveis.config(text=str(totais.get("DISPONIVEL", 0)))
         lbl_conserto.config(text=str(totais.get("EM CONSERTO", 0)))
 
+    def carregar_totais():
+        # sem mudança no banco, custa uma consulta que devolve zero linhas
+        # (mostra o estado mais recente: pode incluir um salvamento local posterior)
+        executor.ler("totais", totais_inc.atualizar, ao_concluir=lambda _: mostrar_totais(totais_inc.totais()))
+
+    def agendar_totais():
+        carregar_totais()
+        janela.after(INTERVALO_TOTAIS_MS, agendar_totais)
+
+    def reenviar_e_contar():
+        # roda na fila de gravação (fora da thread do Tk), nunca junto com outro reenvio
+        diario = obter_diario()
+        enviados, conflitos = 0, []
+        if diario.contar_pendentes():
+            try:
+                enviados, conflitos = reenviar_pendentes()
+            except cliente_servico.ServicoIndisponivel:
+                pass  # serviço ainda fora: fica para a próxima rodada
+            except _db.Error as e:
+                if not _db.erro_de_conexao(e):
+                    print(f"Reenvio do diário offline falhou: {e}")
+            except Exception as e:
+                print(f"Reenvio do diário offline falhou: {type(e).__name__}: {e}")
+        return enviados, conflitos, diario.contar_pendentes()
+
+    def reenviar():
+        if not executor.ocupado("diario"):  # já há um reenvio na fila
+            executor.gravar(reenviar_e_contar, canal="diario", ao_concluir=mostrar_diario)
+
+    def mostrar_diario(resultado):
+        enviados, conflitos, restantes = resultado
+        if restantes:
+            lbl_offline.config(text=f"OFFLINE: {restantes} movimentação(ões) aguardando envio", fg="orange")
+        else:
+            lbl_offline.config(text="")
+        if enviados:
+            carregar_totais()
+        if conflitos:
+            linhas = "\n".join(f"#{i}: {msg}" for i, msg in conflitos[:20])
+            messagebox.showwarning("Diário offline", f"{len(conflitos)} movimentação(ões) offline recusada(s):\n{linhas}")
+
+    def agendar_reenvio():
+        reenviar()
+        janela.after(INTERVALO_REENVIO_MS, agendar_reenvio)
+
+    def mostrar_conexao():
+        st = estado_conexao()
+        if st["estado"] == "fechado":
+            lbl_conexao.config(text="● ONLINE", fg="green", bg=fundo_janela)
+        elif st["estado"] == "meio_aberto" or st["tentar_em_s"] <= 0:
+            lbl_conexao.config(text="RECONECTANDO...", fg="black", bg="orange")
+        else:
+            lbl_conexao.config(text=f"OFFLINE: nova tentativa em {st['tentar_em_s']:.0f}s", fg="white", bg="red")
+        janela.after(INTERVALO_CONEXAO_MS, mostrar_conexao)
+
+    def ao_ocupado(canal, ocupado):
+        # indicador de "consultando..." por campo
+        ind = indicadores.get(canal)
+        if ind is not None:
+            ind.config(text="⏳" if ocupado else "")
+
     def atualizar_ui(*_):
         acao = acao_var.get()
         # esconde tudo
@@ -50,17 +266,14 @@ def abrir_ui_principal(usuario_logado: str):
         if acao in ["Envio Conserto", "Retorno Conserto"]:
             frame_datas.pack(fill="x", padx=10, pady=10)
 
-    def on_enter_coletor(event=None):
-        _id = entry_coletor.get().strip()
-        if not _id:
-            return
-        try:
-            serial = nome_coletor_ou_usuario(_id, modo="COLETOR")
-            st, last_colab = status_do_coletor(_id)
-        except Exception as e:
-            messagebox.showerror("Erro", f"Falha ao consultar coletor: {e}")
-            return
+    def consultar_coletor(_id):
+        # roda fora da thread do Tk
+        serial = nome_coletor_ou_usuario(_id, modo="COLETOR")
+        st, last_colab = status_do_coletor(_id)
+        return serial, st, last_colab
 
+    def mostrar_coletor(resultado):
+        serial, st, last_colab = resultado
         if serial:
             texto = f"{serial} | Status: {st}"
             if last_colab:
@@ -69,28 +282,56 @@ def abrir_ui_principal(usuario_logado: str):
         else:
             lbl_info_coletor.config(text="Não encontrado", fg="red")
 
-        entry_responsavel.focus_set()
-        entry_responsavel.selection_range(0, tk.END)
-
-    def on_enter_resp(event=None):
-        _id = entry_responsavel.get().strip()
+    def on_enter_coletor(event=None):
+        _id = entry_coletor.get().strip()
         if not _id:
             return
-        try:
-            nome = nome_coletor_ou_usuario(_id, modo="USUARIO")
-        except Exception as e:
-            messagebox.showerror("Erro", f"Falha ao consultar usuário: {e}")
+        chave_do_formulario(_id)
+        if repeticoes.repetido("coletor", _id):
             return
+        lbl_info_coletor.config(text="", fg="gray")
+        executor.ler(
+            "coletor", consultar_coletor, _id,
+            chave_consulta=_id,
+            ao_concluir=mostrar_coletor,
+            ao_falhar=lambda e: lbl_info_coletor.config(text=f"Falha ao consultar coletor: {e}", fg="red"),
+        )
+
+        # segue para o crachá sem esperar a consulta
+        entry_responsavel.focus_set()
+        entry_responsavel.selection_range(0, tk.END)
 
+    def mostrar_resp(nome):
         if nome:
             lbl_info_resp.config(text=nome, fg="gray")
         else:
             lbl_info_resp.config(text="Não encontrado", fg="red")
 
+    def on_enter_resp(event=None):
+        if sugestoes_resp.escolher():  # Enter com uma sugestão marcada
+            return
+        sugestoes_resp.esconder()
+        _id = entry_responsavel.get().strip()
+        if not _id or repeticoes.repetido("resp", _id):
+            return
+        lbl_info_resp.config(text="", fg="gray")
+        executor.ler(
+            "resp", nome_coletor_ou_usuario, _id, modo="USUARIO",
+            chave_consulta=_id,
+            ao_concluir=mostrar_resp,
+            ao_falhar=lambda e: lbl_info_resp.config(text=f"Falha ao consultar usuário: {e}", fg="red"),
+        )
+
+    def escolher_resp(id_usuario):
+        entry_responsavel.delete(0, tk.END)
+        entry_responsavel.insert(0, id_usuario)
+        on_enter_resp()
+
     def limpar_form():
         # campos principais
         entry_coletor.delete(0, tk.END)
         entry_responsavel.delete(0, tk.END)
+        sugestoes_resp.esconder()
 
         # textos/observações
         txt_defeitos.delete("1.0", tk.END)
@@ -115,19 +356,57 @@ def abrir_ui_principal(usuario_logado: str):
         # limpa labels auxiliares
         lbl_info_coletor.config(text="")
         lbl_info_resp.config(text="")
+        envio.update(chave=None, coletor=None)
 
         # foco de volta
         entry_coletor.focus_set()
 
+    def ler_formulario():
+        """Tudo o que o operador preencheu, para devolver ao formulário se o envio falhar."""
+        return {
+            "acao": acao_var.get(),
+            "entries": {e: e.get() for e in (entry_coletor, entry_responsavel, entry_envio, entry_chamado,
+                                              entry_retorno)},
+            "textos": {t: t.get("1.0", "end-1c") for t in (txt_defeitos, txt_consideracoes)},
+            "radios": {v: v.get() for v in (var_teste, var_defeito, var_conserto)},
+            "envio": dict(envio),
+        }
+
+    def restaurar_formulario(form):
+        limpar_form()
+        acao_var.set(form["acao"])  # trace mostra os quadros da ação
+        for e, valor in form["entries"].items():
+            e.insert(0, valor)
+        for t, valor in form["textos"].items():
+            t.insert("1.0", valor)
+        for v, valor in form["radios"].items():
+            v.set(valor)
+        envio.update(form["envio"])  # reenviar o formulário devolvido usa a mesma chave
+
+    def devolver_formulario(form, rotulo):
+        # o operador pode já estar preenchendo o próximo coletor
+        if entry_coletor.get().strip() or entry_responsavel.get().strip() or acao_var.get():
+            if not messagebox.askyesno(
+                    "Movimentação não registrada",
+                    f"{rotulo}\nTrazer de volta o formulário enviado? O que está preenchido agora será descartado.",
+                    parent=janela):
+                return
+        restaurar_formulario(form)
+
     def salvar_dados():
         acao_ui = acao_var.get()
         id_coletor = entry_coletor.get().strip()
         id_resp = entry_responsavel.get().strip()
+        if repeticoes.repetido("salvar", None) and not id_coletor:
+            return  # duplo clique: o primeiro já enviou e limpou o formulário
 
         # lista de defeitos (se tiver listbox específica, monte aqui)
         lista_defeitos = []
 
-        ok, msg = processar_movimentacao(
+        # lê todo o formulário aqui (thread do Tk) e grava em segundo plano
+        chave = chave_do_formulario(id_coletor)
+        form = ler_formulario()
+        params = dict(
             acao_ui=acao_ui,
             id_coletor=id_coletor,
             id_resp=id_resp,
@@ -141,15 +420,32 @@ def abrir_ui_principal(usuario_logado: str):
             data_envio_conserto=(entry_envio.get().strip() or None),   # 'YYYY-MM-DD'
             chamado=(entry_chamado.get().strip() or None),
             data_retorno_conserto=(entry_retorno.get().strip() or None),
-            lista_defeitos_escolhidos=lista_defeitos
+            lista_defeitos_escolhidos=lista_defeitos,
+            chave_idempotencia=chave,  # a mesma em todo envio deste formulário
         )
-
-        if ok:
-            messagebox.showinfo("Sucesso", msg)
-            carregar_totais()
-            limpar_form()
-        else:
-            messagebox.showerror("Validação", msg)
+        rotulo = f"{id_coletor} ({acao_ui or 'sem ação'})"
+
+        def concluido(resultado):
+            ok, msg = resultado
+            if ok:
+                lbl_status_salvar.config(text=f"{rotulo}: {msg}", fg="green")
+                if msg == MSG_SUCESSO:  # (offline não conta até ser enviado)
+                    mostrar_totais(totais_inc.aplicar_local(id_coletor, ID_REGISTRO[normalizar_acao(acao_ui)]))
+                reenviar()
+            else:
+                messagebox.showerror("Validação", f"{rotulo}\n{msg}")
+                lbl_status_salvar.config(text=f"{rotulo}: não registrado", fg="red")
+                devolver_formulario(form, rotulo)
+
+        def falhou(e):
+            messagebox.showerror("Erro", f"{rotulo}\nFalha ao processar movimentação: {e}")
+            lbl_status_salvar.config(text=f"{rotulo}: não registrado", fg="red")
+            devolver_formulario(form, rotulo)
+
+        executor.gravar(processar_movimentacao, ao_concluir=concluido, ao_falhar=falhou, **params)
+        lbl_status_salvar.config(text=f"Salvando {rotulo}...", fg="gray")
+        # libera o formulário para o próximo coletor enquanto grava (volta se falhar)
+        limpar_form()
 
     # -------------------------
     # Layout
@@ -177,15 +473,7 @@ def abrir_ui_principal(usuario_logado: str):
     frame_acoes = tk.LabelFrame(janela, text="Escolha uma ação")
     frame_acoes.pack(fill="x", padx=10, pady=10)
 
-    acoes = [
-        "Entrega Início operação",
-        "Devolução término operação",
-        "Envio Conserto",
-        "Retorno Conserto",
-        "Coletor Extraviado",
-        "Coletor Inativo",
-    ]
-    for i, ac in enumerate(acoes):
+    for i, ac in enumerate(ACOES):
         rb = tk.Radiobutton(frame_acoes, text=ac, variable=acao_var, value=ac)
         rb.grid(row=0, column=i, padx=10)
     acao_var.trace_add("write", atualizar_ui)
@@ -210,6 +498,12 @@ def abrir_ui_principal(usuario_logado: str):
     lbl_info_resp = tk.Label(frame_dados, text="", fg="gray")
     lbl_info_resp.grid(row=1, column=3, sticky="w", pady=(3, 0))
 
+    # indicadores de consulta em andamento (um por campo)
+    ind_coletor = tk.Label(frame_dados, text="", width=2)
+    ind_coletor.grid(row=0, column=4, sticky="w")
+    ind_resp = tk.Label(frame_dados, text="", width=2)
+    ind_resp.grid(row=0, column=5, sticky="w")
+
     # Frames variáveis
     frame_testes = tk.Frame(janela)
     frame_info = tk.Frame(janela)
@@ -251,14 +545,442 @@ def abrir_ui_principal(usuario_logado: str):
     frame_botoes.pack(pady=15)
     ttk.Button(frame_botoes, text="Salvar", command=salvar_dados).pack(side="left", padx=10)
     ttk.Button(frame_botoes, text="Cancelar", command=limpar_form).pack(side="left", padx=10)
+    ttk.Button(frame_botoes, text="Bipagem em lote",
+               command=lambda: abrir_ui_lote(usuario_logado, ao_gravar=carregar_totais)).pack(side="left", padx=10)
+    ttk.Button(frame_botoes, text="Relatório da frota", command=abrir_ui_relatorio).pack(side="left", padx=10)
+    ttk.Button(frame_botoes, text="Consultar frota", command=abrir_ui_frota).pack(side="left", padx=10)
+    ind_salvar = tk.Label(frame_botoes, text="", width=2)
+    ind_salvar.pack(side="left")
+    lbl_status_salvar = tk.Label(janela, text="", fg="gray")
+    lbl_status_salvar.pack()
+    lbl_offline = tk.Label(janela, text="", fg="orange", font=("Arial", 10, "bold"))
+    lbl_offline.pack()
+
+    ind_totais = tk.Label(frame_top, text="", width=2)
+    ind_totais.grid(row=1, column=4)
+
+    # Online/offline (disjuntor da conexão): servidor fora, tudo falha na hora
+    fundo_janela = janela.cget("bg")
+    lbl_conexao = tk.Label(frame_top, text="", font=("Arial", 10, "bold"), padx=8)
+    lbl_conexao.grid(row=0, column=5, rowspan=2, padx=10)
+
+    # Executor de banco (nada de consulta na thread do Tk)
+    indicadores = {"coletor": ind_coletor, "resp": ind_resp, "salvar": ind_salvar, "totais": ind_totais}
+    executor = ExecutorDB(janela, ao_ocupado=ao_ocupado)
+    sugestoes_resp = _SugestoesUsuario(entry_responsavel, executor, escolher_resp)
+
+    def ao_destruir(event):
+        if event.widget is janela:
+            executor.encerrar()
+    janela.bind("<Destroy>", ao_destruir, add="+")
 
     # Inicializa
-    carregar_totais()
+    agendar_totais()
+    agendar_reenvio()
+    mostrar_conexao()
     entry_coletor.focus_set()
 
     # Importante: não chame mainloop aqui, pois a janela é Toplevel.
 
 
+ACOES = [
+    "Entrega Início operação",
+    "Devolução término operação",
+    "Envio Conserto",
+    "Retorno Conserto",
+    "Coletor Extraviado",
+    "Coletor Inativo",
+]
+
+
+def abrir_ui_lote(usuario_logado: str, ao_gravar=None):
+    """
+    Bipagem em lote: acumula (coletor, colaborador, ação) e registra tudo
+    numa única operação (mov_validacoes.processar_lote).
+    """
+    janela = tk.Toplevel()
+    janela.title("Bipagem em lote")
+    janela.geometry("900x560")
+
+    acao_var = tk.StringVar(value=ACOES[0])
+    executor = ExecutorDB(janela)
+    repeticoes = _FiltroRepeticao()
+
+    def exige_responsavel():
+        return normalizar_acao(acao_var.get()) in ACOES_COM_RESPONSAVEL
+
+    def adicionar(id_coletor, id_resp):
+        ac = acao_var.get()
+        if repeticoes.repetido("item", (id_coletor, id_resp, ac)):
+            return  # mesma bipagem repetida pelo leitor
+        tree.insert("", tk.END, values=(id_coletor, id_resp, ac, "pendente"), tags=("pendente",))
+        lbl_total.config(text=f"{len(tree.get_children())} item(ns)")
+        entry_coletor.delete(0, tk.END)
+        entry_resp.delete(0, tk.END)
+        entry_coletor.focus_set()
+
+    def on_enter_coletor(event=None):
+        id_coletor = entry_coletor.get().strip()
+        if not id_coletor:
+            return
+        if exige_responsavel():
+            entry_resp.focus_set()
+            entry_resp.selection_range(0, tk.END)
+        else:
+            adicionar(id_coletor, entry_resp.get().strip())
+
+    def on_enter_resp(event=None):
+        if sugestoes_resp.escolher():
+            return
+        sugestoes_resp.esconder()
+        id_coletor = entry_coletor.get().strip()
+        id_resp = entry_resp.get().strip()
+        if not id_coletor:
+            entry_coletor.focus_set()
+            return
+        if not id_resp and exige_responsavel():
+            return
+        adicionar(id_coletor, id_resp)
+
+    def remover_selecionados():
+        for iid in tree.selection():
+            tree.delete(iid)
+        lbl_total.config(text=f"{len(tree.get_children())} item(ns)")
+
+    def limpar_processados():
+        for iid in tree.get_children():
+            if tree.set(iid, "status") != "pendente":
+                tree.delete(iid)
+        lbl_total.config(text=f"{len(tree.get_children())} item(ns)")
+
+    def processar():
+        iids = [iid for iid in tree.get_children() if tree.set(iid, "status") == "pendente"]
+        if not iids:
+            return
+        itens = [(tree.set(i, "coletor"), tree.set(i, "resp"), tree.set(i, "acao")) for i in iids]
+        btn_processar.config(state="disabled")
+        lbl_total.config(text=f"Processando {len(itens)} item(ns)...")
+
+        def concluido(resultados):
+            btn_processar.config(state="normal")
+            ok_qtd = 0
+            for iid, r in zip(iids, resultados):
+                if not tree.exists(iid):
+                    continue
+                tree.set(iid, "status", "OK" if r.ok else r.mensagem)
+                tree.item(iid, tags=("ok" if r.ok else "erro",))
+                ok_qtd += r.ok
+            lbl_total.config(text=f"{ok_qtd} registrado(s), {len(resultados) - ok_qtd} recusado(s)")
+            if ok_qtd and ao_gravar:
+                ao_gravar()
+
+        def falhou(e):
+            btn_processar.config(state="normal")
+            messagebox.showerror("Erro", f"Falha ao processar lote: {e}", parent=janela)
+
+        executor.gravar(processar_lote, itens, usuario_logado, ao_concluir=concluido, ao_falhar=falhou)
+
+    # Layout
+    frame_acoes = tk.LabelFrame(janela, text="Ação")
+    frame_acoes.pack(fill="x", padx=10, pady=8)
+    for i, ac in enumerate(ACOES):
+        tk.Radiobutton(frame_acoes, text=ac, variable=acao_var, value=ac).grid(row=0, column=i, padx=6)
+
+    frame_dados = tk.Frame(janela)
+    frame_dados.pack(fill="x", padx=10, pady=5)
+    tk.Label(frame_dados, text="Coletor:").grid(row=0, column=0, sticky="e")
+    entry_coletor = tk.Entry(frame_dados, width=25)
+    entry_coletor.grid(row=0, column=1, padx=5)
+    entry_coletor.bind("<Return>", on_enter_coletor)
+    tk.Label(frame_dados, text="Responsável:").grid(row=0, column=2, sticky="e")
+    entry_resp = tk.Entry(frame_dados, width=30)
+    entry_resp.grid(row=0, column=3, padx=5)
+    entry_resp.bind("<Return>", on_enter_resp)
+
+    def escolher_resp(id_usuario):
+        entry_resp.delete(0, tk.END)
+        entry_resp.insert(0, id_usuario)
+        on_enter_resp()
+    sugestoes_resp = _SugestoesUsuario(entry_resp, executor, escolher_resp)
+
+    colunas = ("coletor", "resp", "acao", "status")
+    tree = ttk.Treeview(janela, columns=colunas, show="headings", height=16)
+    for col, titulo, largura in zip(colunas, ("Coletor", "Responsável", "Ação", "Resultado"), (120, 160, 200, 380)):
+        tree.heading(col, text=titulo)
+        tree.column(col, width=largura, anchor="w")
+    tree.tag_configure("ok", foreground="green")
+    tree.tag_configure("erro", foreground="red")
+    tree.pack(fill="both", expand=True, padx=10, pady=5)
+    tree.bind("<Delete>", lambda e: remover_selecionados())
+
+    frame_botoes = tk.Frame(janela)
+    frame_botoes.pack(pady=8)
+    btn_processar = ttk.Button(frame_botoes, text="Processar lote", command=processar)
+    btn_processar.pack(side="left", padx=8)
+    ttk.Button(frame_botoes, text="Remover selecionados", command=remover_selecionados).pack(side="left", padx=8)
+    ttk.Button(frame_botoes, text="Limpar processados", command=limpar_processados).pack(side="left", padx=8)
+    lbl_total = tk.Label(frame_botoes, text="0 item(ns)")
+    lbl_total.pack(side="left", padx=8)
+
+    def ao_destruir(event):
+        if event.widget is janela:
+            executor.encerrar()
+    janela.bind("<Destroy>", ao_destruir, add="+")
+
+    entry_coletor.focus_set()
+
+
+def abrir_ui_relatorio():
+    """
+    Indicadores da frota (analise_frota): abre lendo o retrato em memória;
+    "Atualizar" traz só os movimentos novos antes de recalcular.
+    """
+    janela = tk.Toplevel()
+    janela.title("Relatório da frota")
+    janela.geometry("900x620")
+    executor = ExecutorDB(janela)
+
+    frame_status = tk.LabelFrame(janela, text="Status (coletores do cadastro)")
+    frame_status.pack(fill="x", padx=10, pady=8)
+    lbl_status = {}
+    for i, st in enumerate(dict.fromkeys(STATUS_BY_IDREG.values())):
+        tk.Label(frame_status, text=st, font=("Arial", 10, "bold")).grid(row=0, column=i, padx=18)
+        lbl_status[st] = tk.Label(frame_status, text="-", font=("Arial", 16))
+        lbl_status[st].grid(row=1, column=i)
+
+    lbl_conserto = tk.Label(janela, text="", anchor="w", justify="left")
+    lbl_conserto.pack(fill="x", padx=10)
+    lbl_utilizacao = tk.Label(janela, text="", anchor="w", justify="left")
+    lbl_utilizacao.pack(fill="x", padx=10)
+
+    frame_tabelas = tk.Frame(janela)
+    frame_tabelas.pack(fill="both", expand=True, padx=10, pady=8)
+
+    def tabela(coluna, titulo, colunas):
+        frame = tk.LabelFrame(frame_tabelas, text=titulo)
+        frame.grid(row=0, column=coluna, sticky="nsew", padx=4)
+        frame_tabelas.columnconfigure(coluna, weight=1)
+        tree = ttk.Treeview(frame, columns=[c for c, _ in colunas], show="headings", height=12)
+        for c, largura in colunas:
+            tree.heading(c, text=c)
+            tree.column(c, width=largura, anchor="w")
+        tree.pack(fill="both", expand=True)
+        return tree
+
+    tree_colab = tabela(0, "Tempo em operação por colaborador",
+                        (("Colaborador", 110), ("Horas", 70), ("Entregas", 70)))
+    tree_defeitos = tabela(1, "Defeitos mais frequentes", (("Defeito", 60), ("Descrição", 130), ("Qtd", 60)))
+    tree_coletores = tabela(2, "Coletores com mais defeitos",
+                            (("Coletor", 80), ("Defeitos", 65), ("Movim.", 65), ("Taxa %", 60)))
+
+    frame_botoes = tk.Frame(janela)
+    frame_botoes.pack(pady=6)
+    btn_atualizar = ttk.Button(frame_botoes, text="Atualizar", command=lambda: carregar(True))
+    btn_atualizar.pack(side="left", padx=8)
+    lbl_rodape = tk.Label(frame_botoes, text="Carregando...", fg="gray")
+    lbl_rodape.pack(side="left", padx=8)
+
+    def preencher(tree, linhas):
+        tree.delete(*tree.get_children())
+        for valores in linhas:
+            tree.insert("", tk.END, values=valores)
+
+    def mostrar(r):
+        btn_atualizar.config(state="normal")
+        for st, lbl in lbl_status.items():
+            lbl.config(text=str(r["status"].get(st, 0)))
+        c = r["conserto"]
+        lbl_conserto.config(text=(
+            f"Conserto: {c['concluidos']} concluídos, média {c['media_h'] or 0:.1f} h, "
+            f"mediana {c['mediana_h'] or 0:.1f} h, p90 {c['p90_h'] or 0:.1f} h; "
+            f"{c['em_aberto']} em aberto (média {c['em_aberto_media_h'] or 0:.1f} h)"))
+        u = r["utilizacao"]
+        lbl_utilizacao.config(text=f"Utilização da frota: {u['frota_pct'] or 0:.1f}% do tempo EM OPERACAO")
+        preencher(tree_colab, ((x["colaborador"], x["horas"], x["entregas"]) for x in u["colaboradores"]))
+        d = r["defeitos"]
+        preencher(tree_defeitos, ((x["defeito"], x["descricao"], x["quantidade"]) for x in d["mais_frequentes"]))
+        preencher(tree_coletores, ((x["coletor"], x["defeitos"], x["movimentos"], x["taxa_pct"])
+                                   for x in d["coletores"]))
+        lbl_rodape.config(text=f"{r['movimentos']} movimentos, {d['total']} defeitos; gerado em {r['gerado_em']}")
+
+    def falhou(e):
+        btn_atualizar.config(state="normal")
+        lbl_rodape.config(text=f"Falha ao gerar relatório: {e}")
+
+    def carregar(atualizar=False):
+        btn_atualizar.config(state="disabled")
+        executor.ler("relatorio", relatorio_frota, atualizar, ao_concluir=mostrar, ao_falhar=falhou)
+
+    def ao_destruir(event):
+        if event.widget is janela:
+            executor.encerrar()
+    janela.bind("<Destroy>", ao_destruir, add="+")
+
+    carregar()
+
+
+def abrir_ui_frota():
+    """
+    Consulta da frota (frota_lista): filtros aplicados no servidor e a lista
+    vem em páginas, pedidas conforme a rolagem chega perto de uma das pontas.
+    O Treeview guarda no máximo PAGINAS_NA_TELA páginas: ao carregar uma,
+    a da outra ponta sai; o início (`apos`) de cada página lida fica
+    guardado para voltar a ela rolando para cima.
+    """
+    janela = tk.Toplevel()
+    janela.title("Consultar frota")
+    janela.geometry("900x620")
+    executor = ExecutorDB(janela)
+    # inicios[i] = `apos` da página i; tamanhos[i] = linhas dela
+    # paginas = as que estão no Treeview, em ordem: (i, ids dos itens, próxima)
+    estado = {"filtros": {}, "inicios": [None], "tamanhos": {}, "paginas": [], "total": None,
+              "agendado": None}
+
+    frame_filtros = tk.LabelFrame(janela, text="Filtros")
+    frame_filtros.pack(fill="x", padx=10, pady=8)
+    tk.Label(frame_filtros, text="Status:").grid(row=0, column=0, sticky="e")
+    status_var = tk.StringVar(value="")
+    combo_status = ttk.Combobox(frame_filtros, textvariable=status_var, state="readonly", width=16,
+                                values=[""] + list(dict.fromkeys(STATUS_BY_IDREG.values())))
+    combo_status.grid(row=0, column=1, padx=5)
+    tk.Label(frame_filtros, text="Colaborador:").grid(row=0, column=2, sticky="e")
+    entry_colab = tk.Entry(frame_filtros, width=20)
+    entry_colab.grid(row=0, column=3, padx=5)
+    tk.Label(frame_filtros, text="Nº de série:").grid(row=0, column=4, sticky="e")
+    entry_serie = tk.Entry(frame_filtros, width=20)
+    entry_serie.grid(row=0, column=5, padx=5)
+
+    frame_lista = tk.Frame(janela)
+    frame_lista.pack(fill="both", expand=True, padx=10, pady=5)
+    colunas = ("coletor", "serie", "status", "colaborador", "desde")
+    tree = ttk.Treeview(frame_lista, columns=colunas, show="headings", height=20)
+    for col, titulo, largura in zip(colunas, ("Coletor", "Nº de série", "Status", "Colaborador", "Último movimento"),
+                                    (120, 180, 130, 160, 160)):
+        tree.heading(col, text=titulo)
+        tree.column(col, width=largura, anchor="w")
+    tree.tag_configure("EM CONSERTO", foreground="darkorange")
+    tree.tag_configure("EXTRAVIADO", foreground="red")
+    tree.tag_configure("INATIVO", foreground="gray")
+    barra = ttk.Scrollbar(frame_lista, orient="vertical", command=tree.yview)
+    barra.pack(side="right", fill="y")
+    tree.pack(side="left", fill="both", expand=True)
+
+    lbl_rodape = tk.Label(janela, text="Carregando...", fg="gray")
+    lbl_rodape.pack(pady=6)
+
+    def proxima():
+        """`apos` da página depois da última na tela (None = fim da frota)."""
+        return estado["paginas"][-1][2] if estado["paginas"] else None
+
+    def atualizar_rodape(total=None):
+        if total is not None:
+            estado["total"] = total
+        total = estado["total"]
+        paginas = estado["paginas"]
+        linhas = sum(len(ids) for _, ids, _ in paginas)
+        antes = sum(estado["tamanhos"].get(i, 0) for i in range(paginas[0][0])) if paginas else 0
+        faixa = f"{antes + 1}–{antes + linhas}" if linhas else "0"
+        mais = "" if proxima() is None else " (role para ver mais)"
+        lbl_rodape.config(text=f"{faixa} de {'?' if total is None else total} coletor(es){mais}")
+
+    def mover_topo(antes, linhas_antes, delta):
+        # mantém na tela as mesmas linhas depois de inserir/tirar `delta` linhas acima delas
+        depois = len(tree.get_children())
+        if depois:
+            topo = round(antes * linhas_antes) + delta
+            tree.yview_moveto(max(0, topo) / depois)
+
+    def mostrar_pagina(indice, pagina):
+        paginas = estado["paginas"]
+        if paginas and indice not in (paginas[0][0] - 1, paginas[-1][0] + 1):
+            return  # resposta de antes de outra rolagem: a página não encosta na janela
+        topo, linhas_antes = tree.yview()[0], len(tree.get_children())
+        acima = not paginas or indice < paginas[0][0]
+        posicao = 0 if acima and paginas else tk.END
+        ids = []
+        for c in (reversed(pagina.itens) if posicao == 0 else pagina.itens):
+            desde = f"{c.data_registro:%d/%m/%Y %H:%M}" if c.data_registro else "-"
+            ids.append(tree.insert("", posicao, values=(c.id_coletor, c.num_serie or "", c.status,
+                                                         c.id_colaborador or "", desde), tags=(c.status,)))
+        estado["tamanhos"][indice] = len(ids)
+        if pagina.proxima is not None and len(estado["inicios"]) == indice + 1:
+            estado["inicios"].append(pagina.proxima)
+        delta = 0
+        if acima and paginas:
+            paginas.insert(0, (indice, ids, pagina.proxima))
+            delta += len(ids)
+            if len(paginas) > PAGINAS_NA_TELA:
+                tree.delete(*paginas.pop()[1])
+        else:
+            paginas.append((indice, ids, pagina.proxima))
+            if len(paginas) > PAGINAS_NA_TELA:
+                saiu = paginas.pop(0)[1]
+                tree.delete(*saiu)
+                delta -= len(saiu)
+        if delta:
+            mover_topo(topo, linhas_antes, delta)
+        atualizar_rodape()
+        janela.after_idle(encher_tela)
+
+    def encher_tela():
+        # lista ainda sem barra de rolagem: não haverá rolagem para pedir a próxima página
+        if proxima() is not None and tree.yview()[1] >= 1.0:
+            carregar_pagina(estado["paginas"][-1][0] + 1)
+
+    def falhou(e):
+        lbl_rodape.config(text=f"Falha ao consultar a frota: {e}")
+
+    def carregar_pagina(indice):
+        filtros, apos = estado["filtros"], estado["inicios"][indice]
+        executor.ler("frota", pagina_frota, apos, ao_concluir=lambda p: mostrar_pagina(indice, p),
+                     ao_falhar=falhou, chave_consulta=(tuple(filtros.items()), apos), **filtros)
+
+    def ao_rolar(primeiro, ultimo):
+        barra.set(primeiro, ultimo)
+        paginas = estado["paginas"]
+        if not paginas:
+            return
+        if proxima() is not None and float(ultimo) >= MARGEM_ROLAGEM:
+            carregar_pagina(paginas[-1][0] + 1)
+        elif paginas[0][0] > 0 and float(primeiro) <= 1 - MARGEM_ROLAGEM:
+            carregar_pagina(paginas[0][0] - 1)
+
+    tree.configure(yscrollcommand=ao_rolar)
+
+    def filtrar():
+        estado["agendado"] = None
+        estado["filtros"] = {
+            "status": status_var.get() or None,
+            "colaborador": entry_colab.get().strip() or None,
+            "serie": entry_serie.get().strip() or None,
+        }
+        estado.update(inicios=[None], tamanhos={}, paginas=[], total=None)
+        tree.delete(*tree.get_children())
+        lbl_rodape.config(text="Carregando...")
+        carregar_pagina(0)
+        executor.ler("frota_total", contar_frota, ao_concluir=atualizar_rodape, ao_falhar=falhou,
+                     **estado["filtros"])
+
+    def agendar_filtro(event=None):
+        if estado["agendado"] is not None:
+            janela.after_cancel(estado["agendado"])
+        estado["agendado"] = janela.after(ATRASO_FILTRO_MS, filtrar)
+
+    combo_status.bind("<<ComboboxSelected>>", agendar_filtro)
+    entry_colab.bind("<KeyRelease>", agendar_filtro)
+    entry_serie.bind("<KeyRelease>", agendar_filtro)
+
+    def ao_destruir(event):
+        if event.widget is janela:
+            if estado["agendado"] is not None:
+                janela.after_cancel(estado["agendado"])
+            executor.encerrar()
+    janela.bind("<Destroy>", ao_destruir, add="+")
+
+    filtrar()
+    entry_serie.focus_set()
+
+
 if __name__ == "__main__":
     # Execução direta para testes locais
     root = tk.Tk()